@@ -1,21 +1,30 @@
-import importlib
-from fastapi import FastAPI, File, UploadFile, Response, Body
+from fastapi import FastAPI, File, UploadFile, Response, Body, Query, Request
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.encoders import jsonable_encoder
 from services.network_manager import NetworkManager
 from services.command_parser_manager import CommandParserManager
+from services.session_pool import SessionPool
+from services.parse_pool import ParsePool
+from services.parse_cache import ParseCache
+from services.metrics import Metrics
+from services.snapshot_jobs import SnapshotJob, SnapshotJobManager
+from services.snapshot_store import SnapshotStore
+from services.snapshot_history import SnapshotHistory
+from services.diff_report import iter_html_report, iter_json_report, iter_ndjson_report, paginate
+from services.snapshot_encoding import encode_json
+from services.snapshot_query import InvalidCursor, query_snapshot
 from pymongo import MongoClient
 from pathlib import Path
 import pprint
 from ruamel.yaml import YAML
-from starlette.responses import FileResponse
 from typing import List
+from datetime import datetime
 import os
+import html
 
-import json
 
 # Create an instance of the FastAPI app
 app = FastAPI()
@@ -23,20 +32,119 @@ app = FastAPI()
 # MongoDB connection settings
 MONGO_HOST = "localhost"
 MONGO_PORT = 27017
-
-try:
-    client = MongoClient(MONGO_HOST, MONGO_PORT)
-    db = client["network-manager"]
-    db.command("ping")  # Test the connection
-    print("Successfully connected to MongoDB.")
-except Exception as e:
-    print(f"Failed to connect to MongoDB: {str(e)}")
+SNAPSHOT_RETENTION_DAYS = 30  # Stored snapshots older than this are deleted
+MAX_STORED_SNAPSHOTS = None  # Maximum number of stored snapshots, None for no limit
+HISTORY_BASE_INTERVAL = 24  # Snapshots per full base snapshot in the history
+HISTORY_MAX_ENTRIES = 24 * 7 * 4  # Snapshots kept in the history
+DIFF_PAGE_SIZE = 500  # Changes per page of the diff report
+DIFF_CACHE_SIZE = 16  # Diff results kept in memory
+COMPACT_SNAPSHOTS = True  # Keep the previous and reference snapshots in compact form
+
+# Set up by init when the server starts
+snapshot_store = None
+snapshot_history = None
+snapshot_jobs = None
+
+# Collection settings
+MAX_CONCURRENT_ELEMENTS = 32  # Network elements handled in parallel during a sweep
+CONNECT_TIMEOUT = 20  # Seconds to establish an SSH session
+COMMAND_TIMEOUT = 60  # Seconds to wait for a single command output
+MAX_SESSIONS = 1000  # SSH sessions kept alive between snapshots
+SESSION_IDLE_TIMEOUT = 600  # Seconds before an unused SSH session is closed
+SESSION_KEEPALIVE = 30  # Seconds between SSH keepalive packets
+BATCH_COMMANDS = False  # Send all commands of an element in one channel interaction, only for platforms known to handle it
+MAX_OUTPUT_SIZE = 256 * 1024 * 1024  # Characters kept of a single batched or streamed command output
+STREAM_COMMANDS = ["inspect fib all", "inspect flow brief"]  # Commands parsed line by line while their output is read
+METRICS_HOST_LABELS = True  # Label the timing histograms on /metrics with the host
+PARSE_PROCESSES = None  # Processes parsing command outputs, None for one per CPU, 0 to parse in-process
+PARSE_QUEUE_SIZE = None  # Outputs waiting to be parsed before collection pauses, None for 4 per process
 
 # Mount the static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Create an instance of the NetworkManager class
-network_manager = NetworkManager({})
+network_manager = NetworkManager(
+    {},
+    max_workers=MAX_CONCURRENT_ELEMENTS,
+    connect_timeout=CONNECT_TIMEOUT,
+    command_timeout=COMMAND_TIMEOUT,
+    session_pool=SessionPool(
+        max_sessions=MAX_SESSIONS,
+        idle_timeout=SESSION_IDLE_TIMEOUT,
+        keepalive=SESSION_KEEPALIVE,
+    ),
+    diff_cache_size=DIFF_CACHE_SIZE,
+    compact_snapshots=COMPACT_SNAPSHOTS,
+    # A single CPU gains nothing from parse processes, only the cost of passing outputs around
+    parse_pool=ParsePool(PARSE_PROCESSES, PARSE_QUEUE_SIZE)
+    if PARSE_PROCESSES or (PARSE_PROCESSES is None and (os.cpu_count() or 1) > 1) else None,
+    parse_cache=ParseCache(CommandParserManager.parser_version),
+    batch_commands=BATCH_COMMANDS,
+    max_output_size=MAX_OUTPUT_SIZE,
+    stream_commands=STREAM_COMMANDS,
+    metrics=Metrics(host_labels=METRICS_HOST_LABELS),
+)
+
+
+def restore_snapshots():
+    """Load the newest stored snapshots, so they survive restarts."""
+    for snapshot_id in reversed(snapshot_store.latest_snapshot_ids(2)):
+        metadata = snapshot_store.get_metadata(snapshot_id)
+        network_manager.update_snapshot(
+            snapshot_store.load_snapshot(snapshot_id),
+            snapshot_id=snapshot_id,
+            timestamp=metadata["timestamp"],
+        )
+        print(f"Restored snapshot {snapshot_id}")
+
+
+@app.on_event("startup")
+def init():
+    """
+    Connect to MongoDB, restore the stored snapshots and start the snapshot job runner.
+
+    This runs when the server starts rather than when the module is imported,
+    so processes that merely import it, like spawned parse workers, stay free
+    of connections and loaded snapshots.
+    """
+    global snapshot_store, snapshot_history, snapshot_jobs
+    # Create the commands list if there is none yet
+    get_commands_list()
+    snapshot_history = SnapshotHistory(base_interval=HISTORY_BASE_INTERVAL, max_entries=HISTORY_MAX_ENTRIES)
+    try:
+        client = MongoClient(MONGO_HOST, MONGO_PORT)
+        db = client["network-manager"]
+        db.command("ping")  # Test the connection
+        print("Successfully connected to MongoDB.")
+        snapshot_store = SnapshotStore(db, retention_days=SNAPSHOT_RETENTION_DAYS, max_snapshots=MAX_STORED_SNAPSHOTS)
+        snapshot_history = SnapshotHistory(
+            db["snapshot_history"],
+            base_interval=HISTORY_BASE_INTERVAL,
+            max_entries=HISTORY_MAX_ENTRIES,
+            changes_collection=db["snapshot_history_changes"],
+        )
+        snapshot_history.load()
+    except Exception as e:
+        print(f"Failed to connect to MongoDB: {str(e)}")
+
+    if snapshot_store is not None:
+        try:
+            restore_snapshots()
+        except Exception as e:
+            print(f"Failed to restore snapshots from MongoDB: {str(e)}")
+
+    # Snapshot sweeps run one at a time on a background thread
+    snapshot_jobs = SnapshotJobManager(run_snapshot_job)
+
+
+@app.on_event("shutdown")
+def close_sessions():
+    """Close the pooled SSH sessions and the parse processes when the application stops."""
+    if snapshot_jobs is not None:
+        snapshot_jobs.shutdown()
+    network_manager.close_sessions()
+    if network_manager.parse_pool is not None:
+        network_manager.parse_pool.close()
 
 # Define the commands to execute on each element
 def write_commands_to_file(commands):
@@ -56,50 +164,81 @@ def get_commands_list():
         write_commands_to_file(commands)
     return commands
 
-# Retrieve the initial commands list
-commands = get_commands_list()
-
-def execute_commands_on_network(network_manager):
+def execute_commands_on_network(network_manager, progress_callback=None):
     """
     Execute commands on each network element and parse the output.
 
     Args:
         network_manager (NetworkManager): Instance of NetworkManager.
+        progress_callback (callable, optional): Receives per-host progress of the sweep.
 
     Returns:
         bool: True if commands executed successfully, False otherwise.
     """
     execution_status = {}
-    parsed_data = {}
     # load the elements from yaml
     file = "data/network_elements.yaml"
     file_path = Path(__file__).resolve().parent / file
     network_manager.load_elements(file_path)
-    # Connect to network elements
-    connection_status = network_manager.connect_elements()
     commands = get_commands_list()
     try:
-        for hostname,status in network_manager.connections.items():
-            if status:
-                print(f"\nExecuting commands on {hostname}:")
-                command_results = network_manager.execute_commands(hostname, commands)
-                for command, result in zip(commands, command_results):
-                    parsed_data.setdefault(hostname, {})[command] = CommandParserManager.parse_output(command, result)
-            else:
-                print(f"\nSkipping commands on {hostname}. Failed to connect.")
-            
-            # parsed_data[hostname] = parsed_data
+        # Connect to the network elements and execute the commands concurrently
+        parsed_data = network_manager.collect(
+            commands, CommandParserManager.parse_output, progress_callback, CommandParserManager.parse_lines
+        )
+        network_manager.update_snapshot(parsed_data, network_manager.collected_hashes)
+        timings = network_manager.metrics.sweep_summary()
         # Store parsed data in MongoDB
-        network_manager.previous_snapshot = network_manager.current_snapshot
-        network_manager.current_snapshot = parsed_data
+        if snapshot_store is not None:
+            try:
+                snapshot_store.save_snapshot(
+                    network_manager.current_snapshot_id,
+                    network_manager.current_snapshot_time,
+                    parsed_data,
+                    network_manager.current_snapshot_hashes,
+                    metadata={"timings": timings},
+                )
+            except Exception as e:
+                print(f"Failed to store snapshot in MongoDB: {str(e)}")
+        try:
+            snapshot_history.append(
+                network_manager.current_snapshot_id,
+                network_manager.current_snapshot_time,
+                parsed_data,
+                network_manager.current_snapshot_hashes,
+            )
+        except Exception as e:
+            print(f"Failed to add snapshot to the history: {str(e)}")
         pprint.pprint(parsed_data)        
-        network_manager.disconnect_elements()
         execution_status["status"] = True
+        execution_status["timings"] = timings
     except Exception as e:
         execution_status["status"] = False
         execution_status["error"] = str(e)
+    finally:
+        # Release the sessions also when the sweep failed
+        network_manager.disconnect_elements()
+    return execution_status
+
+
+def run_snapshot_job(job):
+    """
+    Take a snapshot on behalf of a background job.
+
+    Args:
+        job (SnapshotJob): The job to report progress and results to.
+
+    Returns:
+        dict: The execution status of the sweep.
+    """
+    execution_status = execute_commands_on_network(network_manager, job.update_host)
+    if execution_status["status"]:
+        # Served as the bytes already encoded for /get-current-snapshot
+        job.result = network_manager.snapshot_view()["encoded"]
+        job.timings = execution_status["timings"]
     return execution_status
 
+
 # Generate custom OpenAPI schema
 def custom_openapi():
     if app.openapi_schema:
@@ -156,63 +295,339 @@ async def upload_file(file: UploadFile = File(...)):
 # Service endpoint to execute commands (renamed to take-snapshot)
 @app.post("/take-snapshot")
 async def take_snapshot():
-    """Endpoint to execute commands on network elements."""
+    """Endpoint to queue a snapshot job that executes commands on network elements."""
     try:
-        execute_commands_on_network(network_manager)
-        return {"message": "Snapshot taken successfully"}
+        job = snapshot_jobs.submit()
+        return {"message": "Snapshot job queued", "job_id": job.job_id, "status": job.status}
     except Exception as e:
         return {"message": "Failed to take snapshot", "error": str(e)}
 
 
+@app.get("/snapshot-jobs")
+async def list_snapshot_jobs():
+    """Endpoint to list the queued, running and finished snapshot jobs."""
+    return {"jobs": [job.to_dict() for job in snapshot_jobs.list()]}
+
+
+@app.get("/snapshot-jobs/{job_id}")
+async def get_snapshot_job(job_id: str):
+    """Endpoint to poll the status and per-host progress of a snapshot job."""
+    job = snapshot_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"message": f"Snapshot job '{job_id}' not found"})
+    return job.to_dict()
+
+
+@app.get("/snapshot-jobs/{job_id}/result")
+def get_snapshot_job_result(request: Request, job_id: str):
+    """Endpoint to retrieve the snapshot taken by a finished snapshot job."""
+    job = snapshot_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"message": f"Snapshot job '{job_id}' not found"})
+    if job.result is None:
+        if job.status == SnapshotJob.COMPLETED:
+            return {"message": "Snapshot superseded by a newer snapshot job", "status": job.status}
+        return {"message": f"Snapshot job is {job.status}", "status": job.status, "error": job.error}
+    return encoded_snapshot_response(request, job.result)
+
+
+def encoded_snapshot_response(request, encoded):
+    """
+    Serve a pre-encoded snapshot, compressed when the client accepts it.
+
+    Args:
+        request (Request): The incoming request.
+        encoded (EncodedSnapshot): The serialized snapshot.
+
+    Returns:
+        Response: The snapshot, or 304 Not Modified if the client has it already.
+    """
+    headers = {"ETag": encoded.etag, "Vary": "Accept-Encoding"}
+    if encoded.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    with network_manager.metrics.timer("response_encoding"):
+        coding, body = encoded.encoded(request.headers.get("accept-encoding"))
+    if coding != "identity":
+        headers["Content-Encoding"] = coding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def snapshot_slice_response(snapshot, snapshot_id, host, command, field, limit, cursor):
+    """
+    Serve the requested slice of a snapshot.
+
+    Only the selected hosts, commands and fields are serialized.
+
+    Returns:
+        Response: The ``data`` of the slice with the ``next_cursor`` of the following page.
+    """
+    try:
+        result = query_snapshot(snapshot, snapshot_id, host, command, field, limit, cursor)
+    except InvalidCursor as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+    result["snapshot_id"] = snapshot_id
+    return Response(content=encode_json(result), media_type="application/json")
+
 # Service endpoint to retrieve parsed data (renamed to get-current-snapshot)
 @app.get("/get-current-snapshot")
-async def get_current_snapshot():
-    """Endpoint to retrieve parsed data from MongoDB."""
+def get_current_snapshot(
+    request: Request,
+    host: List[str] = Query(None),
+    command: List[str] = Query(None),
+    field: List[str] = Query(None),
+    limit: int = Query(None, ge=1),
+    cursor: str = None,
+):
+    """
+    Endpoint to retrieve the current snapshot.
+
+    Without parameters the whole snapshot is returned. With host, command,
+    field (JSON-path-style, e.g. ``$.State``), limit or cursor, only that slice
+    of the snapshot is returned, paginated per record. Compressing and slicing
+    the snapshot is CPU work, so the endpoint runs in the threadpool.
+    """
     try:
-        response_data = jsonable_encoder(network_manager.current_snapshot)
-        if response_data:
-            return JSONResponse(content=response_data, media_type="application/json")
-        else:
+        view = network_manager.snapshot_view()
+        if not view["snapshot"]:
             return {"message": "Parsed data not found"}
+        if host or command or field or limit or cursor:
+            return snapshot_slice_response(view["snapshot"], view["snapshot_id"],
+                                           host, command, field, limit, cursor)
+        else:
+            return encoded_snapshot_response(request, view["encoded"])
     except Exception as e:
         return {"message": "Failed to retrieve parsed data", "error": str(e)}
 
 @app.get("/get-previous-snapshot")
-async def get_previous_snapshot():
-    """Endpoint to retrieve the previous snapshot."""
+def get_previous_snapshot(
+    request: Request,
+    host: List[str] = Query(None),
+    command: List[str] = Query(None),
+    field: List[str] = Query(None),
+    limit: int = Query(None, ge=1),
+    cursor: str = None,
+):
+    """Endpoint to retrieve the previous snapshot, or a slice of it as with /get-current-snapshot."""
     try:
-        response_data = jsonable_encoder(network_manager.previous_snapshot)
-        if response_data:
-            return JSONResponse(content=response_data, media_type="application/json")
-        else:
+        view = network_manager.snapshot_view(previous=True)
+        if not view["snapshot"]:
             return {"message": "Previous snapshot not found"}
+        if host or command or field or limit or cursor:
+            return snapshot_slice_response(view["snapshot"], view["snapshot_id"],
+                                           host, command, field, limit, cursor)
+        else:
+            return encoded_snapshot_response(request, view["encoded"])
     except Exception as e:
         return {"message": "Failed to retrieve the previous snapshot", "error": str(e)}
 
 
+def prefix_query_response(query, prefix, limit=None):
+    """
+    Run a prefix index query and return the matching FIB paths.
+
+    Args:
+        query (str): Name of the PrefixIndex query method, e.g. 'longest_match'.
+        prefix (str): The address or prefix to look up.
+        limit (int, optional): Maximum number of prefixes, for covered prefix queries.
+    """
+    view = network_manager.snapshot_view()
+    query = getattr(view["prefix_index"], query)
+    try:
+        matches = query(prefix, limit) if limit is not None else query(prefix)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+    return {"query": prefix, "matches": network_manager.prefix_paths(matches, view["snapshot"])}
+
+@app.get("/prefixes/lookup")
+def lookup_prefix(address: str):
+    """Endpoint to find, per host, the FIB paths of the longest prefix matching an address."""
+    return prefix_query_response("longest_match", address)
+
+@app.get("/prefixes/covering")
+def covering_prefixes(prefix: str):
+    """Endpoint to list the FIB prefixes that contain a prefix, shortest first."""
+    return prefix_query_response("covering", prefix)
+
+@app.get("/prefixes/covered")
+def covered_prefixes(prefix: str, limit: int = Query(1000, ge=1)):
+    """Endpoint to list the FIB prefixes inside a prefix, in address order."""
+    return prefix_query_response("covered", prefix, limit)
+
+@app.get("/prefixes/paths")
+def prefix_paths(prefix: str):
+    """Endpoint to list the FIB paths that carry exactly a prefix, across all hosts."""
+    return prefix_query_response("paths", prefix)
+
+
+@app.get("/flows")
+def query_flows(
+    host: List[str] = Query(None),
+    src: List[str] = Query(None),
+    dst: List[str] = Query(None),
+    sport: List[str] = Query(None),
+    dport: List[str] = Query(None),
+    protocol: List[str] = Query(None),
+    src_subnet: str = None,
+    dst_subnet: str = None,
+    filter: List[str] = Query(None, description="Other column filters, as COLUMN=value"),
+    group_by: str = None,
+    top: int = Query(10, ge=1),
+    limit: int = Query(100, ge=0),
+):
+    """
+    Endpoint to query the flows of the current snapshot.
+
+    Filters on different columns are combined, repeated values of one column
+    are alternatives. Returns the number of matching flows, up to limit flows
+    and, with group_by (a column name or 'host'), the top values of that column.
+    """
+    index = network_manager.snapshot_view()["flow_index"]
+    filters = {}
+    for column, values in (("SRC", src), ("DST", dst), ("SPORT", sport), ("DPORT", dport), ("PROTOCOL", protocol)):
+        if values:
+            filters[column] = values
+    for item in filter or []:
+        column, separator, value = item.partition("=")
+        if not separator:
+            return JSONResponse(status_code=400, content={"message": f"Invalid filter '{item}', expected COLUMN=value"})
+        filters.setdefault(column.strip(), []).append(value.strip())
+    subnets = {column: subnet for column, subnet in (("SRC", src_subnet), ("DST", dst_subnet)) if subnet}
+
+    try:
+        numbers = index.query(host, filters, subnets)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+    result = {
+        "count": len(index) if numbers is None else len(numbers),
+        "flows": index.records(numbers, limit),
+    }
+    if group_by:
+        result["top"] = [{"value": value, "count": count} for value, count in index.top(group_by, numbers, top)]
+    return result
+
+
+@app.get("/snapshots")
+def list_snapshots(limit: int = 50):
+    """Endpoint to list the snapshots stored in MongoDB, newest first."""
+    if snapshot_store is None:
+        return {"message": "Snapshot store not available"}
+    return {"snapshots": jsonable_encoder(snapshot_store.list_snapshots(limit))}
+
+
+@app.get("/snapshots/{snapshot_id}")
+def get_stored_snapshot(
+    snapshot_id: str,
+    host: List[str] = Query(None),
+    command: List[str] = Query(None),
+    field: List[str] = Query(None),
+    limit: int = Query(None, ge=1),
+    cursor: str = None,
+):
+    """Endpoint to retrieve a stored snapshot, optionally limited to some hosts, commands and fields."""
+    if snapshot_store is None:
+        return {"message": "Snapshot store not available"}
+    if snapshot_store.get_metadata(snapshot_id) is None:
+        return JSONResponse(status_code=404, content={"message": f"Snapshot '{snapshot_id}' not found"})
+    snapshot = snapshot_store.load_snapshot(snapshot_id, host, command)
+    if field or limit or cursor:
+        return snapshot_slice_response(snapshot, snapshot_id, host, command, field, limit, cursor)
+    return JSONResponse(content=jsonable_encoder(snapshot), media_type="application/json")
+
+
+@app.get("/history")
+async def get_history():
+    """Endpoint to list the snapshots kept in the snapshot history."""
+    return {"history": jsonable_encoder(snapshot_history.entries())}
+
+
+@app.get("/history/snapshot")
+def get_history_snapshot(snapshot_id: str = None, timestamp: datetime = None):
+    """
+    Endpoint to rebuild a snapshot from the history, by ID or as it was at a point in time.
+    """
+    snapshot = snapshot_history.reconstruct(snapshot_id, timestamp)
+    if snapshot is None:
+        return JSONResponse(status_code=404, content={"message": "Snapshot not found in the history"})
+    return JSONResponse(content=jsonable_encoder(snapshot), media_type="application/json")
+
+
+@app.get("/history/record-changes")
+def get_record_changes(host: str, command: str, key: str):
+    """Endpoint to find when a record, e.g. an interface or a FIB path, changed."""
+    return {"changes": jsonable_encoder(snapshot_history.record_changes(host, command, key))}
+
+
+@app.get("/history/item-changes")
+def get_item_changes(item: str, host: str = None):
+    """Endpoint to find when a list item, e.g. a prefix, was added or removed."""
+    return {"changes": jsonable_encoder(snapshot_history.item_changes(item, host))}
+
+
 @app.post("/save-reference-snapshot")
-async def save_reference_snapshot():
+def save_reference_snapshot():
     """Endpoint to save the current snapshot as a reference snapshot."""
     try:
-        network_manager.reference_snapshot = network_manager.current_snapshot
-        file_path = Path(__file__).resolve().parent / "static/reference_snapshot.json"
-        with open(file_path, "w") as f:
-            json.dump(network_manager.reference_snapshot, f, indent=4)
+        if not network_manager.save_reference_snapshot():
+            return {"message": "Reference snapshot unchanged"}
         return {"message": "Reference snapshot saved successfully"}
     except Exception as e:
         return {"message": "Failed to save reference snapshot", "error": str(e)}
 
 
+@app.get("/reference-snapshot")
+def export_reference_snapshot():
+    """Endpoint to export the reference snapshot as JSON."""
+    if not network_manager.load_reference_snapshot():
+        return JSONResponse(status_code=404, content={"message": "Reference snapshot not found"})
+    return StreamingResponse(network_manager.reference_file.iter_json(), media_type="application/json")
+
+
 @app.get("/compare-snapshots")
-async def compare_with_snapshots(use_reference: bool = False):
+def compare_with_snapshots(
+    request: Request,
+    use_reference: bool = False,
+    host: List[str] = Query(None),
+    command: List[str] = Query(None),
+    page: int = 1,
+    page_size: int = DIFF_PAGE_SIZE,
+):
     """
-    Endpoint to compare snapshots and provide link to HTML file.
+    Endpoint to compare snapshots and stream the differences as an HTML report.
     By default, compares with the previous snapshot. If use_reference=True, compares with the reference snapshot.
+    The report can be limited to some hosts and commands, and is split into pages of page_size changes.
     """
-
-    network_manager.compare_snapshots(use_reference = use_reference)
-    file_path = Path(__file__).resolve().parent / "static/diff.html"
-    return FileResponse(file_path, media_type="text/html")
+    changes = network_manager.snapshot_changes(use_reference, host, command)
+    page_changes, pages = paginate(changes, page, page_size)
+    links = [f"Page {page} of {pages} ({len(changes)} changes)"]
+    if page > 1:
+        links.insert(0, f'<a href="{html.escape(str(request.url.include_query_params(page=page - 1)))}">Previous</a>')
+    if page < pages:
+        links.append(f'<a href="{html.escape(str(request.url.include_query_params(page=page + 1)))}">Next</a>')
+    navigation = f'<p class="change-navigation">{" | ".join(links)}</p>'
+    title = "Differences between Current and {} Snapshots".format("Reference" if use_reference else "Previous")
+    return StreamingResponse(iter_html_report(page_changes, title, navigation), media_type="text/html")
+
+
+@app.get("/compare-snapshots/changes")
+def get_snapshot_changes(
+    use_reference: bool = False,
+    host: List[str] = Query(None),
+    command: List[str] = Query(None),
+    page: int = 1,
+    page_size: int = DIFF_PAGE_SIZE,
+    format: str = "json",
+):
+    """
+    Endpoint to compare snapshots and stream the differences as JSON or NDJSON (format=ndjson).
+    Takes the same filters and pagination as /compare-snapshots.
+    """
+    changes = network_manager.snapshot_changes(use_reference, host, command)
+    page_changes, pages = paginate(changes, page, page_size)
+    headers = {"X-Total-Count": str(len(changes)), "X-Page": str(page), "X-Pages": str(pages)}
+    if format == "ndjson":
+        return StreamingResponse(iter_ndjson_report(page_changes), media_type="application/x-ndjson", headers=headers)
+    return StreamingResponse(
+        iter_json_report(page_changes, page, pages, len(changes)), media_type="application/json", headers=headers
+    )
 
 # Service endpoint to convert JSON input to YAML and save it
 @app.post("/convert-json-to-yaml")
@@ -226,27 +641,25 @@ async def convert_json_to_yaml(data: dict = Body(...)):
     except Exception as e:
         return {"message": "Failed to convert JSON to YAML", "error": str(e)}
 
-import sys
-import importlib.util
-from services.command_parser_manager import CommandParserManager
-
 @app.post("/update-parser")
 async def update_parser(command_name: str, parser_file: UploadFile = File(...)):
     """
     Endpoint to update the parser file.
-    """
-    # Format the command name to replace spaces with underscores
-    command_func_name = command_name.replace(" ", "_")
-
-    # Save the parser file with the formatted command name
-    parser_file_path = Path(__file__).resolve().parent / "services" / "command_parsers" / f"{command_func_name}.py"
 
-    # Save the new parser file
-    with open(parser_file_path, "wb") as f:
-        f.write(await parser_file.read())
-
-    # Restart the server
-    os.execv(sys.executable, [sys.executable] + sys.argv)
+    The new parser is hot-swapped into the parser registry, so no restart is
+    needed and snapshots and SSH sessions are kept. The parse processes are
+    replaced, so they pick up the new parser, and cached results of the old
+    parser are dropped.
+    """
+    try:
+        CommandParserManager.install_parser(command_name, await parser_file.read())
+        if network_manager.parse_pool is not None:
+            network_manager.parse_pool.restart()
+        # Outputs parsed by the old parser are parsed again on the next sweep
+        network_manager.parse_cache.invalidate(command_name)
+        return {"message": f"Parser for '{command_name}' updated successfully"}
+    except Exception as e:
+        return {"message": "Failed to update parser", "error": str(e)}
 
 @app.get("/commands")
 def get_commands():
@@ -272,6 +685,13 @@ async def reset_commands():
     write_commands_to_file(commands)
     return {"message": "Commands list reset successfully"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Endpoint to expose the stage timings and output sizes in the Prometheus text format.
+    """
+    return Response(content=network_manager.metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,227 @@
+from collections import deque
+import random
+import threading
+import time
+
+from netmiko.exceptions import NetmikoTimeoutException, ReadTimeout
+
+from benchmarks.generators import GENERATORS, SCALES
+
+# Behaviour of a simulated device, every key can be overridden per device
+DEFAULT_PROFILE = {
+    "connect_latency": 0.2,  # Seconds to establish a session
+    "command_latency": 0.05,  # Seconds until the output of a command starts
+    "jitter": 0.2,  # Random share added to every latency
+    "throughput": 10 * 1024 * 1024,  # Characters of output sent per second
+    "chunk_size": 65536,  # Characters returned by one channel read at most
+    "scale": "small",  # Scale of the generated outputs, see benchmarks.generators.SCALES
+    "connect_failure_rate": 0.0,  # Share of connection attempts that fail
+    "command_failure_rate": 0.0,  # Share of commands that break the session
+    "hang_rate": 0.0,  # Share of commands that never return
+    "outputs": None,  # Canned outputs keyed by command, generated outputs are used for the others
+}
+
+
+class DeviceFleet:
+    """
+    A fleet of simulated network elements.
+
+    ``connect`` is a stand-in for netmiko's ConnectHandler, so the fleet is
+    plugged into the collection pipeline through the session pool:
+    ``SessionPool(connect_handler=fleet.connect)``. Devices are looked up
+    by the ``ip`` connection parameter; unknown addresses get the default
+    profile. Generated outputs are shared by all devices of the same scale.
+    """
+
+    def __init__(self, profile=None, seed=0):
+        """
+        Initialize the DeviceFleet.
+
+        Args:
+            profile (dict, optional): Overrides of DEFAULT_PROFILE for all devices.
+            seed (int): Seed of the random latencies and failures.
+        """
+        self.profile = dict(DEFAULT_PROFILE, **(profile or {}))
+        self.devices = {}
+        self.sessions = 0
+        self._outputs = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def add_device(self, host, **profile):
+        """
+        Add a device to the fleet.
+
+        Args:
+            host (str): The address the device is connected by.
+            **profile: Overrides of the fleet profile for this device.
+        """
+        self.devices[host] = dict(self.profile, **profile)
+
+    def elements(self, username="admin", password="admin", device_type="cisco_ios"):
+        """
+        Return the network elements of the fleet, in the format of the elements YAML file.
+
+        Returns:
+            dict: Element details keyed by element name.
+        """
+        return {
+            f"sim-{index}": {
+                "name": f"sim-{index}",
+                "host": host,
+                "login_type": "ssh",
+                "device_type": device_type,
+                "username": username,
+                "password": password,
+            }
+            for index, host in enumerate(self.devices)
+        }
+
+    def connect(self, **params):
+        """
+        Open a session to a simulated device, like ConnectHandler(**params).
+
+        Raises:
+            NetmikoTimeoutException: If the connection attempt fails.
+        """
+        host = params.get("ip") or params.get("host")
+        profile = self.devices.get(host, self.profile)
+        time.sleep(self.latency(profile, profile["connect_latency"]))
+        if self.chance(profile["connect_failure_rate"]):
+            raise NetmikoTimeoutException(f"TCP connection to device failed: {host}")
+        with self._lock:
+            self.sessions += 1
+        return SimulatedDevice(self, host, profile)
+
+    def output(self, profile, command):
+        """Return the output of a command on a device with the given profile."""
+        canned = profile["outputs"] or {}
+        if command in canned:
+            return canned[command]
+        generator = GENERATORS.get(command)
+        if generator is None:
+            return f"% Invalid input detected: '{command}'"
+        key = (command, profile["scale"])
+        output = self._outputs.get(key)
+        if output is None:
+            with self._lock:
+                output = self._outputs.get(key)
+                if output is None:
+                    output = self._outputs[key] = generator(SCALES[profile["scale"]][command])
+        return output
+
+    def latency(self, profile, seconds):
+        """Return a latency with the random jitter of a profile applied."""
+        with self._lock:
+            return seconds * (1 + profile["jitter"] * self._rng.random())
+
+    def chance(self, rate):
+        """Return True with the given probability."""
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < rate
+
+
+class SimulatedDevice:
+    """
+    A session to a simulated device, with the parts of the netmiko connection API the collector uses.
+
+    Outputs become readable after the command latency of the device and are
+    then sent at its throughput, so a large output takes a while to arrive.
+    A hanging command sends its echo and nothing after it, like a device
+    that stopped responding.
+    """
+
+    RETURN = "\n"
+
+    def __init__(self, fleet, host, profile):
+        self.fleet = fleet
+        self.host = host
+        self.profile = profile
+        self.prompt = f"{host}#"
+        self.alive = True
+        # Pending channel output: [text, time it becomes readable, characters per second]
+        self._pending = deque()
+        self._ready_at = time.monotonic()
+
+    def find_prompt(self):
+        self._check_alive()
+        return self.prompt
+
+    def is_alive(self):
+        return self.alive
+
+    def disconnect(self):
+        self.alive = False
+        self._pending.clear()
+
+    def send_command(self, command, read_timeout=10, **kwargs):
+        """
+        Execute a command and return its output, like netmiko's send_command.
+
+        Raises:
+            ReadTimeout: If the command hangs.
+            OSError: If the session broke.
+        """
+        self._check_alive()
+        output, hang = self._run(command)
+        if hang:
+            time.sleep(read_timeout)
+            raise ReadTimeout(f"Pattern not detected: '{self.prompt}' in output of '{command}'")
+        time.sleep(self.fleet.latency(self.profile, self.profile["command_latency"]))
+        time.sleep(len(output) / self.profile["throughput"])
+        return output
+
+    def write_channel(self, data):
+        """Queue commands written to the channel; their echo and output follow on read_channel."""
+        self._check_alive()
+        for command in data.split(self.RETURN):
+            if not command.strip():
+                continue
+            output, hang = self._run(command)
+            self._queue(command + "\n", 0)
+            if hang:
+                # Nothing after this command will ever be sent
+                self._ready_at = float("inf")
+                return
+            latency = self.fleet.latency(self.profile, self.profile["command_latency"])
+            self._queue(output + "\n" + self.prompt, latency)
+
+    def read_channel(self):
+        """Return the channel output that arrived so far, without waiting."""
+        self._check_alive()
+        chunks = []
+        budget = self.profile["chunk_size"]
+        now = time.monotonic()
+        while self._pending and budget > 0:
+            entry = self._pending[0]
+            text, ready_at, rate = entry
+            if now < ready_at:
+                break
+            available = min(budget, len(text), int((now - ready_at) * rate) + 1)
+            chunks.append(text[:available])
+            budget -= available
+            if available == len(text):
+                self._pending.popleft()
+            else:
+                entry[0] = text[available:]
+                entry[1] = ready_at + available / rate
+        return "".join(chunks)
+
+    def _run(self, command):
+        """Return the output of a command and whether it hangs; breaks the session on a simulated failure."""
+        command = command.strip()
+        if self.fleet.chance(self.profile["command_failure_rate"]):
+            self.disconnect()
+            raise OSError(f"Socket is closed: session to {self.host} dropped during '{command}'")
+        return self.fleet.output(self.profile, command), self.fleet.chance(self.profile["hang_rate"])
+
+    def _queue(self, text, latency):
+        self._ready_at = max(self._ready_at, time.monotonic()) + latency
+        self._pending.append([text, self._ready_at, self.profile["throughput"]])
+        self._ready_at += len(text) / self.profile["throughput"]
+
+    def _check_alive(self):
+        if not self.alive:
+            raise OSError("Socket is closed")
@@ -0,0 +1,244 @@
+import random
+
+# Number of items generated per command at each scale: interfaces, FIB prefixes, flows or VPNs
+SCALES = {
+    "small": {
+        "dump overview": 100,
+        "dump interface config all": 100,
+        "dump interface status all": 100,
+        "dump vpn summary": 50,
+        "inspect fib all": 10000,
+        "inspect flow brief": 2000,
+    },
+    "medium": {
+        "dump overview": 1000,
+        "dump interface config all": 1000,
+        "dump interface status all": 1000,
+        "dump vpn summary": 500,
+        "inspect fib all": 100000,
+        "inspect flow brief": 20000,
+    },
+    "large": {
+        "dump overview": 10000,
+        "dump interface config all": 10000,
+        "dump interface status all": 10000,
+        "dump vpn summary": 5000,
+        "inspect fib all": 1000000,
+        "inspect flow brief": 200000,
+    },
+}
+
+# Prefixes listed per FIB path
+PREFIXES_PER_PATH = 50
+
+FLOW_HEADER = (
+    "SRC              DST              SPORT  DPORT  PROTOCOL  PACKETS     BYTES         "
+    "INGRESS     EGRESS      AGE"
+)
+FLOW_WIDTHS = (17, 17, 7, 7, 10, 12, 14, 12, 12, 0)
+
+
+def interface_name(index):
+    """Return the name of the interface with the given index, e.g. 'ge-1/2/3'."""
+    return f"ge-{index // 2304}/{index // 48 % 48}/{index % 48}"
+
+
+def ipv4_address(index, base=10):
+    """Return the IPv4 address with the given index below base.0.0.0/8."""
+    return f"{base}.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+
+
+def generate_dump_overview(count, seed=0):
+    """
+    Generate the output of 'dump overview' for a device with count interfaces.
+
+    Args:
+        count (int): Number of operational interfaces.
+        seed (int): Seed of the random values.
+
+    Returns:
+        str: The output.
+    """
+    rng = random.Random(seed)
+    lines = [
+        "Hostname: edge-router-01",
+        "Model: NX-9000",
+        "Serial Number: SN%08d" % rng.randrange(10 ** 8),
+        "Software Version: 5.%d.%d" % (rng.randrange(10), rng.randrange(100)),
+        "Uptime: %d days, %d hours" % (rng.randrange(1000), rng.randrange(24)),
+        "CPU Usage: %d%%" % rng.randrange(100),
+        "Memory Usage: %d%%" % rng.randrange(100),
+        "operational interfaces",
+    ]
+    for index in range(count):
+        lines.append(f"{interface_name(index)}  up  {rng.choice((1000, 10000, 100000))}Mbps")
+    return "\n".join(lines)
+
+
+def generate_dump_interface_config_all(count, seed=0):
+    """
+    Generate the output of 'dump interface config all' for count interfaces.
+
+    Args:
+        count (int): Number of interfaces.
+        seed (int): Seed of the random values.
+
+    Returns:
+        str: The output.
+    """
+    rng = random.Random(seed)
+    blocks = []
+    for index in range(count):
+        blocks.append("\n".join((
+            f"Interface: {interface_name(index)}",
+            f"Description: link-{rng.randrange(10 ** 6)}",
+            f"IP Address: {ipv4_address(index * 4 + 1, 172)}/30",
+            f"MTU: {rng.choice((1500, 9000, 9216))}",
+            f"Speed: {rng.choice((1000, 10000, 100000))}",
+            f"VLAN: {rng.randrange(1, 4095)}",
+            f"Admin State: {rng.choice(('up', 'down'))}",
+        )))
+    return "\n\n".join(blocks)
+
+
+def generate_dump_interface_status_all(count, seed=0):
+    """
+    Generate the output of 'dump interface status all' for count interfaces.
+
+    Args:
+        count (int): Number of interfaces.
+        seed (int): Seed of the random values.
+
+    Returns:
+        str: The output.
+    """
+    rng = random.Random(seed)
+    blocks = []
+    for index in range(count):
+        blocks.append("\n".join((
+            f"Interface : {interface_name(index)}",
+            f"ID : {index + 1}",
+            f"Oper Status : {rng.choice(('up', 'down'))}",
+            f"Input Packets : {rng.randrange(10 ** 12)}",
+            f"Output Packets : {rng.randrange(10 ** 12)}",
+            f"Input Errors : {rng.randrange(1000)}",
+            f"Output Errors : {rng.randrange(1000)}",
+        )))
+    return "\n".join(blocks) + "\n"
+
+
+def generate_dump_vpn_summary(count, seed=0):
+    """
+    Generate the output of 'dump vpn summary' for count VPNs.
+
+    Args:
+        count (int): Number of VPNs.
+        seed (int): Seed of the random values.
+
+    Returns:
+        str: The output.
+    """
+    rng = random.Random(seed)
+    lines = ["VepID    Name           Type    Sites   Paths   Status"]
+    for index in range(count):
+        lines.append("%-8d %-14s %-7s %-7d %-7d %s" % (
+            index + 1, f"vpn-{index + 1}", rng.choice(("l3", "l2", "evpn")),
+            rng.randrange(1, 200), rng.randrange(1, 2000), rng.choice(("up", "down")),
+        ))
+    return "\n".join(lines)
+
+
+def generate_inspect_fib_all(count, seed=0):
+    """
+    Generate the output of 'inspect fib all' with count prefixes.
+
+    Prefixes are spread over paths of PREFIXES_PER_PATH prefixes each; every
+    tenth prefix is an IPv6 prefix.
+
+    Args:
+        count (int): Number of prefixes.
+        seed (int): Seed of the random values.
+
+    Returns:
+        str: The output.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for prefix_index in range(count):
+        if prefix_index % PREFIXES_PER_PATH == 0:
+            path_id = prefix_index // PREFIXES_PER_PATH
+            site = rng.randrange(1000)
+            lines.append(
+                f"Path ID: {path_id}, Path Type: {rng.choice(('local', 'remote', 'ecmp'))}, "
+                f"Vpn Type: {rng.choice(('l3', 'evpn'))}, Site ID: {site}, Site Name: site-{site}, "
+                f"Status: {rng.choice(('true', 'false'))}, Path Info: nh {ipv4_address(path_id, 100)}"
+            )
+        if prefix_index % 10 == 9:
+            lines.append(f"V6 Prefix: 2001:db8:{prefix_index >> 16 & 0xffff:x}:{prefix_index & 0xffff:x}::/64")
+        else:
+            lines.append(f"Prefix: {ipv4_address(prefix_index)}/32")
+    return "\n".join(lines)
+
+
+def generate_inspect_flow_brief(count, seed=0):
+    """
+    Generate the output of 'inspect flow brief' with count flows.
+
+    Args:
+        count (int): Number of flows.
+        seed (int): Seed of the random values.
+
+    Returns:
+        str: The output.
+    """
+    rng = random.Random(seed)
+    lines = [FLOW_HEADER]
+    for index in range(count):
+        values = (
+            ipv4_address(index), ipv4_address(rng.randrange(4096), 192),
+            str(1024 + index % 60000), str(rng.choice((22, 53, 80, 443, 8080))),
+            rng.choice(("tcp", "udp")), str(rng.randrange(10 ** 6)), str(rng.randrange(10 ** 9)),
+            interface_name(rng.randrange(96)), interface_name(rng.randrange(96)), str(rng.randrange(3600)),
+        )
+        lines.append("".join(value.ljust(width) for value, width in zip(values, FLOW_WIDTHS)))
+    return "\n".join(lines)
+
+
+# Maps every command with a parser to the generator of its output
+GENERATORS = {
+    "dump overview": generate_dump_overview,
+    "dump interface config all": generate_dump_interface_config_all,
+    "dump interface status all": generate_dump_interface_status_all,
+    "dump vpn summary": generate_dump_vpn_summary,
+    "inspect fib all": generate_inspect_fib_all,
+    "inspect flow brief": generate_inspect_flow_brief,
+}
+
+
+def generate_output(command, scale="small", seed=0):
+    """
+    Generate the output of a command at a scale.
+
+    Args:
+        command (str): The command, one of GENERATORS.
+        scale (str): One of SCALES.
+        seed (int): Seed of the random values.
+
+    Returns:
+        str: The output.
+    """
+    return GENERATORS[command](SCALES[scale][command], seed)
+
+
+def generate_outputs(scale="small", seed=0):
+    """
+    Generate the outputs of all commands at a scale.
+
+    Args:
+        scale (str): One of SCALES.
+        seed (int): Seed of the random values.
+
+    Returns:
+        dict: The outputs keyed by command.
+    """
+    return {command: generate_output(command, scale, seed) for command in GENERATORS}
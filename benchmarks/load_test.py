@@ -0,0 +1,156 @@
+"""
+Load-test the collection pipeline against a fleet of simulated devices.
+
+    python -m benchmarks.load_test --devices 2000 --sweeps 3
+    python -m benchmarks.load_test --devices 500 --scale medium --hang-rate 0.01
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import sys
+import threading
+import time
+
+from benchmarks.device_simulator import DeviceFleet
+from benchmarks.generators import GENERATORS, SCALES
+from services.command_parser_manager import CommandParserManager
+from services.network_manager import NetworkManager
+from services.session_pool import SessionPool
+
+
+class SweepRecorder:
+    """Records the progress reports of a sweep and derives per-device collection times."""
+
+    def __init__(self):
+        self.started = {}
+        self.finished = {}
+        self.failed = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, hostname, status):
+        now = time.monotonic()
+        with self._lock:
+            if status == "connecting":
+                self.started[hostname] = now
+            elif status == "parsing":
+                self.finished[hostname] = now
+            elif status == "failed":
+                self.finished.setdefault(hostname, now)
+                self.failed.add(hostname)
+
+    def durations(self):
+        """Return the seconds from connecting to having the outputs of every device that got that far."""
+        return [self.finished[host] - start for host, start in self.started.items() if host in self.finished]
+
+
+def percentile(values, share):
+    """Return the value below which the given share of the sorted values lies."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def run_sweep(network_manager, commands, streamed):
+    """
+    Run one collection sweep and return its statistics.
+
+    Args:
+        network_manager (NetworkManager): The collector, connected to the simulated fleet.
+        commands (list): Commands executed on every device.
+        streamed (bool): Parse the outputs of the stream commands line by line.
+
+    Returns:
+        dict: Duration, throughput, per-device latency percentiles and failures of the sweep.
+    """
+    recorder = SweepRecorder()
+    start = time.monotonic()
+    # The collector reports every step on stdout, which would dominate the measurement
+    with contextlib.redirect_stdout(io.StringIO()):
+        collected = network_manager.collect(
+            commands,
+            CommandParserManager.parse_output,
+            recorder,
+            CommandParserManager.parse_lines if streamed else None,
+        )
+        network_manager.disconnect_elements()
+    duration = time.monotonic() - start
+    durations = recorder.durations()
+    return {
+        "duration": duration,
+        "devices": len(recorder.started),
+        "collected": len(collected),
+        "failed": len(recorder.failed),
+        "throughput": len(collected) / duration if duration else 0.0,
+        "p50": percentile(durations, 0.5),
+        "p95": percentile(durations, 0.95),
+        "p99": percentile(durations, 0.99),
+        "max": max(durations, default=0.0),
+        "mean": statistics.mean(durations) if durations else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the collection pipeline against simulated devices.")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--sweeps", type=int, default=2, help="sweeps in a row, later ones reuse the sessions")
+    parser.add_argument("--workers", type=int, default=32, help="elements collected concurrently")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--commands", nargs="+", default=list(GENERATORS), help="commands run on every device")
+    parser.add_argument("--connect-latency", type=float, default=0.2)
+    parser.add_argument("--command-latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.2, help="random share added to every latency")
+    parser.add_argument("--throughput", type=float, default=10 * 1024 * 1024, help="characters per second per device")
+    parser.add_argument("--connect-failure-rate", type=float, default=0.0)
+    parser.add_argument("--command-failure-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="share of commands that never return")
+    parser.add_argument("--slow-devices", type=float, default=0.0, help="share of devices 10 times slower than the rest")
+    parser.add_argument("--command-timeout", type=int, default=5)
+    parser.add_argument("--batch", action="store_true", help="send all commands of a device at once, see BATCH_COMMANDS")
+    parser.add_argument("--no-stream", action="store_true", help="buffer the outputs of the stream commands")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    fleet = DeviceFleet({
+        "connect_latency": args.connect_latency,
+        "command_latency": args.command_latency,
+        "jitter": args.jitter,
+        "throughput": args.throughput,
+        "scale": args.scale,
+        "connect_failure_rate": args.connect_failure_rate,
+        "command_failure_rate": args.command_failure_rate,
+        "hang_rate": args.hang_rate,
+    }, args.seed)
+    slow_devices = int(args.devices * args.slow_devices)
+    for index in range(args.devices):
+        host = f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+        if index < slow_devices:
+            fleet.add_device(host, connect_latency=args.connect_latency * 10, command_latency=args.command_latency * 10)
+        else:
+            fleet.add_device(host)
+
+    network_manager = NetworkManager(
+        fleet.elements(),
+        max_workers=args.workers,
+        command_timeout=args.command_timeout,
+        session_pool=SessionPool(max_sessions=args.devices, connect_handler=fleet.connect),
+        batch_commands=args.batch,
+        stream_commands=["inspect fib all", "inspect flow brief"],
+    )
+
+    print(f"Load test: {args.devices} devices, {len(args.commands)} commands, {args.scale} outputs, {args.workers} workers")
+    print(f"{'sweep':>5} {'duration':>10} {'devices/s':>10} {'collected':>10} {'failed':>7} "
+          f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'sessions':>9}")
+    for sweep in range(1, args.sweeps + 1):
+        stats = run_sweep(network_manager, args.commands, not args.no_stream)
+        print(f"{sweep:>5} {stats['duration']:>9.2f}s {stats['throughput']:>10.1f} {stats['collected']:>10} "
+              f"{stats['failed']:>7} {stats['p50']:>7.3f}s {stats['p95']:>7.3f}s {stats['p99']:>7.3f}s "
+              f"{stats['max']:>7.3f}s {fleet.sessions:>9}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        network_manager.close_sessions()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+"""
+Run the benchmark suite and compare the results with the stored baseline.
+
+Results are stored relative to a fixed calibration workload timed next to
+every run, so a baseline recorded on one machine can be compared with runs
+on another.
+
+    python -m benchmarks.run --scale small
+    python -m benchmarks.run --scale large --save-baseline
+"""
+import argparse
+import gc
+import gzip
+import io
+import json
+from pathlib import Path
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.generators import GENERATORS, SCALES, generate_output
+from services.command_parser_manager import CommandParserManager
+from services.compact_snapshot import pack_snapshot
+from services.diff_report import iter_html_report
+from services.network_manager import NetworkManager
+from services.snapshot_encoding import encode_json
+from services.snapshot_file import SnapshotFile, write_snapshot_file
+from services.snapshot_hash import build_snapshot_hashes
+
+BASELINE_FILE = Path(__file__).resolve().parent / "baseline.json"
+# Slowdown against the baseline that counts as a regression, unless the baseline sets another one
+DEFAULT_THRESHOLD = 1.25
+# Minimum duration of a timed run, fast benchmarks are called repeatedly within a run
+MIN_RUN_TIME = 0.05
+# Timed runs of a benchmark that exceeds its threshold, before it is reported as a regression
+CONFIRM_REPEAT = 5
+# Records built by the calibration workload, sized to run for a few tens of milliseconds
+CALIBRATION_RECORDS = 5000
+# Share of the records changed between the compared snapshots
+CHANGED_RECORDS = 0.01
+
+
+def measure(func, repeat, setup=None):
+    """
+    Time a benchmark.
+
+    Benchmarks without setup that take less than MIN_RUN_TIME are called
+    several times per run, and the time per call is reported. The calibration
+    workload is timed before every run, so the ratio follows changes in the
+    speed of the machine during the suite.
+
+    Args:
+        func (callable): The benchmark, called with the result of setup.
+        repeat (int): Number of timed runs.
+        setup (callable, optional): Called before every run, outside of the timing.
+
+    Returns:
+        dict: Median and minimum run time in seconds, and the median ratio of
+            the run time to the calibration workload timed before it.
+    """
+    number = 1
+    if setup is None:
+        start = time.perf_counter()
+        func(None)
+        number = max(1, int(MIN_RUN_TIME / max(time.perf_counter() - start, 1e-9)))
+    timings = []
+    ratios = []
+    for _ in range(repeat):
+        # Every timed run starts from an empty GC generation, collections of the large
+        # benchmark snapshots otherwise land in the runs at random
+        gc.collect()
+        start = time.perf_counter()
+        calibration_workload()
+        calibration = time.perf_counter() - start
+        argument = setup() if setup is not None else None
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(number):
+            func(argument)
+        timings.append((time.perf_counter() - start) / number)
+        ratios.append(timings[-1] / calibration)
+    return {"median": statistics.median(timings), "min": min(timings), "ratio": statistics.median(ratios)}
+
+
+def calibration_workload():
+    """
+    Run the fixed workload the benchmarks are measured against.
+
+    It mixes line splitting, record building, sorting and JSON encoding,
+    the kind of work the benchmarked code does.
+    """
+    records = {}
+    for index in range(CALIBRATION_RECORDS):
+        line = f"10.{index >> 8 & 255}.{index & 255}.0/24 ge-0/0/{index % 48} {index * 7919 % 100003}"
+        prefix, interface, counter = line.split()
+        records[prefix] = {"Interface": interface, "Bytes": int(counter)}
+    return json.dumps(sorted(records.items(), key=lambda item: item[1]["Bytes"]))
+
+
+def parser_benchmarks(outputs):
+    """
+    Return the parser benchmarks of the generated outputs.
+
+    Args:
+        outputs (dict): Generated outputs keyed by command.
+
+    Returns:
+        list: (name, func, setup) tuples.
+    """
+    benchmarks = []
+    for command, output in outputs.items():
+        parse_func = CommandParserManager.get_parser(command)
+        cleaned = CommandParserManager.clean_output(command, output)
+        benchmarks.append((
+            f"parse_output[{command}]",
+            lambda _, command=command, output=output: CommandParserManager.parse_output(command, output),
+            None,
+        ))
+        benchmarks.append((f"parser[{command}]", lambda _, parse_func=parse_func, cleaned=cleaned: parse_func(cleaned), None))
+        if CommandParserManager.get_line_parser(command) is not None:
+            benchmarks.append((
+                f"parse_lines[{command}]",
+                lambda _, command=command, output=output: CommandParserManager.parse_lines(command, iter(output.split("\n"))),
+                None,
+            ))
+    return benchmarks
+
+
+def changed_snapshot(snapshot, seed=0):
+    """
+    Return a copy of a snapshot with CHANGED_RECORDS of its records changed or removed.
+
+    Args:
+        snapshot (dict): Parsed data keyed by host and command.
+        seed (int): Seed of the random changes.
+
+    Returns:
+        dict: The changed snapshot.
+    """
+    rng = random.Random(seed)
+    changed = json.loads(encode_json(snapshot))
+    for commands in changed.values():
+        for output in commands.values():
+            if not isinstance(output, dict):
+                continue
+            for key in rng.sample(list(output), int(len(output) * CHANGED_RECORDS)):
+                if rng.random() < 0.5:
+                    del output[key]
+                else:
+                    output[key] = {"changed": rng.randrange(10 ** 6)}
+    return changed
+
+
+def diff_benchmarks(previous, current):
+    """
+    Return the diff benchmarks of two snapshots.
+
+    Args:
+        previous (dict): The older snapshot.
+        current (dict): The newer snapshot.
+
+    Returns:
+        list: (name, func, setup) tuples.
+    """
+    network_manager = NetworkManager({})
+    network_manager.update_snapshot(previous)
+    network_manager.update_snapshot(current)
+
+    def uncached():
+        # Every run compares the snapshots from scratch
+        network_manager.diff_cache.invalidate()
+
+    changes = list(network_manager.snapshot_changes())
+
+    def html_report(_):
+        # Rendered into memory, as /compare-snapshots streams it
+        report = io.StringIO()
+        for chunk in iter_html_report(changes):
+            report.write(chunk)
+
+    return [
+        ("build_snapshot_hashes", lambda _: build_snapshot_hashes(current), None),
+        ("snapshot_changes", lambda _: network_manager.snapshot_changes(), uncached),
+        ("html_report", html_report, None),
+    ]
+
+
+def serialization_benchmarks(snapshot, directory):
+    """
+    Return the serialization benchmarks of a snapshot.
+
+    Args:
+        snapshot (dict): Parsed data keyed by host and command.
+        directory (str): Directory for the snapshot files.
+
+    Returns:
+        list: (name, func, setup) tuples.
+    """
+    hashes = build_snapshot_hashes(snapshot)
+    encoded = encode_json(snapshot)
+    path = Path(directory) / "snapshot.snap"
+    write_snapshot_file(path, snapshot, hashes)
+
+    def iter_json(_):
+        snapshot_file = SnapshotFile(path)
+        for _ in snapshot_file.iter_json():
+            pass
+        snapshot_file.close()
+
+    return [
+        ("encode_json", lambda _: encode_json(snapshot), None),
+        ("encode_gzip", lambda _: gzip.compress(encoded, 6), None),
+        ("pack_snapshot", lambda _: pack_snapshot(snapshot), None),
+        ("write_snapshot_file", lambda _: write_snapshot_file(path, snapshot, hashes), None),
+        ("snapshot_file_iter_json", iter_json, None),
+    ]
+
+
+def run(scale, hosts, repeat, selected=None, baseline=None):
+    """
+    Run the benchmarks at a scale.
+
+    Args:
+        scale (str): One of SCALES.
+        hosts (int): Number of hosts in the benchmarked snapshots.
+        repeat (int): Number of timed runs per benchmark.
+        selected (str, optional): Only run benchmarks whose name contains this string.
+        baseline (dict, optional): Benchmarks slower than in this baseline are
+            measured again with CONFIRM_REPEAT runs.
+
+    Returns:
+        dict: The results keyed by "<scale>/<benchmark>", see measure.
+    """
+    print(f"Generating {scale} outputs for {hosts} hosts...")
+    outputs = {command: generate_output(command, scale) for command in GENERATORS}
+    snapshot = {}
+    for host in range(hosts):
+        host_outputs = outputs if host == 0 else {command: generate_output(command, scale, host) for command in GENERATORS}
+        snapshot[f"host-{host}"] = {
+            command: CommandParserManager.parse_output(command, output) for command, output in host_outputs.items()
+        }
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        benchmarks = (
+            parser_benchmarks(outputs)
+            + diff_benchmarks(snapshot, changed_snapshot(snapshot))
+            + serialization_benchmarks(snapshot, directory)
+        )
+        for name, func, setup in benchmarks:
+            if selected and selected not in name:
+                continue
+            key = f"{scale}/{name}"
+            result = measure(func, repeat, setup)
+            if baseline is not None and (slowdown(result, baseline, key) or 0) > threshold(baseline, key):
+                # A single disturbed run is not a regression, the fastest of more runs is kept
+                retry = measure(func, max(repeat, CONFIRM_REPEAT), setup)
+                result = min(result, retry, key=lambda candidate: candidate["ratio"])
+            results[key] = result
+            print(f"{name:<50} {result['median'] * 1000:>10.2f} ms  (min {result['min'] * 1000:.2f} ms, "
+                  f"{result['ratio']:.2f}x calibration)")
+    return results
+
+
+def load_baseline(path=BASELINE_FILE):
+    """Return the stored baseline, or an empty one."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"thresholds": {}, "results": {}}
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    """
+    Store results in the baseline, keeping the results of other scales and the thresholds.
+
+    Args:
+        results (dict): Results returned by run.
+        path (Path): The baseline file.
+    """
+    baseline = load_baseline(path)
+    baseline.setdefault("thresholds", {})
+    baseline.setdefault("results", {}).update(
+        {key: {"ratio": float(f"{result['ratio']:.4g}")} for key, result in results.items()}
+    )
+    baseline["results"] = dict(sorted(baseline["results"].items()))
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+    print(f"Baseline saved to {path}")
+
+
+def threshold(baseline, key):
+    """
+    Return the threshold of a benchmark.
+
+    The threshold is looked up by the full key, then by the benchmark name
+    without the scale, then falls back to DEFAULT_THRESHOLD.
+    """
+    thresholds = baseline.get("thresholds", {})
+    return thresholds.get(key, thresholds.get(key.split("/", 1)[1], DEFAULT_THRESHOLD))
+
+
+def slowdown(result, baseline, key):
+    """
+    Return how many times slower a result is than the baseline.
+
+    The ratios to the calibration workload are compared, so differences in
+    the speed of the machines cancel out.
+
+    Returns:
+        float: The slowdown, or None if the baseline has no result for the benchmark.
+    """
+    reference = baseline.get("results", {}).get(key)
+    if reference is None:
+        return None
+    return result["ratio"] / reference["ratio"] if reference["ratio"] else 1.0
+
+
+def compare(results, baseline):
+    """
+    Compare results with the baseline.
+
+    Args:
+        results (dict): Results returned by run.
+        baseline (dict): The stored baseline.
+
+    Returns:
+        list: Keys of the benchmarks that regressed.
+    """
+    regressions = []
+    for key, result in results.items():
+        ratio = slowdown(result, baseline, key)
+        if ratio is None:
+            continue
+        limit = threshold(baseline, key)
+        status = "REGRESSION" if ratio > limit else "ok"
+        print(f"{key:<60} {ratio:>6.2f}x of baseline (threshold {limit:.2f}x) {status}")
+        if ratio > limit:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the command parsers, the diff and serialization.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--hosts", type=int, default=2, help="hosts in the benchmarked snapshots")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this string")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    baseline = None if args.save_baseline else load_baseline()
+    results = run(args.scale, args.hosts, args.repeat, args.filter, baseline)
+    if args.save_baseline:
+        save_baseline(results)
+        return 0
+    regressions = compare(results, baseline)
+    if regressions:
+        print(f"{len(regressions)} benchmarks regressed")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
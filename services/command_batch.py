@@ -0,0 +1,123 @@
+import time
+
+# Seconds to wait between channel reads when no data arrived
+READ_INTERVAL = 0.01
+
+
+class BatchError(Exception):
+    """
+    Raised when a command batch cannot be completed.
+
+    Attributes:
+        outputs (list): Outputs of the commands that completed before the failure.
+    """
+
+    def __init__(self, message, outputs):
+        super().__init__(message)
+        self.outputs = outputs
+
+
+class _Segment:
+    """Output of one command of a batch, collected up to a size limit."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.chunks = []
+        self.size = 0
+        self.truncated = False
+
+    def add(self, text):
+        if self.max_size is not None:
+            room = self.max_size - self.size
+            if len(text) > room:
+                text = text[:max(room, 0)]
+                self.truncated = True
+        if text:
+            self.chunks.append(text)
+            self.size += len(text)
+
+    def output(self, command):
+        """Return the output without the command echo, like send_command does."""
+        output = "".join(self.chunks)
+        first_line, newline, rest = output.partition("\n")
+        if command.strip() and command.strip() in first_line:
+            output = rest
+        output = output.strip("\n")
+        if self.truncated:
+            output += f"\n... output truncated after {self.max_size} characters"
+        return output
+
+
+def run_batch(connection, commands, command_timeout=60, max_output_size=None):
+    """
+    Execute commands in a single channel interaction and split the combined output.
+
+    All commands are written to the channel at once; the device runs them
+    back to back and prints its prompt after every output, which is where
+    the combined output is split. So a batch takes about one round trip
+    instead of one per command.
+
+    Args:
+        connection (object): Netmiko connection to the network element.
+        commands (list): List of commands to execute.
+        command_timeout (int): Seconds to wait for the output of a single command.
+        max_output_size (int, optional): Characters kept of a single command output;
+            longer outputs are truncated.
+
+    Returns:
+        list: One output per command.
+
+    Raises:
+        BatchError: If a command timed out; the channel is then in an unknown state.
+    """
+    prompt = connection.find_prompt()
+    marker = "\n" + prompt
+    newline = getattr(connection, "RETURN", "\n")
+    connection.write_channel("".join(command + newline for command in commands))
+
+    outputs = []
+    segment = _Segment(max_output_size)
+    buffer = ""
+    carry = ""
+    # Tail of the buffer held back, it may be the start of a prompt and the next command echo
+    hold = len(marker) + max(len(command) for command in commands) + 1
+    deadline = time.monotonic() + command_timeout
+    while len(outputs) < len(commands):
+        data = connection.read_channel()
+        if not data:
+            if time.monotonic() > deadline:
+                raise BatchError(f"Command '{commands[len(outputs)]}' timed out", outputs)
+            time.sleep(READ_INTERVAL)
+            continue
+        # Normalize line endings, a \r at the end of a chunk may be followed by \n
+        data = carry + data
+        carry = "\r" if data.endswith("\r") else ""
+        if carry:
+            data = data[:-1]
+        buffer += data.replace("\r\n", "\n").replace("\r", "\n")
+
+        start = 0
+        while len(outputs) < len(commands):
+            index = buffer.find(marker, start)
+            if index < 0:
+                break
+            following = len(outputs) + 1
+            if following < len(commands):
+                # A real prompt is followed by the echo of the next command
+                echo = buffer[index + len(marker):].lstrip(" ")
+                expected = commands[following].strip()
+                if len(echo) < len(expected):
+                    break
+                if not echo.startswith(expected):
+                    start = index + 1
+                    continue
+            segment.add(buffer[:index])
+            buffer = buffer[index + len(marker):]
+            start = 0
+            outputs.append(segment.output(commands[len(outputs)]))
+            segment = _Segment(max_output_size)
+            deadline = time.monotonic() + command_timeout
+        if len(outputs) < len(commands) and len(buffer) > hold:
+            segment.add(buffer[:-hold])
+            buffer = buffer[-hold:]
+    return outputs
@@ -1,43 +1,242 @@
 import importlib
-import pkgutil
+import importlib.util
+from importlib.machinery import SourceFileLoader
+import os
+from pathlib import Path
 import re
+import sys
+import threading
+
+PARSERS_PACKAGE = "services.command_parsers"
+PARSERS_DIR = Path(__file__).resolve().parent / "command_parsers"
+
+ANSI_ESCAPE = re.compile(r'\x1b\[.*?m')
+
 
 class CommandParserManager:
+    # Maps each command to the name and callable of its parser (None if there is no parser)
+    _registry = {}
+    # Maps each parser name to the number of times it was installed through install_parser
+    _versions = {}
+    _lock = threading.Lock()
+
     @staticmethod
-    def parse_output(command, output):
+    def command_name(command):
         """
-        Parse the output of a command.
+        Return the parser module and function name for a command.
 
         Args:
-            command (str): The command that produced the output.
-            output (str): The output of the command.
+            command (str): The command, e.g. 'dump overview'.
 
         Returns:
-            dict: The parsed data.
+            str: The parser name, e.g. 'dump_overview'.
         """
-        parsed_data = {}
+        return command.lower().replace(' ', '_')
+
+    @classmethod
+    def get_parser(cls, command):
+        """
+        Return the parser callable for a command.
 
-        command_name = command.lower().replace(' ', '_')
+        The parser module is imported the first time a command is seen; later
+        lookups are served from the registry.
+
+        Args:
+            command (str): The command to look up.
+
+        Returns:
+            callable: The parser function, or None if no parser is available.
+        """
+        entry = cls._registry.get(command)
+        if entry is None:
+            with cls._lock:
+                entry = cls._registry.get(command)
+                if entry is None:
+                    entry = cls._resolve(command)
+                    cls._registry[command] = entry
+        return entry[1]
+
+    @classmethod
+    def _resolve(cls, command):
+        """Import the parser of a command and return its registry entry."""
+        command_name = cls.command_name(command)
         try:
-            module = importlib.import_module(f"services.command_parsers.{command_name}")
+            module = importlib.import_module(f"{PARSERS_PACKAGE}.{command_name}")
+            return command_name, getattr(module, command_name)
+        except (ImportError, AttributeError):
+            return command_name, None
+
+    @classmethod
+    def get_line_parser(cls, command):
+        """
+        Return the line parser callable for a command.
 
+        A parser module may provide ``<parser name>_lines``, which takes an
+        iterable of lines instead of the whole output, so the output can be
+        parsed while it is streamed from the network element.
+
+        Args:
+            command (str): The command to look up.
+
+        Returns:
+            callable: The line parser function, or None if the parser has none.
+        """
+        command_name = cls.command_name(command)
+        if cls.get_parser(command) is None:
+            return None
+        module = sys.modules.get(f"{PARSERS_PACKAGE}.{command_name}")
+        return getattr(module, f"{command_name}_lines", None)
+
+    @classmethod
+    def parser_version(cls, command):
+        """
+        Return the version of the parser of a command.
+
+        The version changes whenever a parser is installed for the command, so
+        results of older parser versions can be recognised.
+
+        Args:
+            command (str): The command to look up.
+
+        Returns:
+            int: The parser version, 0 for the parser the application started with.
+        """
+        return cls._versions.get(cls.command_name(command), 0)
+
+    @classmethod
+    def install_parser(cls, command, source):
+        """
+        Install a new or changed parser and hot-swap it into the registry.
+
+        The parser is loaded from a temporary file first, so a parser that fails
+        to import leaves the current one in place. The file is then moved into
+        the parsers directory and the registry entry is replaced atomically.
+
+        Args:
+            command (str): The command handled by the parser.
+            source (bytes): Source code of the parser module.
+
+        Raises:
+            ValueError: If the parser cannot be loaded or lacks the parser function.
+        """
+        command_name = cls.command_name(command)
+        module_name = f"{PARSERS_PACKAGE}.{command_name}"
+        parser_path = PARSERS_DIR / f"{command_name}.py"
+        temp_path = PARSERS_DIR / f".{command_name}.py.tmp"
+
+        with open(temp_path, "wb") as f:
+            f.write(source)
+        try:
+            loader = SourceFileLoader(module_name, str(temp_path))
+            spec = importlib.util.spec_from_loader(module_name, loader)
+            module = importlib.util.module_from_spec(spec)
+            loader.exec_module(module)
             parse_func = getattr(module, command_name)
+            if not callable(parse_func):
+                raise TypeError(f"'{command_name}' is not callable")
+        except Exception as e:
+            os.remove(temp_path)
+            raise ValueError(f"Invalid parser for command '{command}': {str(e)}") from e
+
+        os.replace(temp_path, parser_path)
+        module.__file__ = str(parser_path)
+        with cls._lock:
+            sys.modules[module_name] = module
+            for registered_command, (registered_name, _) in list(cls._registry.items()):
+                if registered_name == command_name:
+                    cls._registry[registered_command] = (command_name, parse_func)
+            cls._registry[command] = (command_name, parse_func)
+            cls._versions[command_name] = cls._versions.get(command_name, 0) + 1
+        print(f"Parser for command '{command}' installed")
 
-            # Split the output into lines
-            lines = output.strip().split('\n')
+    @staticmethod
+    def clean_output(command, output):
+        """
+        Remove command echoes and ANSI escape sequences from a command output.
+
+        Args:
+            command (str): The command that produced the output.
+            output (str): The output of the command.
+
+        Returns:
+            str: The cleaned output.
+        """
+        command_lower = command.lower()
+
+        # Split the output into lines
+        lines = output.strip().split('\n')
+
+        # Remove the lines that contain the command string
+        lines = [line for line in lines if command_lower not in line.lower()]
 
-            # Remove the lines that contain the command string
-            lines = [line for line in lines if command.lower() not in line.lower()]
+        # Join the remaining lines back into a single string
+        modified_output = '\n'.join(lines)
 
-            # Join the remaining lines back into a single string
-            modified_output = '\n'.join(lines)
+        # Remove special characters from the output
+        return ANSI_ESCAPE.sub('', modified_output)
 
-            # Remove special characters from the output
-            modified_output = re.sub(r'\x1b\[.*?m', '', modified_output)
+    @staticmethod
+    def clean_lines(command, lines):
+        """
+        Remove command echoes and ANSI escape sequences from the lines of a command output.
+
+        Works like clean_output, one line at a time.
+
+        Args:
+            command (str): The command that produced the output.
+            lines (iterable): The lines of the output.
+
+        Yields:
+            str: The cleaned lines.
+        """
+        command_lower = command.lower()
+        for line in lines:
+            if command_lower not in line.lower():
+                yield ANSI_ESCAPE.sub('', line)
+
+    @classmethod
+    def parse_output(cls, command, output):
+        """
+        Parse the output of a command.
 
-            parsed_data = parse_func(modified_output)
+        Args:
+            command (str): The command that produced the output.
+            output (str): The output of the command.
+
+        Returns:
+            dict: The parsed data.
+        """
+        parsed_data = {}
+
+        try:
+            parse_func = cls.get_parser(command)
+            if parse_func is None:
+                raise ImportError(command)
+
+            parsed_data = parse_func(cls.clean_output(command, output))
         except (ImportError, AttributeError):
             print(f"No parser available for command: {command}")
             parsed_data = {"command_output": output}
 
         return parsed_data
+
+    @classmethod
+    def parse_lines(cls, command, lines):
+        """
+        Parse the output of a command from an iterable of its lines.
+
+        The lines are handed to the line parser of the command as they come,
+        so the output is never held as a whole. Commands whose parser has no
+        line parser are joined and parsed with parse_output.
+
+        Args:
+            command (str): The command that produced the output.
+            lines (iterable): The lines of the output.
+
+        Returns:
+            dict: The parsed data.
+        """
+        line_parse_func = cls.get_line_parser(command)
+        if line_parse_func is None:
+            return cls.parse_output(command, '\n'.join(lines))
+        return line_parse_func(cls.clean_lines(command, lines))
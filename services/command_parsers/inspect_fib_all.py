@@ -1,4 +1,15 @@
 import re
+import socket
+
+# Fields stored as plain text on a path record
+TEXT_FIELDS = {"Path Type", "Vpn Type", "Site ID", "Site Name", "Path Info"}
+
+# Prefix lines and the path record list they are collected in
+PREFIX_FIELDS = {"Prefix": "Prefixes", "V6 Prefix": "V6 Prefixes"}
+
+FRAGMENT = re.compile(r'[^\n,]+')
+
+
 def inspect_fib_all(output):
     """
     Parse the output of the 'inspect fib all' command.
@@ -11,54 +22,123 @@ def inspect_fib_all(output):
     """
     parsed_data = {}
     try:
-        lines = re.split(r'[\n,]', output)
-        current_path = None
-
-        for line in lines:
-            line = line.strip()
-            if line.startswith("Path ID:"):
-                # Start of a new path
-                if current_path is not None:
-                    parsed_data[current_path['Path ID']] = current_path
-                current_path = {}
-                path_id = line.split(': ')[1].strip()
-                current_path['Path ID'] = path_id
-            elif line.startswith("Path Type:"):
-                path_type = line.split(': ')[1].strip()
-                current_path['Path Type'] = path_type
-            elif line.startswith("Vpn Type:"):
-                vpn_type = line.split(': ')[1].strip()
-                current_path['Vpn Type'] = vpn_type
-            elif line.startswith("Site ID:"):
-                site_id = line.split(': ')[1].strip()
-                current_path['Site ID'] = site_id
-            elif line.startswith("Site Name:"):
-                site_name = line.split(': ')[1].strip()
-                current_path['Site Name'] = site_name
-            elif line.startswith("Status:"):
-                status = line.split(': ')[1].strip()
-                current_path['Status'] = status.lower() == 'true'
-            elif line.startswith("Path Info:"):
-                path_info = line.split(': ')[1].strip()
-                current_path['Path Info'] = path_info
-            elif line.startswith("Prefixes:") or line.startswith("V6 Prefixes:"):
-                # Skip the header for prefixes and v6 prefixes
-                continue
-            elif line.startswith("Prefix:"):
-                if 'Prefixes' not in current_path:
-                    current_path['Prefixes'] = []
-                prefix = line.split(': ')[1].strip()
-                current_path['Prefixes'].append(prefix)
-            elif line.startswith("V6 Prefix:"):
-                if 'V6 Prefixes' not in current_path:
-                    current_path['V6 Prefixes'] = []
-                v6_prefix = line.split(': ')[1].strip()
-                current_path['V6 Prefixes'].append(v6_prefix)
-
-        # Add the last path to the parsed data
-        if current_path is not None:
-            parsed_data[current_path['Path ID']] = current_path
+        for path in iter_fib_paths(output):
+            parsed_data[path['Path ID']] = path
     except Exception as e:
         print(f"Error occurred while parsing 'inspect fib all' output: {str(e)}")
 
     return parsed_data
+
+
+def inspect_fib_all_lines(lines):
+    """
+    Parse the output of the 'inspect fib all' command from an iterable of lines.
+
+    Args:
+        lines (iterable): The lines of the output, e.g. streamed from the channel.
+
+    Returns:
+        dict: Parsed data containing information about paths, prefixes, and VPNs.
+    """
+    return inspect_fib_all(lines)
+
+
+def iter_fib_paths(output):
+    """
+    Parse the output of the 'inspect fib all' command incrementally.
+
+    Only the path that is currently being parsed is held in memory, so peak
+    memory does not depend on the size of the FIB table.
+
+    Args:
+        output (str or iterable): The output of the 'inspect fib all' command,
+            either as a string or as an iterable of lines (e.g. a file object).
+
+    Yields:
+        dict: One path record at a time.
+    """
+    current_path = None
+
+    for fragment in _iter_fragments(output):
+        key, _, value = fragment.partition(':')
+        key = key.strip()
+        field = PREFIX_FIELDS.get(key)
+        if field is not None:
+            if current_path is None:
+                continue
+            current_path.setdefault(field, []).append(value.strip())
+        elif key == "Path ID":
+            # Start of a new path
+            if current_path is not None:
+                yield current_path
+            current_path = {'Path ID': value.strip()}
+        elif current_path is None:
+            continue
+        elif key in TEXT_FIELDS:
+            current_path[key] = value.strip()
+        elif key == "Status":
+            current_path['Status'] = value.strip().lower() == 'true'
+
+    # Yield the last path
+    if current_path is not None:
+        yield current_path
+
+
+def _iter_fragments(output):
+    """Yield the comma and newline separated fragments of the output one by one."""
+    if isinstance(output, str):
+        for match in FRAGMENT.finditer(output):
+            yield match.group().strip()
+        return
+    for line in output:
+        for fragment in line.split(','):
+            fragment = fragment.strip()
+            if fragment:
+                yield fragment
+
+
+def pack_prefixes(prefixes):
+    """
+    Pack a list of prefixes of one address family into their compact binary form.
+
+    Every prefix is stored as its length followed by the 4 (IPv4) or 16 (IPv6)
+    address bytes. A list is only packed when unpack_prefixes gives back
+    exactly the same strings.
+
+    Args:
+        prefixes (list): Prefixes in CIDR notation, e.g. '10.0.0.0/24'.
+
+    Returns:
+        tuple: The IP version and the packed prefixes, or None if the list cannot be packed losslessly.
+    """
+    try:
+        split = [prefix.split("/") for prefix in prefixes]
+        version = 6 if ":" in split[0][0] else 4
+        family = socket.AF_INET6 if version == 6 else socket.AF_INET
+        packed = b"".join([bytes((int(length),)) + socket.inet_pton(family, address) for address, length in split])
+    except (AttributeError, IndexError, ValueError, OSError):
+        # Not a list of prefixes of one address family
+        return None
+    size = 5 if version == 4 else 17
+    if max(packed[::size]) > (size - 1) * 8 or unpack_prefixes(packed, version) != prefixes:
+        return None
+    return version, packed
+
+
+def unpack_prefixes(packed, version=4):
+    """
+    Unpack prefixes packed with pack_prefixes.
+
+    Args:
+        packed (bytes): Concatenated packed prefixes of one address family.
+        version (int): The IP version of the prefixes, 4 or 6.
+
+    Returns:
+        list: The prefixes in CIDR notation.
+    """
+    size = 5 if version == 4 else 17
+    family = socket.AF_INET if version == 4 else socket.AF_INET6
+    return [
+        f"{socket.inet_ntop(family, packed[i + 1:i + size])}/{packed[i]}"
+        for i in range(0, len(packed), size)
+    ]
@@ -1,14 +1,22 @@
+from operator import itemgetter
 import re
 
-def inspect_flow_brief(output):
+# Columns that make up the key of a flow
+KEY_COLUMNS = ('SRC', 'DST', 'SPORT', 'DPORT', 'PROTOCOL')
+
+
+def inspect_flow_brief(output, columnar=False):
     """
     Parse the output of the 'inspect flow brief' command.
 
     Args:
         output (str): The output of the 'inspect flow brief' command.
+        columnar (bool): Return one list of values per column instead of one
+            dictionary per flow, which is cheaper for callers that aggregate flows.
 
     Returns:
-        dict: Parsed data containing information about flows.
+        dict: Parsed data containing information about flows, keyed by flow key,
+            or keyed by column name when columnar is set.
     """
     flows = {}
     output = re.sub(r'\x1b\[.*?m', '', output)  # Remove escape sequences from the input
@@ -17,31 +25,106 @@ def inspect_flow_brief(output):
         lines = output.strip().split('\n')
 
         # Find the last line that contains the command and stop there
-        command_lines = [line for line in lines if 'inspect flow brief' in line]
-        if command_lines:
-            header_line_index = lines.index(command_lines[-1]) + 1
-        else:
-            header_line_index = 0
-        # Find the header line
-        header_line = lines[header_line_index]
-        headers = re.split(r"\s{2,}", header_line.strip())
-        data_lines = lines[header_line_index + 1:]
+        header_line_index = 0
+        for index in range(len(lines) - 1, -1, -1):
+            if 'inspect flow brief' in lines[index]:
+                header_line_index = index + 1
+                break
+        # The header line follows the command
+        return parse_flow_table(lines[header_line_index], lines[header_line_index + 1:], columnar, flows)
+    except Exception as e:
+        print(f"Error occurred while parsing 'inspect flow brief' output: {str(e)}")
+
+    return flows
+
+
+def inspect_flow_brief_lines(lines, columnar=False):
+    """
+    Parse the output of the 'inspect flow brief' command from an iterable of lines.
+
+    Args:
+        lines (iterable): The lines of the output without the command echo,
+            e.g. streamed from the channel.
+        columnar (bool): Return one list of values per column instead of one
+            dictionary per flow.
+
+    Returns:
+        dict: Parsed data containing information about flows, keyed by flow key,
+            or keyed by column name when columnar is set.
+    """
+    flows = {}
+    lines = iter(lines)
+
+    try:
+        # The header line is the first line with content
+        for header_line in lines:
+            if header_line.strip():
+                return parse_flow_table(header_line, lines, columnar, flows)
+    except Exception as e:
+        print(f"Error occurred while parsing 'inspect flow brief' output: {str(e)}")
+
+    return flows
+
+
+def parse_flow_table(header_line, data_lines, columnar=False, flows=None):
+    """
+    Parse the rows of the flow table.
+
+    Args:
+        header_line (str): The header line of the flow table.
+        data_lines (iterable): The data rows of the flow table.
+        columnar (bool): Return one list of values per column instead of one
+            dictionary per flow.
+        flows (dict, optional): Dictionary the flows are added to, so rows parsed
+            before an error are kept.
+
+    Returns:
+        dict: The flows keyed by flow key, or the values keyed by column name when columnar is set.
+    """
+    flows = {} if flows is None else flows
+    headers, slice_row = column_layout(header_line)
+
+    if columnar:
+        columns = {header: [] for header in headers}
+        appenders = [columns[header].append for header in headers]
         for line in data_lines:
             if not line.strip():
                 continue
+            for append, value in zip(appenders, slice_row(line)):
+                append(value.strip())
+        return columns
 
-            flow = {}
-            start_indices = [match.start() for match in re.finditer(r"\b[\w-]+\b", header_line)]
-            end_indices = []
-            for i in range(len(start_indices) - 1):
-                end_indices.append(start_indices[i + 1] - 1)   
-            end_indices.append(len(line) - 1)
-            for start, end, header in zip(start_indices, end_indices, headers):
-                value = line[start:end].strip()
-                flow[header] = value
-            flow_key = f"sip:{flow['SRC']}-dip:{flow['DST']}-sport:{flow['SPORT']}-dport:{flow['DPORT']}-prot:{flow['PROTOCOL']}"
-            flows[flow_key] = flow
-    except Exception as e:
-        print(f"Error occurred while parsing 'inspect flow brief' output: {str(e)}")
+    key_getter = itemgetter(*[headers.index(column) for column in KEY_COLUMNS])
+    for line in data_lines:
+        if not line.strip():
+            continue
 
+        values = [value.strip() for value in slice_row(line)]
+        flow = dict(zip(headers, values))
+        flows["sip:%s-dip:%s-sport:%s-dport:%s-prot:%s" % key_getter(values)] = flow
     return flows
+
+
+def column_layout(header_line):
+    """
+    Compute the fixed-width column layout of the flow table from its header line.
+
+    Args:
+        header_line (str): The header line of the flow table.
+
+    Returns:
+        tuple: The column headers, and a callable that slices a data row into
+            one (unstripped) value per column.
+    """
+    headers = re.split(r"\s{2,}", header_line.strip())
+    start_indices = [match.start() for match in re.finditer(r"\b[\w-]+\b", header_line)]
+    end_indices = [start - 1 for start in start_indices[1:]] + [None]
+    slices = [slice(start, end) for start, end in zip(start_indices, end_indices)]
+    headers = headers[:len(slices)]
+    slices = slices[:len(headers)]
+    if not slices:
+        return headers, lambda line: ()
+    getter = itemgetter(*slices)
+    if len(slices) == 1:
+        return headers, lambda line: (getter(line),)
+    return headers, getter
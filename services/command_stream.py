@@ -0,0 +1,106 @@
+import time
+
+from services.command_batch import READ_INTERVAL
+
+
+class ChannelLineReader:
+    """
+    Iterates over the output of a command line by line while it is read from the channel.
+
+    The channel is read in chunks and only the current partial line is
+    buffered, so the output of a command is never held as a whole. The
+    command echo is dropped like send_command does. Errors do not propagate
+    into the consumer, which may swallow them; iteration stops and the error
+    is kept in ``error`` instead.
+    """
+
+    def __init__(self, connection, command, command_timeout=60, max_output_size=None):
+        """
+        Initialize the ChannelLineReader.
+
+        Args:
+            connection (object): Netmiko connection to the network element.
+            command (str): The command to execute.
+            command_timeout (int): Seconds to wait for more output before giving up.
+            max_output_size (int, optional): Characters passed on to the consumer;
+                the rest of the output is read but dropped.
+        """
+        self.connection = connection
+        self.command = command
+        self.command_timeout = command_timeout
+        self.max_output_size = max_output_size
+        self.size = 0
+        self.line_count = 0
+        self.truncated = False
+        self.error = None
+        self._lines = None
+
+    def __iter__(self):
+        if self._lines is None:
+            self._lines = self._read_lines()
+        return self._lines
+
+    def drain(self):
+        """
+        Read the rest of the output, e.g. when the consumer stopped early.
+
+        Returns:
+            bool: True if the channel is back at the prompt.
+        """
+        for _ in self:
+            pass
+        return self.error is None
+
+    def _read_lines(self):
+        connection = self.connection
+        try:
+            prompt = connection.find_prompt().strip()
+            connection.write_channel(self.command + getattr(connection, "RETURN", "\n"))
+        except Exception as e:
+            self.error = e
+            return
+
+        echo = self.command.strip()
+        pending = ""
+        carry = ""
+        seen_line = False
+        deadline = time.monotonic() + self.command_timeout
+        while True:
+            try:
+                data = connection.read_channel()
+            except Exception as e:
+                self.error = e
+                return
+            if not data:
+                # The prompt after the output ends it
+                if seen_line and pending.strip() == prompt:
+                    return
+                if time.monotonic() > deadline:
+                    self.error = TimeoutError(f"Command '{self.command}' timed out")
+                    return
+                time.sleep(READ_INTERVAL)
+                continue
+            deadline = time.monotonic() + self.command_timeout
+
+            # Normalize line endings, a \r at the end of a chunk may be followed by \n
+            data = carry + data
+            carry = "\r" if data.endswith("\r") else ""
+            if carry:
+                data = data[:-1]
+            lines = (pending + data.replace("\r\n", "\n").replace("\r", "\n")).split("\n")
+            pending = lines.pop()
+            for line in lines:
+                if not seen_line:
+                    seen_line = True
+                    if echo and echo in line:
+                        continue
+                if self._accept(line):
+                    self.line_count += 1
+                    yield line
+
+    def _accept(self, line):
+        self.size += len(line) + 1
+        if self.max_output_size is not None and self.size > self.max_output_size:
+            self.truncated = True
+            return False
+        return True
@@ -0,0 +1,180 @@
+from collections.abc import Mapping
+import sys
+
+from services.command_parsers.inspect_fib_all import PREFIX_FIELDS, pack_prefixes, unpack_prefixes
+
+# Record fields holding prefix lists, which are packed into bytes
+PREFIX_LIST_FIELDS = frozenset(PREFIX_FIELDS.values())
+
+
+class PackedRecord(tuple):
+    """
+    A record packed into a tuple: its field names (a tuple shared by all
+    records with the same fields) followed by its values.
+    """
+
+    __slots__ = ()
+
+
+class PackedPrefixes(tuple):
+    """
+    A prefix list packed with pack_prefixes: its IP version followed by the packed bytes.
+    """
+
+    __slots__ = ()
+
+
+class RecordTable(Mapping):
+    """
+    Read-only mapping of the records of a keyed command output.
+
+    Records are stored as packed tuples and expanded into dictionaries on
+    access, so iterating, indexing and comparing a table behaves like the
+    dictionary it was built from.
+    """
+
+    __slots__ = ("_rows",)
+
+    def __init__(self, rows):
+        self._rows = rows
+
+    def __getitem__(self, key):
+        return expand_value(self._rows[key])
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def items(self):
+        return ((key, expand_value(row)) for key, row in self._rows.items())
+
+    def __repr__(self):
+        return f"RecordTable({len(self._rows)} records)"
+
+
+class Packer:
+    """
+    Packs snapshots into their compact form.
+
+    Strings are interned, so keys and repeated values are stored once for
+    every snapshot, and the field names of records are shared per layout.
+    Prefix lists of FIB paths are stored in their packed binary form.
+    """
+
+    def __init__(self):
+        self._layouts = {}
+
+    def pack_snapshot(self, snapshot):
+        """
+        Pack a snapshot.
+
+        Args:
+            snapshot (dict): Parsed data keyed by host and command.
+
+        Returns:
+            dict: The snapshot with every keyed command output packed into a RecordTable.
+        """
+        packed = {}
+        for host, commands in snapshot.items():
+            if not isinstance(commands, Mapping):
+                packed[self._intern(host)] = self.pack_value(commands)
+                continue
+            packed[self._intern(host)] = {
+                self._intern(command): self.pack_output(output) for command, output in commands.items()
+            }
+        return packed
+
+    def pack_output(self, output):
+        """Pack a parsed command output, keyed outputs become a RecordTable."""
+        if isinstance(output, RecordTable):
+            return output
+        if isinstance(output, Mapping):
+            return RecordTable({self._intern(key): self.pack_value(value) for key, value in output.items()})
+        return self.pack_value(output)
+
+    def pack_value(self, value):
+        """Pack a value: strings are interned, dictionaries become PackedRecords and lists tuples."""
+        if isinstance(value, str):
+            return sys.intern(value)
+        if isinstance(value, Mapping):
+            fields = tuple(self._intern(key) for key in value)
+            layout = self._layouts.get(fields)
+            if layout is None:
+                layout = self._layouts[fields] = fields
+            return PackedRecord(
+                (layout,) + tuple(self._pack_field(field, item) for field, item in zip(layout, value.values()))
+            )
+        if isinstance(value, (list, tuple)):
+            return tuple(self.pack_value(item) for item in value)
+        return value
+
+    def _pack_field(self, field, value):
+        """Pack a record field, prefix lists are packed into bytes when that is lossless."""
+        if field in PREFIX_LIST_FIELDS and isinstance(value, list):
+            packed = pack_prefixes(value)
+            if packed is not None:
+                return PackedPrefixes(packed)
+        return self.pack_value(value)
+
+    @staticmethod
+    def _intern(key):
+        return sys.intern(key) if isinstance(key, str) else key
+
+
+def expand_value(value):
+    """
+    Convert a packed value back into its JSON shape.
+
+    Args:
+        value: A value packed by Packer.pack_value.
+
+    Returns:
+        The value with PackedRecords as dictionaries and tuples as lists.
+    """
+    if type(value) is PackedRecord:
+        return {field: expand_value(item) for field, item in zip(value[0], value[1:])}
+    if type(value) is tuple:
+        return [expand_value(item) for item in value]
+    if type(value) is PackedPrefixes:
+        return unpack_prefixes(value[1], value[0])
+    return value
+
+
+def pack_snapshot(snapshot):
+    """
+    Pack a snapshot into its compact form.
+
+    Args:
+        snapshot (dict): Parsed data keyed by host and command.
+
+    Returns:
+        dict: The compact snapshot; it reads like the original through the Mapping interface.
+    """
+    return Packer().pack_snapshot(snapshot)
+
+
+def unpack_snapshot(snapshot):
+    """
+    Convert a compact snapshot back into plain nested dictionaries.
+
+    Args:
+        snapshot (dict): A snapshot packed by pack_snapshot.
+
+    Returns:
+        dict: The snapshot in its JSON shape.
+    """
+    unpacked = {}
+    for host, commands in snapshot.items():
+        if not isinstance(commands, Mapping):
+            unpacked[host] = expand_value(commands)
+            continue
+        unpacked[host] = {
+            command: dict(output.items()) if isinstance(output, RecordTable) else expand_value(output)
+            for command, output in commands.items()
+        }
+    return unpacked
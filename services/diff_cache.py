@@ -0,0 +1,68 @@
+from collections import OrderedDict
+import threading
+
+
+class DiffCache:
+    """
+    Bounded LRU cache of diff results, keyed by the identity of the compared snapshot pair.
+    """
+
+    def __init__(self, max_entries=16):
+        """
+        Initialize the DiffCache.
+
+        Args:
+            max_entries (int): Maximum number of diff results kept in memory.
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Return the cached diff result for a snapshot pair, or None.
+
+        Args:
+            key (tuple): Identity of the snapshot pair.
+        """
+        with self._lock:
+            changes = self._entries.get(key)
+            if changes is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return changes
+
+    def put(self, key, changes):
+        """
+        Cache the diff result of a snapshot pair, evicting the least recently used result when full.
+
+        Args:
+            key (tuple): Identity of the snapshot pair.
+            changes (list): The diff result.
+        """
+        with self._lock:
+            self._entries[key] = changes
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predicate=None):
+        """
+        Drop cached diff results.
+
+        Args:
+            predicate (callable, optional): Only drop the results whose key it returns True for.
+        """
+        with self._lock:
+            if predicate is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
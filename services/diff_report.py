@@ -0,0 +1,190 @@
+from collections.abc import Mapping
+import html
+import json
+
+from services.snapshot_diff import (
+    ITEM_ADDED,
+    ITEM_REMOVED,
+    ITERABLE_ITEM_ADDED,
+    ITERABLE_ITEM_REMOVED,
+    TYPE_CHANGES,
+    VALUES_CHANGED,
+    format_path,
+)
+
+# Order in which change types are listed in reports
+CHANGE_TYPE_ORDER = (
+    ITEM_ADDED,
+    ITEM_REMOVED,
+    VALUES_CHANGED,
+    TYPE_CHANGES,
+    ITERABLE_ITEM_ADDED,
+    ITERABLE_ITEM_REMOVED,
+)
+
+HTML_HEAD = """
+        <html>
+        <head>
+            <link rel="stylesheet" href="/static/bootstrap.min.css">
+            <script src="/static/bootstrap.bundle.min.js"></script>
+            <style>
+                .change-type {
+                    font-size: 1.2rem;
+                    font-weight: bold;
+                    margin-top: 2rem;
+                }
+                .change-key {
+                    font-size: 1.1rem;
+                    font-weight: bold;
+                    margin-top: 1rem;
+                }
+                .change-value {
+                    font-size: 1rem;
+                    margin-top: 0.5rem;
+                }
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <h1>%s</h1>
+        """
+
+HTML_TAIL = """
+            </div>
+        </body>
+        </html>
+        """
+
+
+class CustomJSONEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, (set, frozenset)):
+            return list(o)
+        if isinstance(o, (bytes, bytearray)):
+            return o.hex()
+        if isinstance(o, Mapping):
+            return dict(o.items())
+        return super().default(o)
+
+
+def select_changes(changes, hosts=None, commands=None):
+    """
+    Filter changes by host and command and order them by change type.
+
+    Args:
+        changes (iterable): Changes as yielded by snapshot_diff.iter_changes.
+        hosts (list, optional): Only keep changes on these hosts.
+        commands (list, optional): Only keep changes in the output of these commands.
+
+    Returns:
+        list: The selected changes, grouped by change type.
+    """
+    hosts = set(hosts) if hosts else None
+    commands = set(commands) if commands else None
+    selected = [
+        change for change in changes
+        if (hosts is None or (len(change[1]) > 0 and change[1][0] in hosts))
+        and (commands is None or (len(change[1]) > 1 and change[1][1] in commands))
+    ]
+    order = {change_type: index for index, change_type in enumerate(CHANGE_TYPE_ORDER)}
+    selected.sort(key=lambda change: order.get(change[0], len(order)))
+    return selected
+
+
+def paginate(changes, page, page_size):
+    """
+    Return one page of changes.
+
+    Args:
+        changes (list): The changes to paginate.
+        page (int): The page number, starting at 1.
+        page_size (int): The number of changes per page.
+
+    Returns:
+        tuple: The changes on the page and the number of pages.
+    """
+    page_size = max(1, page_size)
+    pages = max(1, -(-len(changes) // page_size))
+    start = (max(1, page) - 1) * page_size
+    return changes[start:start + page_size], pages
+
+
+def change_to_dict(change):
+    """
+    Convert a change to a JSON-compatible dictionary.
+
+    Args:
+        change (tuple): A change as yielded by snapshot_diff.iter_changes.
+
+    Returns:
+        dict: The change type, path, host, command and the old and new values.
+    """
+    change_type, keys, old_value, new_value = change
+    entry = {
+        "type": change_type,
+        "path": format_path(keys),
+        "host": keys[0] if len(keys) > 0 else None,
+        "command": keys[1] if len(keys) > 1 else None,
+    }
+    if change_type != ITEM_ADDED and change_type != ITERABLE_ITEM_ADDED:
+        entry["old_value"] = old_value
+    if change_type != ITEM_REMOVED and change_type != ITERABLE_ITEM_REMOVED:
+        entry["new_value"] = new_value
+    return entry
+
+
+def iter_html_report(changes, title="Differences between Current and Previous Snapshots", navigation=""):
+    """
+    Render changes as an HTML report, one chunk at a time.
+
+    Args:
+        changes (iterable): The changes to render, grouped by change type.
+        title (str): Heading of the report.
+        navigation (str): HTML with pagination links, shown above and below the changes.
+
+    Yields:
+        str: Chunks of the HTML document.
+    """
+    yield HTML_HEAD % html.escape(title)
+    yield navigation
+    current_type = None
+    for change in changes:
+        entry = change_to_dict(change)
+        if entry["type"] != current_type:
+            current_type = entry["type"]
+            yield f'<div class="change-type">{current_type}</div>'
+        value = {key: entry[key] for key in ("new_value", "old_value") if key in entry}
+        if len(value) == 1:
+            value = next(iter(value.values()))
+        yield (
+            f'<div class="change-key">{html.escape(entry["path"])}</div>'
+            f'<pre class="change-value">{html.escape(json.dumps(value, indent=4, cls=CustomJSONEncoder))}</pre>'
+        )
+    yield navigation
+    yield HTML_TAIL
+
+
+def iter_json_report(changes, page=1, pages=1, total=None):
+    """
+    Render changes as a JSON document, one chunk at a time.
+
+    Yields:
+        str: Chunks of the JSON document.
+    """
+    yield json.dumps({"page": page, "pages": pages, "total": total})[:-1] + ', "changes": ['
+    separator = ""
+    for change in changes:
+        yield separator + json.dumps(change_to_dict(change), cls=CustomJSONEncoder)
+        separator = ", "
+    yield "]}"
+
+
+def iter_ndjson_report(changes):
+    """
+    Render changes as newline-delimited JSON, one change per line.
+
+    Yields:
+        str: One line per change.
+    """
+    for change in changes:
+        yield json.dumps(change_to_dict(change), cls=CustomJSONEncoder) + "\n"
@@ -0,0 +1,217 @@
+from collections import Counter
+from collections.abc import Mapping
+import ipaddress
+
+# Command whose output is indexed
+FLOW_COMMAND = "inspect flow brief"
+
+# Columns holding addresses, which can also be filtered by subnet
+ADDRESS_COLUMNS = ("SRC", "DST")
+
+# Key and low-cardinality columns that get posting lists; counters such as
+# BYTES, PACKETS and AGE are nearly unique per flow and are filtered by scanning
+INDEXED_COLUMNS = ("SRC", "DST", "SPORT", "DPORT", "PROTOCOL", "INGRESS", "EGRESS")
+
+
+class FlowIndex:
+    """
+    Secondary indexes over the 'inspect flow brief' outputs of a snapshot.
+
+    Every flow of every host gets a flow number; for every indexed column,
+    each distinct value maps to the sorted list of flow numbers that have it.
+    Filters intersect these lists and counts per value are read from their
+    lengths, so fleet-wide flow questions do not walk the snapshot. Filters
+    on other columns are checked by scanning the flows that match the
+    indexed filters.
+    """
+
+    def __init__(self, indexed_columns=INDEXED_COLUMNS):
+        """
+        Initialize the FlowIndex.
+
+        Args:
+            indexed_columns (tuple): Columns that get posting lists.
+        """
+        self.indexed_columns = frozenset(indexed_columns)
+        self.flows = []
+        self.hosts = {}
+        self.columns = {}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Build the indexes of a snapshot.
+
+        Args:
+            snapshot (dict): Parsed data keyed by host and command.
+
+        Returns:
+            FlowIndex: The index.
+        """
+        index = cls()
+        for host, commands in snapshot.items():
+            if not isinstance(commands, Mapping):
+                continue
+            for command, output in commands.items():
+                if command.strip().lower() == FLOW_COMMAND and isinstance(output, Mapping):
+                    index.add_flows(host, output)
+        return index
+
+    def add_flows(self, host, flows):
+        """
+        Index the parsed 'inspect flow brief' output of a host.
+
+        Args:
+            host (str): The host the output was collected from.
+            flows (dict): Flow records keyed by flow key.
+        """
+        host_postings = self.hosts.setdefault(host, [])
+        columns = self.columns
+        indexed_columns = self.indexed_columns
+        for key, flow in flows.items():
+            if not isinstance(flow, Mapping):
+                continue
+            number = len(self.flows)
+            self.flows.append((host, key, flow))
+            host_postings.append(number)
+            for column, value in flow.items():
+                if column not in indexed_columns:
+                    continue
+                postings = columns.get(column)
+                if postings is None:
+                    postings = columns[column] = {}
+                numbers = postings.get(value)
+                if numbers is None:
+                    postings[value] = [number]
+                else:
+                    numbers.append(number)
+
+    def __len__(self):
+        return len(self.flows)
+
+    def query(self, hosts=None, filters=None, subnets=None):
+        """
+        Return the numbers of the flows that match all filters.
+
+        Args:
+            hosts (list, optional): Only match flows of these hosts.
+            filters (dict, optional): Column name to the accepted value or list of values.
+            subnets (dict, optional): Address column name to a subnet the address must be in.
+
+        Returns:
+            list: The sorted flow numbers, or None if no filter was given (all flows match).
+
+        Raises:
+            ValueError: If a subnet is not a valid network.
+        """
+        candidates = []
+        # (column, test) pairs of the filters on columns without posting lists
+        scans = []
+        if hosts:
+            candidates.append(self._union(self.hosts.get(host, ()) for host in hosts))
+        for column, values in (filters or {}).items():
+            if isinstance(values, str) or not hasattr(values, "__iter__"):
+                values = [values]
+            if column not in self.indexed_columns:
+                scans.append((column, frozenset(values).__contains__))
+                continue
+            postings = self.columns.get(column, {})
+            candidates.append(self._union(postings.get(value, ()) for value in values))
+        for column, subnet in (subnets or {}).items():
+            network = ipaddress.ip_network(subnet, strict=False)
+            if column not in self.indexed_columns:
+                scans.append((column, _network_test(network)))
+                continue
+            postings = self.columns.get(column, {})
+            # Only the distinct addresses are checked against the subnet
+            candidates.append(self._union(
+                numbers for value, numbers in postings.items() if _in_network(value, network)
+            ))
+        if not candidates and not scans:
+            return None
+
+        if candidates:
+            candidates.sort(key=len)
+            matched = candidates[0]
+            for other in candidates[1:]:
+                if not matched:
+                    break
+                other = set(other)
+                matched = [number for number in matched if number in other]
+        else:
+            matched = range(len(self.flows))
+        if scans:
+            flows = self.flows
+            matched = [
+                number for number in matched
+                if all(test(flows[number][2].get(column)) for column, test in scans)
+            ]
+        return matched
+
+    def records(self, numbers, limit=None):
+        """
+        Return the flows with the given numbers.
+
+        Args:
+            numbers (list): Flow numbers as returned by query, or None for all flows.
+            limit (int, optional): Maximum number of flows to return.
+
+        Returns:
+            list: Dictionaries with the host, the flow key and the flow columns.
+        """
+        if numbers is None:
+            numbers = range(len(self.flows))
+        if limit is not None:
+            numbers = numbers[:limit]
+        results = []
+        for number in numbers:
+            host, key, flow = self.flows[number]
+            result = {"host": host, "key": key}
+            result.update(flow)
+            results.append(result)
+        return results
+
+    def top(self, column, numbers=None, count=10):
+        """
+        Return the most common values of a column.
+
+        Args:
+            column (str): The column to aggregate, or 'host'.
+            numbers (list, optional): Flow numbers as returned by query, None for all flows.
+            count (int): Number of values to return.
+
+        Returns:
+            list: (value, number of flows) tuples, most common first.
+        """
+        if numbers is None and (column == "host" or column in self.indexed_columns):
+            postings = self.hosts if column == "host" else self.columns.get(column, {})
+            counts = Counter({value: len(numbers) for value, numbers in postings.items()})
+        elif column == "host":
+            counts = Counter(self.flows[number][0] for number in numbers)
+        elif numbers is None:
+            counts = Counter(flow.get(column) for _, _, flow in self.flows)
+            counts.pop(None, None)
+        else:
+            counts = Counter(self.flows[number][2].get(column) for number in numbers)
+            counts.pop(None, None)
+        return counts.most_common(count)
+
+    @staticmethod
+    def _union(postings):
+        """Merge posting lists into one sorted list of flow numbers."""
+        postings = [numbers for numbers in postings if numbers]
+        if len(postings) == 1:
+            return postings[0]
+        return sorted(set().union(*postings))
+
+
+def _network_test(network):
+    """Return a test whether an address is in a network."""
+    return lambda value: _in_network(value, network)
+
+
+def _in_network(value, network):
+    try:
+        return ipaddress.ip_address(value) in network
+    except ValueError:
+        return False
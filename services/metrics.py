@@ -0,0 +1,194 @@
+from contextlib import contextmanager
+import threading
+import time
+
+# Upper bounds of the duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Stages spent talking to a network element, summed up for the slowest hosts of a sweep
+DEVICE_STAGES = ("connect", "execute", "stream")
+
+# Stages that include parsing an output, summed up for the slowest parsers of a sweep
+PARSE_STAGES = ("parse", "stream")
+
+METRIC_PREFIX = "network_manager"
+
+
+class Metrics:
+    """
+    Timing histograms and output sizes of the collection pipeline.
+
+    Durations are recorded per stage, host and command and rendered in the
+    Prometheus text exposition format by render(). The observations since
+    the last start_sweep() are also kept in aggregated form, for the timing
+    summary attached to every snapshot.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS, host_labels=True):
+        """
+        Initialize the Metrics.
+
+        Args:
+            buckets (tuple): Upper bounds of the histogram buckets in seconds.
+            host_labels (bool): Label the histograms with the host; without it,
+                the number of series does not grow with the number of elements.
+        """
+        self.buckets = tuple(buckets)
+        self.host_labels = host_labels
+        # Maps (stage, host, command) to the bucket counts followed by the sum and the count
+        self._histograms = {}
+        # Maps (host, command) to the number of output bytes collected
+        self._output_bytes = {}
+        self._lock = threading.Lock()
+        self.start_sweep()
+
+    def observe(self, stage, seconds, host="", command=""):
+        """
+        Record the duration of a stage.
+
+        Args:
+            stage (str): The stage, e.g. 'connect', 'execute' or 'parse'.
+            seconds (float): The duration.
+            host (str, optional): The network element the stage ran for.
+            command (str, optional): The command the stage ran for.
+        """
+        key = (stage, host if self.host_labels else "", command)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 3)
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[index] += 1
+                    break
+            else:
+                histogram[len(self.buckets)] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+            totals = self._sweep_stages.setdefault(stage, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+            if host and stage in DEVICE_STAGES:
+                self._sweep_hosts[host] = self._sweep_hosts.get(host, 0.0) + seconds
+            if command and stage in PARSE_STAGES:
+                totals = self._sweep_parsers.setdefault(command, [0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += seconds
+                totals[2] = max(totals[2], seconds)
+
+    @contextmanager
+    def timer(self, stage, host="", command=""):
+        """
+        Time the enclosed block as a stage, also when it raises.
+
+        Args:
+            stage (str): The stage.
+            host (str, optional): The network element the stage runs for.
+            command (str, optional): The command the stage runs for.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, host, command)
+
+    def add_output_bytes(self, host, command, size):
+        """
+        Record the size of a command output.
+
+        Args:
+            host (str): The network element the output was collected from.
+            command (str): The command that produced the output.
+            size (int): The size of the output.
+        """
+        key = (host if self.host_labels else "", command)
+        with self._lock:
+            self._output_bytes[key] = self._output_bytes.get(key, 0) + size
+            self._sweep_bytes += size
+
+    def start_sweep(self):
+        """
+        Start aggregating the observations of a new sweep for sweep_summary.
+        """
+        with self._lock:
+            self._sweep_started = time.monotonic()
+            self._sweep_stages = {}
+            self._sweep_hosts = {}
+            self._sweep_parsers = {}
+            self._sweep_bytes = 0
+
+    def sweep_summary(self, top=5):
+        """
+        Summarize the observations since the last start_sweep.
+
+        Args:
+            top (int): Number of the slowest hosts and parsers to list.
+
+        Returns:
+            dict: Totals per stage, the slowest hosts and parsers, and the output bytes of the sweep.
+        """
+        with self._lock:
+            stages = {
+                stage: {"count": count, "total": round(total, 6), "max": round(maximum, 6)}
+                for stage, (count, total, maximum) in self._sweep_stages.items()
+            }
+            hosts = sorted(self._sweep_hosts.items(), key=lambda item: item[1], reverse=True)[:top]
+            parsers = sorted(self._sweep_parsers.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            return {
+                "duration": round(time.monotonic() - self._sweep_started, 6),
+                "stages": stages,
+                "slowest_hosts": [{"host": host, "seconds": round(seconds, 6)} for host, seconds in hosts],
+                "slowest_parsers": [
+                    {"command": command, "count": count, "total": round(total, 6), "max": round(maximum, 6)}
+                    for command, (count, total, maximum) in parsers
+                ],
+                "output_bytes": self._sweep_bytes,
+            }
+
+    def render(self):
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics page.
+        """
+        with self._lock:
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+            output_bytes = dict(self._output_bytes)
+
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Duration of the stages of snapshot collection and serving.",
+            f"# TYPE {name} histogram",
+        ]
+        bounds = [_format_number(bound) for bound in self.buckets] + ["+Inf"]
+        for (stage, host, command), values in sorted(histograms.items()):
+            labels = _labels(stage=stage, host=host, command=command)
+            cumulative = 0
+            for bound, count in zip(bounds, values):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {_format_number(values[-2])}")
+            lines.append(f"{name}_count{{{labels}}} {values[-1]}")
+
+        name = f"{METRIC_PREFIX}_output_bytes_total"
+        lines.append(f"# HELP {name} Size of the collected command outputs.")
+        lines.append(f"# TYPE {name} counter")
+        for (host, command), size in sorted(output_bytes.items()):
+            lines.append(f"{name}{{{_labels(host=host, command=command)}}} {size}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(**labels):
+    """Format the non-empty labels of a series."""
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items() if value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
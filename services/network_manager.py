@@ -1,40 +1,107 @@
-from netmiko import ConnectHandler
+from services.session_pool import SessionPool
+from services.snapshot_diff import iter_changes
+from services.diff_report import select_changes
+from services.diff_cache import DiffCache
+from services.snapshot_encoding import EncodedSnapshot
+from services.prefix_index import FIB_COMMAND, PrefixIndex
+from services.flow_index import FlowIndex
+from services.compact_snapshot import pack_snapshot
+from services.snapshot_file import SnapshotFile, write_snapshot_file
+from services.command_parsers.inspect_fib_all import PREFIX_FIELDS
+from services.snapshot_hash import build_snapshot_hashes, combine_nodes, hash_command_output
+from services.parse_pool import parse_and_hash
+from services.parse_cache import ParseCache
+from services.command_batch import run_batch
+from services.command_stream import ChannelLineReader
+from services.metrics import Metrics
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+import threading
+import uuid
 import yaml
-from deepdiff import DeepDiff
 from pathlib import Path
 import json
-import html
-import json
 
-import json
-from deepdiff.model import PrettyOrderedSet
-
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, PrettyOrderedSet):
-            return list(o)
-        return super().default(o)
-    
+REFERENCE_SNAPSHOT_FILE = Path(__file__).resolve().parent / "../static/reference_snapshot.snap"
+# Reference snapshot written by earlier versions, converted on first load
+LEGACY_REFERENCE_SNAPSHOT_FILE = Path(__file__).resolve().parent / "../static/reference_snapshot.json"
+
 class NetworkManager:
-    def __init__(self, elements):
+    def __init__(self, elements, max_workers=32, connect_timeout=20, command_timeout=60, session_pool=None,
+                 diff_cache_size=16, compact_snapshots=True, parse_pool=None, parse_cache=None,
+                 batch_commands=False, max_output_size=None, stream_commands=(), metrics=None):
         """
         Initialize the NetworkManager with network elements.
 
         Args:
             elements (dict): Dictionary containing network element details.
+            max_workers (int): Maximum number of network elements handled concurrently.
+            connect_timeout (int): Seconds to wait for an SSH connection to be established.
+            command_timeout (int): Seconds to wait for the output of a single command.
+            session_pool (SessionPool, optional): Pool of SSH sessions kept alive between snapshots.
+            diff_cache_size (int): Number of diff results kept in memory.
+            compact_snapshots (bool): Keep the previous and reference snapshots in their
+                compact form, see services.compact_snapshot.
+            parse_pool (ParsePool, optional): Pool of processes that parse command outputs;
+                outputs are parsed on the collecting threads when omitted.
+            parse_cache (ParseCache, optional): Cache of parsed outputs, so unchanged outputs
+                are not parsed again.
+            batch_commands (bool): Send all commands of an element in one channel interaction.
+            max_output_size (int, optional): Characters kept of a single command output in batches
+                and streams.
+            stream_commands (iterable): Commands whose output is parsed line by line while
+                it is read from the channel, see collect.
+            metrics (Metrics, optional): Records the duration of every stage of a sweep.
         """
         self.elements = elements
+        self.max_workers = max_workers
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self.batch_commands = batch_commands
+        self.max_output_size = max_output_size
+        self.stream_commands = set(stream_commands)
+        self.session_pool = session_pool if session_pool is not None else SessionPool()
+        self.parse_pool = parse_pool
+        self.parse_cache = parse_cache if parse_cache is not None else ParseCache()
+        self.metrics = metrics if metrics is not None else Metrics()
         self.connections = {}
+        self._connection_params = {}
+        self._connections_lock = threading.Lock()
         self.parsed_data = {}
         self.previous_snapshot = {}
         self.current_snapshot = {}
         self.reference_snapshot = {}
-        self.diff_html_path = None
+        # IDs and timestamps of the snapshots
+        self.previous_snapshot_id = None
+        self.previous_snapshot_time = None
+        self.current_snapshot_id = None
+        self.current_snapshot_time = None
+        self.reference_snapshot_id = None
+        self.reference_file = None
+        # Content hash trees of the snapshots, see services.snapshot_hash
+        self.collected_hashes = None
+        self.previous_snapshot_hashes = None
+        self.current_snapshot_hashes = None
+        self.reference_snapshot_hashes = None
+        # Snapshots serialized once, for the snapshot GET endpoints
+        self.previous_snapshot_encoded = None
+        self.current_snapshot_encoded = None
+        # Prefix index of the FIB of the current snapshot
+        self.prefix_index = PrefixIndex()
+        # Flow column indexes of the current snapshot
+        self.flow_index = FlowIndex()
+        self.compact_snapshots = compact_snapshots
+        self.diff_cache = DiffCache(diff_cache_size)
+        # Held while the snapshots and their indexes are published or read together
+        self._snapshot_lock = threading.RLock()
 
     def connect_ssh(self, element):
         """
         Connect to a network element using SSH.
 
+        Sessions are taken from the session pool, so an element that was
+        connected during a previous snapshot skips the SSH handshake and login.
+
         Args:
             element (dict): Dictionary containing network element details.
 
@@ -43,13 +110,19 @@ class NetworkManager:
         """
         try:
             print(f"Connecting to {element['host']}...")
-            connection = ConnectHandler(
-                device_type=element['device_type'],
-                ip=element['host'],
-                username=element['username'],
-                password=element['password'],
-            )
-            self.connections[element.get('name',element['host'])] = connection
+            name = element.get('name', element['host'])
+            params = {
+                'device_type': element['device_type'],
+                'ip': element['host'],
+                'username': element['username'],
+                'password': element['password'],
+                'conn_timeout': self.connect_timeout,
+            }
+            with self.metrics.timer("connect", name):
+                connection = self.session_pool.acquire(name, params)
+            with self._connections_lock:
+                self.connections[name] = connection
+                self._connection_params[name] = params
             print(f"Connected to {element.get('name'),element['host']}")
             return True
         except Exception as e:
@@ -86,24 +159,211 @@ class NetworkManager:
         """
         connection_status = {}
         print("Connecting to network elements...")
-        for ele in self.elements:
-            element = self.elements.get(ele)
-            host = element['host']
-            login_type = element['login_type']
-
-            if login_type == 'ssh':
-                success = self.connect_ssh(element)
-                connection_status[host] = success
-            elif login_type == 'rest':
-                # Implement REST connection logic
-                pass
-            else:
-                print(f"Invalid login type '{login_type}' for {host}")
-                connection_status[host] = False
+        elements = [self.elements.get(ele) for ele in self.elements]
+        with ThreadPoolExecutor(max_workers=self._worker_count(len(elements))) as executor:
+            results = executor.map(self.connect_element, elements)
+            for element, success in zip(elements, results):
+                if success is not None:
+                    connection_status[element['host']] = success
 
         print("Connection process completed")
         return connection_status
 
+    def connect_element(self, element):
+        """
+        Connect to a single network element according to its login type.
+
+        Args:
+            element (dict): Dictionary containing network element details.
+
+        Returns:
+            bool: True if the connection is successful, False if it failed,
+                None if the login type has no connection logic yet.
+        """
+        host = element['host']
+        login_type = element['login_type']
+
+        if login_type == 'ssh':
+            return self.connect_ssh(element)
+        elif login_type == 'rest':
+            # Implement REST connection logic
+            return None
+        else:
+            print(f"Invalid login type '{login_type}' for {host}")
+            return False
+
+    def collect(self, commands, parse_func=None, progress_callback=None, line_parse_func=None):
+        """
+        Connect to all network elements and execute commands on them concurrently.
+
+        Up to ``max_workers`` elements are handled at the same time, so the
+        duration of a sweep is bound by the slowest element rather than the
+        sum of all of them. With a parse pool, outputs are parsed in other
+        processes while the collecting threads move on to the next elements.
+        Results are aggregated in element order.
+
+        Args:
+            commands (list): List of commands to execute.
+            parse_func (callable, optional): Called as ``parse_func(command, output)``
+                for every command output; the raw output is kept when omitted.
+            progress_callback (callable, optional): Called as ``progress_callback(hostname, status)``
+                whenever an element moves to the next stage of the sweep.
+            line_parse_func (callable, optional): Called as ``line_parse_func(command, lines)``
+                for the outputs of ``stream_commands``, with the lines as they are read
+                from the channel; those outputs are never held as a whole.
+
+        Returns:
+            dict: Dictionary mapping hostname to a dictionary of command results.
+                Elements that failed to connect are left out. The content hash
+                tree of the results is stored in collected_hashes.
+        """
+        collected = {}
+        host_hashes = {}
+        report = progress_callback or (lambda hostname, status: None)
+        elements = [self.elements.get(ele) for ele in self.elements]
+        print(f"Collecting from {len(elements)} network elements...")
+        self.metrics.start_sweep()
+        for element in elements:
+            report(element.get('name', element['host']), "pending")
+        with ThreadPoolExecutor(max_workers=self._worker_count(len(elements))) as executor:
+            futures = [executor.submit(self._collect_element, element, commands, parse_func, report, line_parse_func) for element in elements]
+            for element, future in zip(elements, futures):
+                hostname = element.get('name', element['host'])
+                try:
+                    parsed = future.result()
+                    if parsed is None:
+                        continue
+                    results = {}
+                    command_hashes = {}
+                    for command, parse_future in zip(commands, parsed):
+                        results[command], command_hashes[command] = parse_future.result()
+                except Exception as e:
+                    print(f"Failed to collect from {hostname}: {str(e)}")
+                    report(hostname, "failed")
+                    continue
+                collected[hostname] = results
+                host_hashes[hostname] = combine_nodes(command_hashes)
+                report(hostname, "completed")
+
+        self.collected_hashes = combine_nodes(host_hashes)
+        self.parse_cache.retain(element.get('name', element['host']) for element in elements)
+        print("Collection process completed")
+        return collected
+
+    def _collect_element(self, element, commands, parse_func, report, line_parse_func=None):
+        """
+        Connect to a network element, execute commands on it and hand the outputs to the parse stage.
+
+        Args:
+            element (dict): Dictionary containing network element details.
+            commands (list): List of commands to execute.
+            parse_func (callable, optional): Parser applied to every command output.
+            report (callable): Progress callback of the sweep.
+            line_parse_func (callable, optional): Line parser of the streamed commands.
+
+        Returns:
+            list: One future per command, resolving to the (parsed) output and its
+                hash node, or None if the element could not be connected.
+        """
+        hostname = element.get('name', element['host'])
+        report(hostname, "connecting")
+        if not self.connect_element(element):
+            print(f"\nSkipping commands on {hostname}. Failed to connect.")
+            report(hostname, "failed")
+            return None
+
+        print(f"\nExecuting commands on {hostname}:")
+        report(hostname, "executing")
+        streamed = {}
+        if line_parse_func is not None:
+            streamed = {command: None for command in commands if command in self.stream_commands}
+        buffered = [command for command in commands if command not in streamed]
+        with self.metrics.timer("execute", hostname):
+            outputs = dict(zip(buffered, self.execute_commands(hostname, buffered)))
+        for command in streamed:
+            streamed[command] = self._stream_command(hostname, command, parse_func, line_parse_func)
+        report(hostname, "parsing")
+        parsed = []
+        for command in commands:
+            if command in streamed:
+                parsed.append(streamed[command])
+                continue
+            output = outputs[command]
+            cache_key, cached = self.parse_cache.lookup(hostname, command, output)
+            if cached is not None:
+                # The output did not change since the last sweep, reuse its parsed result
+                future = Future()
+                future.set_result(cached)
+            elif parse_func is not None and self.parse_pool is not None:
+                future = self.parse_pool.submit(
+                    parse_func, command, output,
+                    lambda seconds, command=command: self.metrics.observe("parse", seconds, hostname, command),
+                )
+                future.add_done_callback(self._parse_cache_callback(cache_key))
+            else:
+                future = Future()
+                try:
+                    with self.metrics.timer("parse", hostname, command):
+                        future.set_result(parse_and_hash(parse_func, command, output))
+                    self.parse_cache.store(cache_key, future.result())
+                except Exception as e:
+                    future.set_exception(e)
+            parsed.append(future)
+        return parsed
+
+    def _stream_command(self, hostname, command, parse_func, line_parse_func):
+        """
+        Execute a command and parse its output while it is read from the channel.
+
+        If streaming fails, the session is replaced and the command is run
+        again with send_command.
+
+        Args:
+            hostname (str): Hostname or IP address of the network element.
+            command (str): The command to execute.
+            parse_func (callable, optional): Parser used when streaming fails.
+            line_parse_func (callable): Called as ``line_parse_func(command, lines)``.
+
+        Returns:
+            Future: Resolved future of the parsed output and its hash node.
+        """
+        future = Future()
+        connection = self.connections.get(hostname)
+        try:
+            reader = ChannelLineReader(connection, command, self.command_timeout, self.max_output_size)
+            with self.metrics.timer("stream", hostname, command):
+                result = line_parse_func(command, reader)
+                # The parser may stop early, the channel has to be back at the prompt for the next command
+                if not reader.drain():
+                    raise reader.error
+            self.metrics.add_output_bytes(hostname, command, reader.size)
+            print(f"Command: {command}")
+            print(f"Output: {reader.line_count} lines streamed" + (" (truncated)" if reader.truncated else ""))
+            future.set_result((result, hash_command_output(result)))
+            return future
+        except Exception as e:
+            print(f"Streaming '{command}' on {hostname} failed, falling back to send_command: {str(e)}")
+        try:
+            self._reconnect(hostname, connection)
+            with self.metrics.timer("execute", hostname):
+                output = self.execute_commands(hostname, [command])[0]
+            with self.metrics.timer("parse", hostname, command):
+                future.set_result(parse_and_hash(parse_func, command, output))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _parse_cache_callback(self, cache_key):
+        """Return a future callback that caches the parsed result of an output."""
+        def store(future):
+            if future.exception() is None:
+                self.parse_cache.store(cache_key, future.result())
+        return store
+
+    def _worker_count(self, element_count):
+        """Return the number of worker threads to use for the given number of elements."""
+        return max(1, min(self.max_workers, element_count))
+
     def execute_commands(self, hostname, commands):
         """
         Execute commands on a network element.
@@ -121,9 +381,30 @@ class NetworkManager:
 
         print(f"Executing commands on {hostname}...")
         results = []
-        for command in commands:
+        if self.batch_commands and len(commands) > 1:
             try:
-                output = connection.send_command(command)
+                results = run_batch(connection, commands, self.command_timeout, self.max_output_size)
+            except Exception as e:
+                # Run the remaining commands one by one on a fresh session
+                print(f"Batched execution on {hostname} failed, falling back to single commands: {str(e)}")
+                results = list(getattr(e, "outputs", []))
+                connection = self._reconnect(hostname, connection)
+            for command, output in zip(commands, results):
+                self.metrics.add_output_bytes(hostname, command, len(output))
+                print(f"Command: {command}")
+                print(f"Output: {output}")
+        for command in commands[len(results):]:
+            try:
+                with self.metrics.timer("command", hostname, command):
+                    try:
+                        output = connection.send_command(command, read_timeout=self.command_timeout)
+                    except Exception:
+                        if SessionPool.is_alive(connection):
+                            raise
+                        # The session broke, reconnect transparently and retry once
+                        connection = self._reconnect(hostname, connection)
+                        output = connection.send_command(command, read_timeout=self.command_timeout)
+                self.metrics.add_output_bytes(hostname, command, len(output))
                 print(f"Command: {command}")
                 print(f"Output: {output}")
                 results.append(output)
@@ -133,89 +414,285 @@ class NetworkManager:
         print(f"Command execution on {hostname} completed")
         return results
 
+    def _reconnect(self, hostname, connection):
+        """
+        Replace a broken connection to a network element.
+
+        Args:
+            hostname (str): Hostname or IP address of the network element.
+            connection (object): The broken connection.
+
+        Returns:
+            object: The new connection.
+        """
+        connection = self.session_pool.reconnect(hostname, connection, self._connection_params[hostname])
+        with self._connections_lock:
+            self.connections[hostname] = connection
+        return connection
+
     def disconnect_elements(self):
         """
         Disconnect from all network elements.
+
+        The sessions are handed back to the session pool, which keeps them
+        alive for the next snapshot. Use close_sessions to close them.
         """
         print("Disconnecting from network elements...")
         for hostname, connection in self.connections.items():
-            try:
-                connection.disconnect()
-                print(f"Disconnected from {hostname}")
-            except Exception as e:
-                print(f"Failed to disconnect from {hostname}: {str(e)}")
+            self.session_pool.release(hostname, connection)
+            print(f"Released session to {hostname}")
 
         self.connections = {}
+        self._connection_params = {}
 
         print("Disconnection process completed")
 
-    def compare_snapshots(self, use_reference=False):
-        
-        # Compare the current and previous snapshots
-        if use_reference:
-            try : 
-                reference_snapshot_file = Path(__file__).resolve().parent / "../static/reference_snapshot.json"
-                with open(reference_snapshot_file, "r") as f:
-                    reference_snapshot = json.load(f)
-            except : 
-                print("no Reference snap shot found")
-            diff = DeepDiff(reference_snapshot,self.current_snapshot)
-        else:
-            diff = DeepDiff(self.previous_snapshot, self.current_snapshot)
-
-        # Generate the HTML file content
-        html_content = """
-        <html>
-        <head>
-            <link rel="stylesheet" href="/static/bootstrap.min.css">
-            <script src="/static/bootstrap.bundle.min.js"></script>
-            <style>
-                .change-type {
-                    font-size: 1.2rem;
-                    font-weight: bold;
-                    margin-top: 2rem;
-                }
-                .change-key {
-                    font-size: 1.1rem;
-                    font-weight: bold;
-                    margin-top: 1rem;
-                }
-                .change-value {
-                    font-size: 1rem;
-                    margin-top: 0.5rem;
+    def close_sessions(self):
+        """
+        Close all SSH sessions kept in the session pool.
+        """
+        self.disconnect_elements()
+        self.session_pool.close_all()
+        print("All sessions closed")
+
+    def update_snapshot(self, parsed_data, hashes=None, snapshot_id=None, timestamp=None):
+        """
+        Make newly collected data the current snapshot.
+
+        The current snapshot becomes the previous snapshot. The ID, encoding
+        and indexes of the new snapshot are built first and then published
+        together, so concurrent readers never pair the new data with the old ID
+        or indexes.
+
+        Args:
+            parsed_data (dict): The collected data, keyed by host and command.
+            hashes (dict, optional): Hash tree of the data; computed when omitted.
+            snapshot_id (str, optional): ID of the snapshot; generated when omitted.
+            timestamp (datetime, optional): Time the snapshot was taken; now when omitted.
+        """
+        if hashes is None:
+            hashes = build_snapshot_hashes(parsed_data)
+        snapshot_id = snapshot_id or uuid.uuid4().hex
+        timestamp = timestamp or datetime.now(timezone.utc)
+        with self.metrics.timer("encode"):
+            encoded = EncodedSnapshot(parsed_data, hashes["hash"])
+        with self.metrics.timer("index"):
+            prefix_index = PrefixIndex.from_snapshot(parsed_data)
+            flow_index = FlowIndex.from_snapshot(parsed_data)
+        retained = self._retained_snapshot()
+
+        with self._snapshot_lock:
+            self.previous_snapshot = retained
+            self.previous_snapshot_hashes = self.current_snapshot_hashes
+            self.previous_snapshot_id = self.current_snapshot_id
+            self.previous_snapshot_time = self.current_snapshot_time
+            self.previous_snapshot_encoded = self.current_snapshot_encoded
+            self.current_snapshot = parsed_data
+            self.current_snapshot_hashes = hashes
+            self.current_snapshot_encoded = encoded
+            self.current_snapshot_id = snapshot_id
+            self.current_snapshot_time = timestamp
+            self.prefix_index = prefix_index
+            self.flow_index = flow_index
+            # Every cached diff involves the replaced current snapshot
+            self.diff_cache.invalidate()
+
+    def snapshot_view(self, previous=False):
+        """
+        Return the current or previous snapshot together with its ID, encoding and indexes.
+
+        Args:
+            previous (bool): Return the previous snapshot instead of the current one.
+
+        Returns:
+            dict: The snapshot, snapshot_id, timestamp, hashes and encoded snapshot; for the
+                current snapshot also its prefix_index and flow_index.
+        """
+        with self._snapshot_lock:
+            if previous:
+                return {
+                    "snapshot": self.previous_snapshot,
+                    "snapshot_id": self.previous_snapshot_id,
+                    "timestamp": self.previous_snapshot_time,
+                    "hashes": self.previous_snapshot_hashes,
+                    "encoded": self.previous_snapshot_encoded,
                 }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>Differences between Current and Previous Snapshots</h1>
-        """
-
-        # Add the differences to the HTML content
-        for change_type, changes in diff.items():
-            html_content += f'<div class="change-type">{change_type}</div>'
-            if isinstance(changes, dict):
-                for key, value in changes.items():
-                    html_content += f'<div class="change-key">{key}</div>'
-                    html_content += f'<pre class="change-value">{html.escape(json.dumps(value, indent=4, cls=CustomJSONEncoder))}</pre>'
-            elif isinstance(changes, list):
-                html_content += '<pre class="change-value">'
-                for value in changes:
-                    html_content += f'{html.escape(json.dumps(value, indent=4, cls=CustomJSONEncoder))}\n'
-                html_content += '</pre>'
-
-        html_content += """
-            </div>
-        </body>
-        </html>
-        """
-
-        # Save the HTML content to a file
-        file_path = Path(__file__).resolve().parent / "../static/diff.html"
-        with open(file_path, "w") as f:
-            f.write(html_content)
-
-        # Generate a link to the HTML diff file
-        diff_file_link = f"/static/diff.html"
-        self.diff_html_path = diff_file_link
-        return str(diff_file_link)
+            return {
+                "snapshot": self.current_snapshot,
+                "snapshot_id": self.current_snapshot_id,
+                "timestamp": self.current_snapshot_time,
+                "hashes": self.current_snapshot_hashes,
+                "encoded": self.current_snapshot_encoded,
+                "prefix_index": self.prefix_index,
+                "flow_index": self.flow_index,
+            }
+
+    def prefix_paths(self, matches, snapshot=None):
+        """
+        Look up the FIB paths of prefix index matches in a snapshot.
+
+        Args:
+            matches (list): (prefix, host, Path ID) tuples as returned by the PrefixIndex queries.
+            snapshot (dict, optional): The snapshot the prefix index was built from;
+                the current snapshot when omitted.
+
+        Returns:
+            list: One dictionary per match with the prefix, the host and the path record
+                without its prefix lists.
+        """
+        if snapshot is None:
+            snapshot = self.current_snapshot
+        results = []
+        for prefix, host, path_id in matches:
+            fib = next((output for command, output in snapshot.get(host, {}).items()
+                        if command.strip().lower() == FIB_COMMAND), {})
+            path = fib.get(path_id, {})
+            result = {"prefix": prefix, "host": host}
+            result.update((key, value) for key, value in path.items() if key not in PREFIX_FIELDS.values())
+            result.setdefault("Path ID", path_id)
+            results.append(result)
+        return results
+
+    def save_reference_snapshot(self):
+        """
+        Save the current snapshot as the reference snapshot.
+
+        The reference is written in the binary snapshot format and then used
+        memory-mapped. The reference file is only rewritten when the content of
+        the current snapshot differs from the saved reference.
+
+        Returns:
+            bool: True if the reference file was written, False if it was unchanged.
+        """
+        if self.current_snapshot_hashes is None:
+            self.current_snapshot_hashes = build_snapshot_hashes(self.current_snapshot)
+        self.load_reference_snapshot()
+        if (self.reference_snapshot_hashes is not None
+                and self.reference_snapshot_hashes["hash"] == self.current_snapshot_hashes["hash"]):
+            print("Reference snapshot unchanged")
+            return False
+
+        write_snapshot_file(REFERENCE_SNAPSHOT_FILE, self.current_snapshot, self.current_snapshot_hashes,
+                            self.current_snapshot_id, self.current_snapshot_time)
+        self._open_reference_file()
+        self.diff_cache.invalidate(lambda key: key[0] == "reference")
+        return True
+
+    def load_reference_snapshot(self):
+        """
+        Open the saved reference snapshot, unless it is open already.
+
+        Only the section index is read; hosts and commands are loaded when a
+        comparison first needs them. A JSON reference written by an earlier
+        version is converted to the binary format.
+
+        Returns:
+            bool: True if a reference snapshot is available.
+        """
+        if self.reference_snapshot_hashes is not None:
+            return True
+        try:
+            if not REFERENCE_SNAPSHOT_FILE.exists() and LEGACY_REFERENCE_SNAPSHOT_FILE.exists():
+                with open(LEGACY_REFERENCE_SNAPSHOT_FILE, "r") as f:
+                    write_snapshot_file(REFERENCE_SNAPSHOT_FILE, json.load(f))
+            if not REFERENCE_SNAPSHOT_FILE.exists():
+                return False
+            self._open_reference_file()
+            return True
+        except Exception as e:
+            print(f"Failed to load the reference snapshot: {str(e)}")
+            return False
+
+    def _open_reference_file(self):
+        """
+        Make the reference snapshot file the reference snapshot.
+
+        The previously opened reference file is closed. A previous snapshot
+        that still reads from it is loaded into memory first.
+        """
+        reference_file = SnapshotFile(REFERENCE_SNAPSHOT_FILE)
+        with self._snapshot_lock:
+            if self.reference_file is not None:
+                if self.previous_snapshot is self.reference_file.snapshot:
+                    self.previous_snapshot = pack_snapshot(self.previous_snapshot)
+                self.reference_file.close()
+            self.reference_file = reference_file
+            self.reference_snapshot = reference_file.snapshot
+            self.reference_snapshot_hashes = reference_file.hashes
+            # References converted from JSON have no ID, their content hash identifies them
+            self.reference_snapshot_id = reference_file.snapshot_id or reference_file.hashes["hash"]
+
+    def _retained_snapshot(self):
+        """
+        Return the current snapshot in the form it is kept in as previous or reference snapshot.
+
+        The memory-mapped reference snapshot is shared when the current snapshot is also
+        the reference snapshot.
+        """
+        if not self.compact_snapshots or not self.current_snapshot:
+            return self.current_snapshot
+        if self.reference_snapshot_id is not None and self.reference_snapshot_id == self.current_snapshot_id:
+            return self.reference_snapshot
+        return pack_snapshot(self.current_snapshot)
+
+    def baseline_snapshot(self, use_reference=False):
+        """
+        Return the snapshot the current snapshot is compared with, and its hash tree.
+
+        Args:
+            use_reference (bool): Use the reference snapshot instead of the previous snapshot.
+
+        Returns:
+            tuple: The baseline snapshot and its hash tree (None if unknown).
+        """
+        if not use_reference:
+            return self.previous_snapshot, self.previous_snapshot_hashes
+        if self.load_reference_snapshot():
+            return self.reference_snapshot, self.reference_snapshot_hashes
+        print("no Reference snap shot found")
+        return {}, None
+
+    def diff_identity(self, use_reference=False):
+        """
+        Return the identity of the snapshot pair compared by snapshot_changes.
+
+        Args:
+            use_reference (bool): Compare with the reference snapshot instead of the previous snapshot.
+
+        Returns:
+            tuple: Key of the diff result in the diff cache.
+        """
+        if not use_reference:
+            return ("previous", self.previous_snapshot_id, self.current_snapshot_id)
+        if not self.load_reference_snapshot():
+            return ("reference", None, self.current_snapshot_id)
+        return ("reference", self.reference_snapshot_id, self.current_snapshot_id)
+
+    def snapshot_changes(self, use_reference=False, hosts=None, commands=None):
+        """
+        Compare the current snapshot with the previous or reference snapshot.
+
+        Diff results are cached per snapshot pair until a new snapshot is taken
+        or a new reference snapshot is saved.
+
+        Args:
+            use_reference (bool): Compare with the reference snapshot instead of the previous snapshot.
+            hosts (list, optional): Only report changes on these hosts.
+            commands (list, optional): Only report changes in the output of these commands.
+
+        Returns:
+            list: The changes, see snapshot_diff.iter_changes, grouped by change type.
+        """
+        with self._snapshot_lock:
+            key = self.diff_identity(use_reference)
+            baseline, baseline_hashes = self.baseline_snapshot(use_reference)
+            current, current_hashes = self.current_snapshot, self.current_snapshot_hashes
+        changes = self.diff_cache.get(key)
+        if changes is None:
+            with self.metrics.timer("diff"):
+                changes = select_changes(iter_changes(baseline, current,
+                                                      old_hashes=baseline_hashes, new_hashes=current_hashes))
+            self.diff_cache.put(key, changes)
+        if hosts or commands:
+            return select_changes(changes, hosts, commands)
+        return changes
@@ -0,0 +1,94 @@
+import hashlib
+import threading
+
+
+class ParseCache:
+    """
+    Parsed command outputs of the last sweep, keyed by host and command.
+
+    Every entry remembers the fingerprint of the raw output and the parser
+    version it was parsed with, so a byte-identical output of the next sweep
+    reuses the parsed result and its hash node instead of being parsed again.
+    """
+
+    def __init__(self, version_func=None):
+        """
+        Initialize the ParseCache.
+
+        Args:
+            version_func (callable, optional): Returns the parser version of a command;
+                entries of other parser versions are not reused.
+        """
+        self.version_func = version_func or (lambda command: 0)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(output):
+        """Return the fingerprint of a raw command output."""
+        if isinstance(output, str):
+            output = output.encode("utf-8", "surrogatepass")
+        return hashlib.blake2b(output, digest_size=16).digest()
+
+    def lookup(self, host, command, output):
+        """
+        Return the cached result of a raw command output.
+
+        Args:
+            host (str): The host the output was collected from.
+            command (str): The command that produced the output.
+            output (str): The raw output.
+
+        Returns:
+            tuple: The cache key to store the parsed result under, and the cached
+                (parsed output, hash node) or None if the output has to be parsed.
+        """
+        key = (host, command, self.version_func(command), self.fingerprint(output))
+        entry = self._entries.get((host, command))
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return key, entry[1]
+        self.misses += 1
+        return key, None
+
+    def store(self, key, result):
+        """
+        Cache the parsed result of a raw command output.
+
+        Args:
+            key (tuple): The key returned by lookup.
+            result (tuple): The parsed output and its hash node.
+        """
+        with self._lock:
+            self._entries[key[:2]] = (key, result)
+
+    def invalidate(self, command=None):
+        """
+        Drop cached results.
+
+        Args:
+            command (str, optional): Only drop the results of this command.
+        """
+        with self._lock:
+            if command is None:
+                self._entries.clear()
+                return
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[1] == command]:
+                del self._entries[entry_key]
+
+    def retain(self, hosts):
+        """
+        Drop the results of hosts that are no longer collected.
+
+        Args:
+            hosts (iterable): The hosts to keep.
+        """
+        hosts = set(hosts)
+        with self._lock:
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[0] not in hosts]:
+                del self._entries[entry_key]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,153 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import threading
+import time
+
+from services.snapshot_hash import hash_command_output
+
+
+def parse_and_hash(parse_func, command, output):
+    """
+    Parse a command output and build the hash node of the result.
+
+    Runs in the worker processes of the parse pool, so hashing is offloaded
+    together with parsing.
+
+    Args:
+        parse_func (callable): Called as ``parse_func(command, output)``; the raw output is kept when None.
+        command (str): The command that produced the output.
+        output (str): The raw output of the command.
+
+    Returns:
+        tuple: The parsed output and its hash node.
+    """
+    result = parse_func(command, output) if parse_func else output
+    return result, hash_command_output(result)
+
+
+def timed_parse_and_hash(parse_func, command, output):
+    """
+    Run parse_and_hash and measure it where it runs.
+
+    Returns:
+        tuple: The result of parse_and_hash and the seconds it took.
+    """
+    start = time.perf_counter()
+    result = parse_and_hash(parse_func, command, output)
+    return result, time.perf_counter() - start
+
+
+class ParsePool:
+    """
+    Process pool that parses command outputs off the SSH threads.
+
+    Submitting blocks while ``max_pending`` outputs are waiting to be parsed,
+    so collection slows down instead of buffering outputs without bound when
+    parsing falls behind. The worker processes are started on first use and
+    replaced by restart(), e.g. after a parser was updated.
+    """
+
+    def __init__(self, processes=None, max_pending=None):
+        """
+        Initialize the ParsePool.
+
+        Args:
+            processes (int, optional): Number of worker processes, the number of CPUs when omitted.
+            max_pending (int, optional): Maximum number of outputs queued for parsing,
+                four per worker process when omitted.
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.max_pending = max_pending or self.processes * 4
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def submit(self, parse_func, command, output, timing_callback=None):
+        """
+        Queue a command output for parsing, waiting while the queue is full.
+
+        Outputs are parsed in the calling thread if the worker processes died.
+
+        Args:
+            parse_func (callable): Picklable parser, called as ``parse_func(command, output)``.
+            command (str): The command that produced the output.
+            output (str): The raw output of the command.
+            timing_callback (callable, optional): Called with the seconds spent parsing,
+                measured in the worker process, so queueing time is left out.
+
+        Returns:
+            Future: Resolves to the parsed output and its hash node.
+        """
+        future = Future()
+        self._slots.acquire()
+        try:
+            task = self._executor().submit(timed_parse_and_hash, parse_func, command, output)
+        except BrokenProcessPool:
+            self._slots.release()
+            self.restart()
+            self._parse_inline(future, parse_func, command, output, timing_callback)
+            return future
+        except Exception:
+            self._slots.release()
+            raise
+
+        def done(task):
+            self._slots.release()
+            try:
+                result, seconds = task.result()
+            except BrokenProcessPool:
+                print(f"Parse worker died while parsing '{command}', parsing it in-process")
+                self.restart()
+                self._parse_inline(future, parse_func, command, output, timing_callback)
+                return
+            except Exception as e:
+                future.set_exception(e)
+                return
+            if timing_callback is not None:
+                timing_callback(seconds)
+            future.set_result(result)
+
+        task.add_done_callback(done)
+        return future
+
+    def restart(self):
+        """
+        Replace the worker processes.
+
+        Outputs that are being parsed finish in the old processes; later
+        outputs go to new processes, which import the parsers afresh.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def close(self):
+        """Stop the worker processes, dropping outputs that are still queued."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawned workers do not inherit the threads and sockets of the server. They
+                # import the main module again, so it must not do any startup work on import
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    @staticmethod
+    def _parse_inline(future, parse_func, command, output, timing_callback=None):
+        try:
+            result, seconds = timed_parse_and_hash(parse_func, command, output)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        if timing_callback is not None:
+            timing_callback(seconds)
+        future.set_result(result)
@@ -0,0 +1,342 @@
+from collections.abc import Mapping
+import socket
+
+from services.command_parsers.inspect_fib_all import PREFIX_FIELDS
+
+# Command whose output is indexed
+FIB_COMMAND = "inspect fib all"
+
+ADDRESS_BITS = {4: 32, 6: 128}
+
+
+class RadixNode:
+    """
+    A node of a path-compressed binary radix (Patricia) tree.
+
+    Nodes without entries only exist where two branches split.
+    """
+
+    __slots__ = ("network", "prefixlen", "entries", "children")
+
+    def __init__(self, network, prefixlen, entries=None):
+        self.network = network
+        self.prefixlen = prefixlen
+        self.entries = entries
+        self.children = [None, None]
+
+
+class RadixTree:
+    """
+    Radix tree of the prefixes of one address family.
+
+    Prefixes are stored as (network integer, prefix length) pairs; every
+    prefix holds the list of entries that were inserted for it.
+    """
+
+    def __init__(self, bits):
+        """
+        Initialize an empty tree.
+
+        Args:
+            bits (int): Address length, 32 for IPv4 and 128 for IPv6.
+        """
+        self.bits = bits
+        self.root = RadixNode(0, 0)
+        self.size = 0
+        # Nodes of the stored prefixes, for exact lookups without walking the tree
+        self._nodes = {}
+
+    def insert(self, network, prefixlen, entry):
+        """
+        Add an entry to a prefix.
+
+        Args:
+            network (int): The network address, host bits cleared.
+            prefixlen (int): The prefix length.
+            entry: The value stored under the prefix.
+        """
+        node = self._nodes.get((network, prefixlen))
+        if node is not None:
+            node.entries.append(entry)
+            return
+        bits = self.bits
+        node = self.root
+        while True:
+            if node.prefixlen == prefixlen:
+                node.entries = [entry]
+                self._add(node)
+                return
+            bit = (network >> (bits - 1 - node.prefixlen)) & 1
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = self._add(RadixNode(network, prefixlen, [entry]))
+                return
+            common = self._common_length(child.network, network, min(child.prefixlen, prefixlen))
+            if common == child.prefixlen:
+                node = child
+                continue
+            if common == prefixlen:
+                # The new prefix sits between the node and the child
+                new = self._add(RadixNode(network, prefixlen, [entry]))
+                new.children[(child.network >> (bits - 1 - prefixlen)) & 1] = child
+            else:
+                # Split the branch where the new prefix and the child diverge
+                new = RadixNode(network & self._mask(common), common)
+                new.children[(child.network >> (bits - 1 - common)) & 1] = child
+                new.children[(network >> (bits - 1 - common)) & 1] = self._add(RadixNode(network, prefixlen, [entry]))
+            node.children[bit] = new
+            return
+
+    def covering(self, network, prefixlen):
+        """
+        Return the nodes of all prefixes that contain a prefix, shortest first.
+
+        The prefix itself is included when it is in the tree; the last node is
+        the longest prefix match.
+        """
+        bits = self.bits
+        node = self.root
+        found = [node] if node.entries is not None else []
+        while node.prefixlen < prefixlen:
+            node = node.children[(network >> (bits - 1 - node.prefixlen)) & 1]
+            if node is None or node.prefixlen > prefixlen or not self._contains(node, network):
+                break
+            if node.entries is not None:
+                found.append(node)
+        return found
+
+    def exact(self, network, prefixlen):
+        """Return the node of a prefix, or None if it is not in the tree."""
+        return self._nodes.get((network, prefixlen))
+
+    def covered(self, network, prefixlen):
+        """
+        Yield the nodes of all prefixes contained in a prefix, including the prefix itself.
+        """
+        node = self.root
+        while node.prefixlen < prefixlen:
+            child = node.children[(network >> (self.bits - 1 - node.prefixlen)) & 1]
+            if child is None:
+                return
+            if child.prefixlen >= prefixlen:
+                # The child is the top of the subtree if it lies inside the prefix
+                if not self._within(child, network, prefixlen):
+                    return
+                node = child
+                break
+            if not self._contains(child, network):
+                return
+            node = child
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.entries is not None:
+                yield node
+            # Push the 1 branch first, so prefixes come out in address order
+            for child in reversed(node.children):
+                if child is not None:
+                    stack.append(child)
+
+    def _add(self, node):
+        """Register the node of a newly stored prefix."""
+        self._nodes[(node.network, node.prefixlen)] = node
+        self.size += 1
+        return node
+
+    def _contains(self, node, network):
+        """Check whether the prefix of a node contains an address."""
+        shift = self.bits - node.prefixlen
+        return (node.network >> shift) == (network >> shift)
+
+    def _within(self, node, network, prefixlen):
+        """Check whether the prefix of a node lies inside a prefix."""
+        shift = self.bits - prefixlen
+        return node.prefixlen >= prefixlen and (node.network >> shift) == (network >> shift)
+
+    def _common_length(self, a, b, limit):
+        """Return the number of leading bits two networks share, at most limit."""
+        difference = a ^ b
+        common = self.bits - difference.bit_length()
+        return min(common, limit)
+
+    def _mask(self, prefixlen):
+        return ((1 << prefixlen) - 1) << (self.bits - prefixlen)
+
+
+def parse_prefix(prefix):
+    """
+    Parse a prefix or address into its IP version, network integer and prefix length.
+
+    Host bits are cleared, and addresses without a length are host prefixes.
+
+    Args:
+        prefix (str): The prefix in CIDR notation, e.g. '10.0.0.0/24', or an address.
+
+    Returns:
+        tuple: The IP version, the network as an integer and the prefix length.
+
+    Raises:
+        ValueError: If the prefix is not a valid IPv4 or IPv6 prefix.
+    """
+    address, _, length = prefix.strip().partition("/")
+    try:
+        if ":" in address:
+            version, packed = 6, socket.inet_pton(socket.AF_INET6, address)
+        else:
+            version, packed = 4, socket.inet_pton(socket.AF_INET, address)
+    except OSError:
+        raise ValueError(f"Invalid prefix '{prefix}'")
+    bits = ADDRESS_BITS[version]
+    if not length:
+        prefixlen = bits
+    elif length.isdigit() and int(length) <= bits:
+        prefixlen = int(length)
+    else:
+        raise ValueError(f"Invalid prefix length in '{prefix}'")
+    network = int.from_bytes(packed, "big")
+    network &= ((1 << prefixlen) - 1) << (bits - prefixlen)
+    return version, network, prefixlen
+
+
+def format_prefix(version, network, prefixlen):
+    """Return a prefix in CIDR notation."""
+    if version == 4:
+        address = socket.inet_ntop(socket.AF_INET, network.to_bytes(4, "big"))
+    else:
+        address = socket.inet_ntop(socket.AF_INET6, network.to_bytes(16, "big"))
+    return f"{address}/{prefixlen}"
+
+
+class PrefixIndex:
+    """
+    Index of the prefixes of the 'inspect fib all' outputs of a snapshot.
+
+    Every prefix maps to the (host, Path ID) pairs that carry it, so
+    longest-prefix match, covering and covered prefix queries across the
+    fleet do not have to scan the snapshot.
+    """
+
+    def __init__(self):
+        self.trees = {version: RadixTree(bits) for version, bits in ADDRESS_BITS.items()}
+        # Parsed prefixes, most prefixes are carried by many hosts
+        self._parsed = {}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Build the index of a snapshot.
+
+        Args:
+            snapshot (dict): Parsed data keyed by host and command.
+
+        Returns:
+            PrefixIndex: The index.
+        """
+        index = cls()
+        for host, commands in snapshot.items():
+            if not isinstance(commands, Mapping):
+                continue
+            for command, output in commands.items():
+                if command.strip().lower() == FIB_COMMAND and isinstance(output, Mapping):
+                    index.add_paths(host, output)
+        index._parsed.clear()
+        return index
+
+    def add_paths(self, host, paths):
+        """
+        Index the prefixes of the parsed 'inspect fib all' output of a host.
+
+        Args:
+            host (str): The host the output was collected from.
+            paths (dict): Path records keyed by Path ID.
+        """
+        for path_id, path in paths.items():
+            if not isinstance(path, Mapping):
+                continue
+            entry = (host, path_id)
+            for field in PREFIX_FIELDS.values():
+                for prefix in path.get(field) or ():
+                    parsed = self._parsed.get(prefix)
+                    if parsed is None:
+                        try:
+                            parsed = self._parsed[prefix] = parse_prefix(prefix)
+                        except ValueError:
+                            print(f"Skipping invalid prefix '{prefix}' of path {path_id} on {host}")
+                            continue
+                    prefix_version, network, prefixlen = parsed
+                    self.trees[prefix_version].insert(network, prefixlen, entry)
+
+    def __len__(self):
+        return sum(tree.size for tree in self.trees.values())
+
+    def longest_match(self, address):
+        """
+        Return, per host, the longest prefix that matches an address or prefix.
+
+        Args:
+            address (str): The address or prefix to look up.
+
+        Returns:
+            list: (prefix, host, Path ID) tuples, one per host that has a match.
+        """
+        version, network, prefixlen = parse_prefix(address)
+        matched = set()
+        matches = []
+        for node in reversed(self.trees[version].covering(network, prefixlen)):
+            # Walk from the longest match up, each host keeps its longest match only
+            prefix = format_prefix(version, node.network, node.prefixlen)
+            hosts = set()
+            for host, path_id in node.entries:
+                if host not in matched:
+                    matches.append((prefix, host, path_id))
+                    hosts.add(host)
+            matched |= hosts
+        return matches
+
+    def covering(self, prefix):
+        """
+        Return the prefixes that contain a prefix or address, shortest first.
+
+        Returns:
+            list: (prefix, host, Path ID) tuples.
+        """
+        version, network, prefixlen = parse_prefix(prefix)
+        return self._entries(version, self.trees[version].covering(network, prefixlen))
+
+    def covered(self, prefix, limit=None):
+        """
+        Return the prefixes contained in a prefix, including the prefix itself, in address order.
+
+        Args:
+            prefix (str): The prefix to look up.
+            limit (int, optional): Maximum number of prefixes to return.
+
+        Returns:
+            list: (prefix, host, Path ID) tuples.
+        """
+        version, network, prefixlen = parse_prefix(prefix)
+        nodes = []
+        for node in self.trees[version].covered(network, prefixlen):
+            if limit is not None and len(nodes) >= limit:
+                break
+            nodes.append(node)
+        return self._entries(version, nodes)
+
+    def paths(self, prefix):
+        """
+        Return the paths that carry exactly a prefix, across the fleet.
+
+        Returns:
+            list: (prefix, host, Path ID) tuples.
+        """
+        version, network, prefixlen = parse_prefix(prefix)
+        node = self.trees[version].exact(network, prefixlen)
+        return self._entries(version, [node] if node is not None else [])
+
+    @staticmethod
+    def _entries(version, nodes):
+        return [
+            (format_prefix(version, node.network, node.prefixlen), host, path_id)
+            for node in nodes
+            for host, path_id in node.entries
+        ]
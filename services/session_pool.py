@@ -0,0 +1,182 @@
+from collections import OrderedDict
+import threading
+import time
+
+from netmiko import ConnectHandler
+
+
+class PooledSession:
+    """
+    An authenticated SSH session held by the SessionPool.
+    """
+
+    def __init__(self, connection, params):
+        self.connection = connection
+        self.params = params
+        self.in_use = False
+        self.last_used = time.monotonic()
+
+
+class SessionPool:
+    """
+    Pool of authenticated SSH sessions that are kept alive between snapshots.
+
+    Sessions are keyed by element name. Idle sessions are health-checked before
+    they are handed out again, and evicted when they have been idle for longer
+    than ``idle_timeout`` or when the pool grows beyond ``max_sessions``.
+    """
+
+    def __init__(self, max_sessions=1000, idle_timeout=600, keepalive=30, connect_handler=ConnectHandler):
+        """
+        Initialize the SessionPool.
+
+        Args:
+            max_sessions (int): Maximum number of sessions kept in the pool.
+            idle_timeout (int): Seconds after which an unused session is closed.
+            keepalive (int): Interval in seconds of the SSH transport keepalive.
+            connect_handler (callable): Factory used to open new sessions.
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.connect_handler = connect_handler
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key, params):
+        """
+        Return a healthy session for an element, reusing a pooled one when possible.
+
+        Args:
+            key (str): Name of the network element.
+            params (dict): Connection parameters passed to the connect handler.
+
+        Returns:
+            object: The connection of the session.
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and not session.in_use:
+                session.in_use = True
+                self._sessions.move_to_end(key)
+            else:
+                session = None
+
+        if session is not None:
+            if session.params == params and self.is_alive(session.connection):
+                print(f"Reusing session to {key}")
+                return session.connection
+            print(f"Discarding stale session to {key}")
+            self._discard(key, session)
+
+        return self._open(key, params)
+
+    def release(self, key, connection):
+        """
+        Return a session to the pool once the caller is done with it.
+
+        Args:
+            key (str): Name of the network element.
+            connection (object): Connection previously returned by acquire.
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and session.connection is connection:
+                session.in_use = False
+                session.last_used = time.monotonic()
+                connection = None
+        if connection is not None:
+            # The session was not pooled, either because the pool was full or
+            # because the element already had a session in use
+            self._disconnect(key, connection)
+        self.evict_idle()
+
+    def reconnect(self, key, connection, params):
+        """
+        Replace a broken session with a freshly authenticated one.
+
+        Args:
+            key (str): Name of the network element.
+            connection (object): The broken connection previously returned by acquire.
+            params (dict): Connection parameters passed to the connect handler.
+
+        Returns:
+            object: The new connection.
+        """
+        print(f"Reconnecting to {key}...")
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and session.connection is connection:
+                del self._sessions[key]
+        self._disconnect(key, connection)
+        return self._open(key, params)
+
+    def evict_idle(self):
+        """
+        Close sessions that have been idle for longer than the idle timeout.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                (key, session) for key, session in self._sessions.items()
+                if not session.in_use and now - session.last_used > self.idle_timeout
+            ]
+            for key, _ in expired:
+                del self._sessions[key]
+        for key, session in expired:
+            print(f"Evicting idle session to {key}")
+            self._disconnect(key, session.connection)
+
+    def close_all(self):
+        """
+        Close every session held by the pool.
+        """
+        with self._lock:
+            sessions = list(self._sessions.items())
+            self._sessions.clear()
+        for key, session in sessions:
+            self._disconnect(key, session.connection)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _open(self, key, params):
+        """Open a new session and add it to the pool if there is room for it."""
+        connection = self.connect_handler(keepalive=self.keepalive, **params)
+        session = PooledSession(connection, params)
+        session.in_use = True
+        evicted = None
+        with self._lock:
+            if key not in self._sessions and len(self._sessions) >= self.max_sessions:
+                # Make room by evicting the least recently used idle session
+                for idle_key, idle_session in self._sessions.items():
+                    if not idle_session.in_use:
+                        evicted = (idle_key, self._sessions.pop(idle_key))
+                        break
+            if key not in self._sessions and len(self._sessions) < self.max_sessions:
+                self._sessions[key] = session
+        if evicted is not None:
+            print(f"Evicting session to {evicted[0]}: pool is full")
+            self._disconnect(evicted[0], evicted[1].connection)
+        return connection
+
+    def _discard(self, key, session):
+        """Remove a session from the pool and close it."""
+        with self._lock:
+            if self._sessions.get(key) is session:
+                del self._sessions[key]
+        self._disconnect(key, session.connection)
+
+    @staticmethod
+    def is_alive(connection):
+        try:
+            return connection.is_alive()
+        except Exception:
+            return False
+
+    @staticmethod
+    def _disconnect(key, connection):
+        try:
+            connection.disconnect()
+        except Exception as e:
+            print(f"Failed to disconnect from {key}: {str(e)}")
@@ -0,0 +1,96 @@
+from collections.abc import Mapping
+
+# Change types, named like the DeepDiff report they replace
+ITEM_ADDED = "dictionary_item_added"
+ITEM_REMOVED = "dictionary_item_removed"
+VALUES_CHANGED = "values_changed"
+TYPE_CHANGES = "type_changes"
+ITERABLE_ITEM_ADDED = "iterable_item_added"
+ITERABLE_ITEM_REMOVED = "iterable_item_removed"
+
+# Depth of the individual records: host -> command -> record key
+RECORD_DEPTH = 2
+
+
+def iter_changes(old, new, keys=(), old_hashes=None, new_hashes=None):
+    """
+    Walk two snapshots and yield the differences between them.
+
+    Snapshots are keyed all the way down (host -> command -> record key ->
+    field), so mappings are compared key by key and records that are equal
+    are skipped as a whole. Lists are compared by position. The walk is
+    linear in the size of the snapshots.
+
+    When the hash trees of both snapshots are given, subtrees with equal
+    content hashes are skipped without being looked at.
+
+    Args:
+        old (Mapping): The baseline snapshot, or a subtree of it.
+        new (Mapping): The current snapshot, or a subtree of it.
+        keys (tuple): Keys leading from the snapshot root to old and new.
+        old_hashes (dict, optional): Hash node of old, see snapshot_hash.
+        new_hashes (dict, optional): Hash node of new, see snapshot_hash.
+
+    Yields:
+        tuple: (change_type, keys, old_value, new_value) for every difference.
+            keys is the tuple of keys leading to the changed value.
+    """
+    if old_hashes is not None and new_hashes is not None:
+        if old_hashes["hash"] == new_hashes["hash"]:
+            return
+        old_children = old_hashes.get("children", {})
+        new_children = new_hashes.get("children", {})
+    else:
+        old_children = new_children = None
+
+    if isinstance(old, Mapping) and isinstance(new, Mapping):
+        compare_records = len(keys) >= RECORD_DEPTH
+        # Values are only fetched once the hashes differ, lazily loaded
+        # and packed snapshots then skip unchanged sections and records
+        for key in old:
+            if key not in new:
+                yield ITEM_REMOVED, keys + (key,), old[key], None
+                continue
+            if old_children is not None:
+                old_node = old_children.get(key)
+                new_node = new_children.get(key)
+                if old_node is not None and new_node is not None:
+                    if old_node["hash"] != new_node["hash"]:
+                        yield from iter_changes(old[key], new[key], keys + (key,), old_node, new_node)
+                    continue
+            old_value = old[key]
+            new_value = new[key]
+            if old_value is new_value or (compare_records and old_value == new_value):
+                continue
+            yield from iter_changes(old_value, new_value, keys + (key,))
+        for key in new:
+            if key not in old:
+                yield ITEM_ADDED, keys + (key,), None, new[key]
+    elif isinstance(old, list) and isinstance(new, list):
+        if old == new:
+            return
+        for index, (old_value, new_value) in enumerate(zip(old, new)):
+            if old_value != new_value:
+                yield from iter_changes(old_value, new_value, keys + (index,))
+        for index in range(len(new), len(old)):
+            yield ITERABLE_ITEM_REMOVED, keys + (index,), old[index], None
+        for index in range(len(old), len(new)):
+            yield ITERABLE_ITEM_ADDED, keys + (index,), None, new[index]
+    elif type(old) is not type(new):
+        yield TYPE_CHANGES, keys, old, new
+    elif old != new:
+        yield VALUES_CHANGED, keys, old, new
+
+
+def format_path(keys):
+    """
+    Format a tuple of keys as a DeepDiff style path, e.g. root['r1']['dump overview'].
+
+    Args:
+        keys (tuple): Keys leading from the snapshot root to a value.
+
+    Returns:
+        str: The path.
+    """
+    return "root" + "".join(f"[{key!r}]" for key in keys)
+
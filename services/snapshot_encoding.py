@@ -0,0 +1,137 @@
+from collections.abc import Mapping
+import gzip
+import hashlib
+import json
+import threading
+
+from services.diff_report import CustomJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def encode_json(value):
+    """
+    Serialize a value to compact JSON bytes, with orjson when it is installed.
+
+    Args:
+        value: The value to serialize.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, cls=CustomJSONEncoder, separators=(',', ':')).encode()
+
+
+def _orjson_default(value):
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if isinstance(value, Mapping):
+        return dict(value.items())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class EncodedSnapshot:
+    """
+    A snapshot serialized once, served as cached bytes.
+
+    Compressed variants are built on first use and kept for the lifetime
+    of the snapshot.
+    """
+
+    def __init__(self, snapshot, content_hash=None):
+        """
+        Serialize a snapshot.
+
+        Args:
+            snapshot (dict): Parsed data keyed by host and command.
+            content_hash (str, optional): Hash of the snapshot content, used as ETag;
+                the serialized bytes are hashed when omitted.
+        """
+        self.body = encode_json(snapshot)
+        if content_hash is None:
+            content_hash = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+        # Weak, since key order and content coding may differ for the same content
+        self.etag = f'W/"{content_hash}"'
+        self._encoded = {"identity": self.body}
+        self._lock = threading.Lock()
+
+    def matches(self, if_none_match):
+        """
+        Check an If-None-Match request header against the ETag.
+
+        Args:
+            if_none_match (str): The header value, or None.
+
+        Returns:
+            bool: True if the client already has this snapshot.
+        """
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        etag = self.etag[2:]
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate.startswith("W/"):
+                candidate = candidate[2:]
+            if candidate == etag:
+                return True
+        return False
+
+    def encoded(self, accept_encoding):
+        """
+        Return the body in the best content coding accepted by the client.
+
+        Args:
+            accept_encoding (str): The Accept-Encoding request header, or None.
+
+        Returns:
+            tuple: The content coding and the encoded body.
+        """
+        accepted = _accepted_codings(accept_encoding)
+        for coding in ("br", "gzip"):
+            if coding in accepted and (coding != "br" or brotli is not None):
+                return coding, self._compressed(coding)
+        return "identity", self.body
+
+    def _compressed(self, coding):
+        with self._lock:
+            if coding not in self._encoded:
+                if coding == "br":
+                    self._encoded[coding] = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                else:
+                    self._encoded[coding] = gzip.compress(self.body, compresslevel=GZIP_LEVEL)
+            return self._encoded[coding]
+
+
+def _accepted_codings(accept_encoding):
+    """Return the content codings of an Accept-Encoding header that are not refused with q=0."""
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                pass
+        if coding and quality > 0:
+            accepted.add(coding)
+    return accepted
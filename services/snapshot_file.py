@@ -0,0 +1,218 @@
+from collections.abc import Mapping
+import mmap
+import os
+import pickle
+import struct
+
+from services.compact_snapshot import expand_value, RecordTable
+from services.snapshot_encoding import encode_json
+from services.snapshot_hash import build_snapshot_hashes
+
+MAGIC = b"NMSNAP\x00\x01"
+# Offset and length of the section index, right after the magic
+HEADER = struct.Struct("<QQ")
+# Pickle protocol of the blobs, readable by every supported Python version
+PICKLE_PROTOCOL = 4
+
+
+class LazyMapping(Mapping):
+    """
+    Read-only mapping whose values are loaded on first access and then kept.
+    """
+
+    __slots__ = ("_keys", "_load", "_values")
+
+    def __init__(self, keys, load):
+        """
+        Args:
+            keys (iterable): The keys of the mapping, in order.
+            load (callable): Called with a key to load its value.
+        """
+        self._keys = dict.fromkeys(keys)
+        self._load = load
+        self._values = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        if key not in self._keys:
+            raise KeyError(key)
+        value = self._values[key] = self._load(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return f"LazyMapping({len(self._keys)} keys, {len(self._values)} loaded)"
+
+
+def write_snapshot_file(path, snapshot, hashes=None, snapshot_id=None, timestamp=None):
+    """
+    Write a snapshot in the binary snapshot format.
+
+    The file holds one pickled blob per host and command, the record hashes
+    of keyed command outputs, and a section index with the offsets and content
+    hashes of all blobs. The file is written next to its destination and
+    renamed, so readers never see a partial file.
+
+    Args:
+        path (Path): Destination of the file.
+        snapshot (dict): Parsed data keyed by host and command.
+        hashes (dict, optional): Hash tree of the snapshot; computed when omitted.
+        snapshot_id (str, optional): ID of the snapshot.
+        timestamp (datetime, optional): Time the snapshot was taken.
+
+    Returns:
+        int: The size of the file in bytes.
+    """
+    if hashes is None:
+        hashes = build_snapshot_hashes(snapshot)
+    host_nodes = hashes.get("children", {})
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(MAGIC + HEADER.pack(0, 0))
+
+        def write_blob(value):
+            offset = f.tell()
+            f.write(pickle.dumps(value, PICKLE_PROTOCOL))
+            return [offset, f.tell() - offset]
+
+        hosts = {}
+        for host, commands in snapshot.items():
+            host_node = host_nodes.get(host, {})
+            if not isinstance(commands, Mapping):
+                hosts[host] = {"hash": host_node.get("hash"), "value": write_blob(_plain(commands))}
+                continue
+            command_nodes = host_node.get("children", {})
+            sections = {}
+            for command, output in commands.items():
+                node = command_nodes.get(command, {})
+                section = {"hash": node.get("hash"), "data": write_blob(_plain(output))}
+                if "children" in node:
+                    section["records"] = write_blob(
+                        {key: child["hash"] for key, child in node["children"].items()}
+                    )
+                sections[command] = section
+            hosts[host] = {"hash": host_node.get("hash"), "commands": sections}
+
+        index = {
+            "snapshot_id": snapshot_id,
+            "timestamp": timestamp.isoformat() if timestamp is not None else None,
+            "hash": hashes.get("hash"),
+            "hosts": hosts,
+        }
+        index_offset, index_length = write_blob(index)
+        f.seek(len(MAGIC))
+        f.write(HEADER.pack(index_offset, index_length))
+        size = os.fstat(f.fileno()).st_size
+    os.replace(temp_path, path)
+    return size
+
+
+def _plain(value):
+    """Return a value as plain dicts, lists and scalars."""
+    if isinstance(value, RecordTable):
+        return dict(value.items())
+    if isinstance(value, Mapping) and not isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    return expand_value(value)
+
+
+class SnapshotFile:
+    """
+    A snapshot in the binary snapshot format, memory-mapped.
+
+    Opening the file only reads its section index. Sections are decoded
+    when they are first accessed through ``snapshot`` or ``hashes``, so
+    untouched hosts and commands cost no memory.
+    """
+
+    def __init__(self, path):
+        """
+        Open a snapshot file.
+
+        Args:
+            path (Path): The snapshot file.
+
+        Raises:
+            ValueError: If the file is not a snapshot file.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        index_offset, index_length = HEADER.unpack_from(self._map, len(MAGIC))
+        self.index = self._read([index_offset, index_length])
+        self.snapshot_id = self.index["snapshot_id"]
+        self.timestamp = self.index["timestamp"]
+        self.snapshot = LazyMapping(self.index["hosts"], self._load_host)
+        self.hashes = {
+            "hash": self.index["hash"],
+            "children": LazyMapping(self.index["hosts"], self._load_host_node),
+        }
+
+    def _read(self, location):
+        offset, length = location
+        return pickle.loads(self._map[offset:offset + length])
+
+    def _load_host(self, host):
+        entry = self.index["hosts"][host]
+        if "value" in entry:
+            return self._read(entry["value"])
+        sections = entry["commands"]
+        return LazyMapping(sections, lambda command: self._read(sections[command]["data"]))
+
+    def _load_host_node(self, host):
+        entry = self.index["hosts"][host]
+        if "value" in entry:
+            return {"hash": entry["hash"]}
+        sections = entry["commands"]
+        return {"hash": entry["hash"], "children": LazyMapping(sections, self._command_node_loader(sections))}
+
+    def _command_node_loader(self, sections):
+        def load(command):
+            section = sections[command]
+            if "records" not in section:
+                return {"hash": section["hash"]}
+            return LazyMapping(
+                ("hash", "children"),
+                lambda key: section["hash"] if key == "hash" else {
+                    record: {"hash": digest} for record, digest in self._read(section["records"]).items()
+                },
+            )
+        return load
+
+    def iter_json(self):
+        """
+        Export the snapshot as JSON, one host and command at a time.
+
+        Yields:
+            bytes: Chunks of the JSON document.
+        """
+        separator = b"{"
+        for host, entry in self.index["hosts"].items():
+            yield separator + encode_json(host) + b":"
+            separator = b","
+            if "value" in entry:
+                yield encode_json(self._read(entry["value"]))
+                continue
+            command_separator = b"{"
+            for command, section in entry["commands"].items():
+                yield command_separator + encode_json(command) + b":" + encode_json(self._read(section["data"]))
+                command_separator = b","
+            yield b"{}" if command_separator == b"{" else b"}"
+        yield b"{}" if separator == b"{" else b"}"
+
+    def close(self):
+        self._map.close()
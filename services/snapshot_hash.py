@@ -0,0 +1,91 @@
+from collections.abc import Mapping
+import hashlib
+import json
+
+
+def hash_value(value):
+    """
+    Return the content hash of a JSON-compatible value.
+
+    Args:
+        value: The value to hash.
+
+    Returns:
+        str: Hex digest of the canonical JSON encoding of the value.
+    """
+    try:
+        encoded = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    except TypeError:
+        # Keys of mixed types cannot be sorted by json, fall back to their repr
+        encoded = repr(_canonical(value))
+    return _digest(encoded.encode())
+
+
+def hash_command_output(output):
+    """
+    Build the hash node of a parsed command output.
+
+    Mappings get one child node per record, so identical records of two
+    snapshots can be recognised without looking at their content.
+
+    Args:
+        output: The parsed output of a command.
+
+    Returns:
+        dict: The node, with the combined ``hash`` and the record nodes as ``children``.
+    """
+    if not isinstance(output, Mapping):
+        return {"hash": hash_value(output)}
+    children = {key: {"hash": hash_value(record)} for key, record in output.items()}
+    return combine_nodes(children)
+
+
+def combine_nodes(children):
+    """
+    Build a parent hash node from its child nodes.
+
+    The parent hash only depends on the keys and hashes of the children, not on
+    their order.
+
+    Args:
+        children (dict): Child nodes keyed by host, command or record key.
+
+    Returns:
+        dict: The parent node, with its ``hash`` and ``children``.
+    """
+    entries = sorted(f"{key!r}:{node['hash']}" for key, node in children.items())
+    return {"hash": _digest("\n".join(entries).encode()), "children": children}
+
+
+def build_snapshot_hashes(snapshot):
+    """
+    Build the hash tree of a whole snapshot.
+
+    Args:
+        snapshot (dict): Parsed data keyed by host and command.
+
+    Returns:
+        dict: The snapshot node; its children are host nodes, whose children
+            are command nodes, whose children are record nodes.
+    """
+    hosts = {}
+    for hostname, commands in snapshot.items():
+        if isinstance(commands, Mapping):
+            hosts[hostname] = combine_nodes(
+                {command: hash_command_output(output) for command, output in commands.items()}
+            )
+        else:
+            hosts[hostname] = {"hash": hash_value(commands)}
+    return combine_nodes(hosts)
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _canonical(value):
+    if isinstance(value, Mapping):
+        return sorted(((repr(key), _canonical(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return value
@@ -0,0 +1,568 @@
+from collections.abc import Mapping
+from datetime import timezone
+from itertools import islice
+import threading
+
+from pymongo import ASCENDING
+
+from services.compact_snapshot import pack_snapshot, unpack_snapshot
+from services.snapshot_hash import build_snapshot_hashes
+
+# Delta operations, stored as (op, host, command, key, value) tuples
+OP_SET = "set"                        # Add or change the record `key` of a command
+OP_DELETE = "delete"                  # Remove the record `key` of a command
+OP_REPLACE = "replace"                # Replace the whole output of a command with `value`
+OP_REMOVE_COMMAND = "remove_command"  # Remove a command from a host
+OP_REMOVE_HOST = "remove_host"        # Remove a host from the snapshot
+
+BASE = "base"
+DELTA = "delta"
+
+# Operations per history document in MongoDB
+HISTORY_CHUNK_OPS = 5000
+# Change index documents sent to MongoDB per bulk insert
+CHANGE_BATCH_SIZE = 1000
+# Changes kept in the in-memory change index when there is no changes collection
+MAX_INDEXED_CHANGES = 1000000
+
+
+def compute_delta(old, new, old_hashes=None, new_hashes=None):
+    """
+    Compute the operations that turn one snapshot into another.
+
+    Records are compared by key, and hosts, commands and records with equal
+    content hashes are skipped when the hash trees are given.
+
+    Args:
+        old (dict): The older snapshot.
+        new (dict): The newer snapshot.
+        old_hashes (dict, optional): Hash tree of the older snapshot.
+        new_hashes (dict, optional): Hash tree of the newer snapshot.
+
+    Returns:
+        list: The delta operations.
+    """
+    ops = []
+    old_hosts = _children(old_hashes)
+    new_hosts = _children(new_hashes)
+    for host in old:
+        if host not in new:
+            ops.append((OP_REMOVE_HOST, host, None, None, None))
+
+    for host, commands in new.items():
+        old_commands = old.get(host)
+        if old_commands is None:
+            for command, output in commands.items():
+                ops.extend(_section_ops(host, command, output))
+            continue
+        if _same(old_hosts.get(host), new_hosts.get(host)):
+            continue
+
+        old_command_nodes = _children(old_hosts.get(host))
+        new_command_nodes = _children(new_hosts.get(host))
+        for command in old_commands:
+            if command not in commands:
+                ops.append((OP_REMOVE_COMMAND, host, command, None, None))
+        for command, output in commands.items():
+            if command not in old_commands:
+                ops.extend(_section_ops(host, command, output))
+                continue
+            old_output = old_commands[command]
+            if old_output is output or _same(old_command_nodes.get(command), new_command_nodes.get(command)):
+                continue
+            if isinstance(old_output, Mapping) and isinstance(output, Mapping):
+                old_records = _children(old_command_nodes.get(command))
+                new_records = _children(new_command_nodes.get(command))
+                for key in old_output:
+                    if key not in output:
+                        ops.append((OP_DELETE, host, command, key, None))
+                for key, record in output.items():
+                    if key in old_output:
+                        if _same(old_records.get(key), new_records.get(key)) or old_output[key] == record:
+                            continue
+                    ops.append((OP_SET, host, command, key, record))
+            elif old_output != output:
+                ops.extend(_section_ops(host, command, output))
+    return ops
+
+
+def apply_delta(snapshot, ops):
+    """
+    Apply delta operations to a snapshot in place.
+
+    Only the host and command dictionaries of the snapshot are modified;
+    records are replaced, never changed.
+
+    Args:
+        snapshot (dict): The snapshot to update.
+        ops (iterable): Operations as returned by compute_delta.
+    """
+    for op, host, command, key, value in ops:
+        if op == OP_SET:
+            snapshot[host][command][key] = value
+        elif op == OP_DELETE:
+            snapshot[host][command].pop(key, None)
+        elif op == OP_REPLACE:
+            snapshot.setdefault(host, {})[command] = dict(value) if isinstance(value, Mapping) else value
+        elif op == OP_REMOVE_COMMAND:
+            snapshot.get(host, {}).pop(command, None)
+        elif op == OP_REMOVE_HOST:
+            snapshot.pop(host, None)
+
+
+class SnapshotHistory:
+    """
+    Delta-compressed history of snapshots.
+
+    Every ``base_interval`` snapshots a full base snapshot is kept; the
+    snapshots in between are stored as deltas against their predecessor.
+    Any snapshot is rebuilt from its base plus at most ``base_interval - 1``
+    deltas. Record and list item changes are indexed against the preceding
+    snapshot as snapshots are added, so "when did this change" queries do
+    not replay the history; the first snapshot of a history has no changes.
+
+    With MongoDB collections the operations and the change index are only
+    kept in MongoDB and read on demand. Without them, bases are kept in
+    compact form and the change index is capped at ``max_indexed_changes``.
+    The latest snapshot, needed for the next delta, is always kept in
+    compact form.
+    """
+
+    def __init__(self, collection=None, base_interval=24, max_entries=None, changes_collection=None,
+                 max_indexed_changes=MAX_INDEXED_CHANGES):
+        """
+        Initialize the SnapshotHistory.
+
+        Args:
+            collection (Collection, optional): MongoDB collection the history is persisted in.
+            base_interval (int): Number of snapshots per base snapshot.
+            max_entries (int, optional): Maximum number of snapshots kept in the history.
+            changes_collection (Collection, optional): MongoDB collection of the record and
+                list item change index.
+            max_indexed_changes (int): Maximum number of changes indexed in memory when
+                there is no changes collection.
+        """
+        self.collection = collection
+        self.changes_collection = changes_collection
+        self.base_interval = base_interval
+        self.max_entries = max_entries
+        self.max_indexed_changes = max_indexed_changes
+        # Snapshot ID, timestamp, kind and number of operations of every entry
+        self._entries = []
+        self._seq_by_id = {}
+        self._next_seq = 0
+        self._latest = {}
+        self._latest_hashes = None
+        # Operations of the deltas and the compact bases, without a collection
+        self._ops = {}
+        self._bases = {}
+        # Change indexes, without a changes collection
+        self._record_changes = {}
+        self._item_changes = {}
+        self._indexed_changes = 0
+        self._lock = threading.Lock()
+        if collection is not None:
+            collection.create_index([("seq", ASCENDING), ("part", ASCENDING)])
+            collection.create_index([("snapshot_id", ASCENDING)])
+        if changes_collection is not None:
+            changes_collection.create_index(
+                [("host", ASCENDING), ("command", ASCENDING), ("key", ASCENDING), ("seq", ASCENDING)]
+            )
+            changes_collection.create_index([("item", ASCENDING), ("seq", ASCENDING)])
+            changes_collection.create_index([("seq", ASCENDING)])
+
+    def append(self, snapshot_id, timestamp, snapshot, hashes=None):
+        """
+        Add a snapshot to the history.
+
+        Args:
+            snapshot_id (str): Unique ID of the snapshot.
+            timestamp (datetime): Time the snapshot was taken.
+            snapshot (dict): Parsed data keyed by host and command.
+            hashes (dict, optional): Hash tree of the snapshot, used to skip unchanged sections.
+        """
+        with self._lock:
+            old = self._latest
+            ops = compute_delta(old, snapshot, self._latest_hashes, hashes)
+            seq = self._next_seq
+            indexed = bool(self._entries)
+            latest = pack_snapshot(snapshot)
+            if self._entries and seq - self._last_base_seq() < self.base_interval:
+                entry = self._add_entry(seq, snapshot_id, timestamp, DELTA, len(ops))
+                if self.collection is None:
+                    self._ops[seq] = ops
+                stored_ops = ops
+            else:
+                stored_ops = compute_delta({}, snapshot) if self.collection is not None else []
+                entry = self._add_entry(seq, snapshot_id, timestamp, BASE, len(stored_ops) or _count_ops(snapshot))
+                if self.collection is None:
+                    self._bases[seq] = latest
+            self._latest = latest
+            self._latest_hashes = hashes
+            if indexed and self.changes_collection is None:
+                self._index_in_memory(_iter_index_changes(seq, ops, old))
+            self._prune()
+        if self.collection is not None:
+            self._persist(entry, stored_ops)
+        if indexed and self.changes_collection is not None:
+            self._insert_changes(_iter_index_changes(seq, ops, old))
+        print(f"Added snapshot {snapshot_id} to the history as {entry['kind']} ({entry['operations']} operations)")
+
+    def entries(self):
+        """
+        Return the snapshots in the history, oldest first.
+
+        Returns:
+            list: Dictionaries with the snapshot ID, timestamp, kind and size of each entry.
+        """
+        with self._lock:
+            return [
+                {
+                    "snapshot_id": entry["snapshot_id"],
+                    "timestamp": entry["timestamp"],
+                    "kind": entry["kind"],
+                    "operations": entry["operations"],
+                }
+                for entry in self._entries
+            ]
+
+    def reconstruct(self, snapshot_id=None, timestamp=None):
+        """
+        Rebuild a snapshot from the history.
+
+        Args:
+            snapshot_id (str, optional): ID of the snapshot to rebuild.
+            timestamp (datetime, optional): Rebuild the newest snapshot taken at or before this time.
+
+        Returns:
+            dict: The snapshot, or None if it is not in the history.
+        """
+        with self._lock:
+            index = self._find(snapshot_id, timestamp)
+            if index is None:
+                return None
+            base = index
+            while self._entries[base]["kind"] != BASE:
+                base -= 1
+            seqs = [entry["seq"] for entry in self._entries[base:index + 1]]
+            if self.collection is None:
+                snapshot = unpack_snapshot(self._bases[seqs[0]])
+                deltas = [self._ops[seq] for seq in seqs[1:]]
+
+        if self.collection is not None:
+            snapshot = {}
+            documents = self.collection.find(
+                {"seq": {"$gte": seqs[0], "$lte": seqs[-1]}}, {"_id": 0, "ops": 1}
+            ).sort([("seq", ASCENDING), ("part", ASCENDING)])
+            for document in documents:
+                apply_delta(snapshot, document["ops"])
+            return snapshot
+        for ops in deltas:
+            apply_delta(snapshot, ops)
+        return snapshot
+
+    def record_changes(self, host, command, key):
+        """
+        Return when a record, e.g. an interface or a FIB path, changed.
+
+        Args:
+            host (str): Name of the network element.
+            command (str): The command whose output holds the record.
+            key (str): Key of the record.
+
+        Returns:
+            list: One dictionary per change with the snapshot ID, timestamp and
+                the change ('added', 'changed' or 'removed').
+        """
+        if self.changes_collection is not None:
+            changes = [
+                (document["seq"], document["change"])
+                for document in self.changes_collection.find(
+                    {"host": host, "command": command, "key": key, "item": {"$exists": False}},
+                    {"_id": 0, "seq": 1, "change": 1},
+                ).sort("seq", ASCENDING)
+            ]
+        else:
+            with self._lock:
+                changes = list(self._record_changes.get((host, command, key), []))
+        with self._lock:
+            return [
+                dict(info, change=change)
+                for info, change in ((self._entry_info(seq), change) for seq, change in changes)
+                if info is not None
+            ]
+
+    def item_changes(self, item, host=None):
+        """
+        Return when a list item, e.g. a prefix, was added to or removed from a record.
+
+        Args:
+            item (str): The list item, e.g. '10.0.0.0/24'.
+            host (str, optional): Only return changes on this network element.
+
+        Returns:
+            list: One dictionary per change with the snapshot ID, timestamp,
+                host, command, record key, field and the change ('added' or 'removed').
+        """
+        if self.changes_collection is not None:
+            query = {"item": item}
+            if host is not None:
+                query["host"] = host
+            changes = [
+                (document["seq"], document["host"], document["command"], document["key"],
+                 document["field"], document["change"])
+                for document in self.changes_collection.find(query, {"_id": 0}).sort("seq", ASCENDING)
+            ]
+        else:
+            with self._lock:
+                changes = [
+                    change for change in self._item_changes.get(item, [])
+                    if host is None or change[1] == host
+                ]
+        with self._lock:
+            results = []
+            for seq, change_host, command, key, field, change in changes:
+                info = self._entry_info(seq)
+                if info is not None:
+                    results.append(dict(info, host=change_host, command=command, key=key, field=field, change=change))
+            return results
+
+    def load(self):
+        """
+        Load the history from its MongoDB collection.
+
+        Only the entry list is read; the latest snapshot is rebuilt for the
+        next delta. The operations stay in MongoDB.
+        """
+        if self.collection is None:
+            return
+        entries = {}
+        for document in self.collection.find({}, {"_id": 0, "ops": 0}).sort([("seq", ASCENDING), ("part", ASCENDING)]):
+            entry = entries.get(document["seq"])
+            if entry is None:
+                entry = entries[document["seq"]] = {
+                    key: document[key] for key in ("seq", "snapshot_id", "timestamp", "kind")
+                }
+                entry["operations"] = 0
+            operations = document.get("operations")
+            if operations is None:
+                # Written before operation counts were stored
+                operations = len(self.collection.find_one(
+                    {"seq": document["seq"], "part": document["part"]}, {"_id": 0, "ops": 1}
+                )["ops"])
+            entry["operations"] += operations
+        with self._lock:
+            for entry in entries.values():
+                self._add_entry(entry["seq"], entry["snapshot_id"], entry["timestamp"], entry["kind"],
+                                entry["operations"])
+            self._prune()
+        latest = self.reconstruct()
+        if latest is not None:
+            with self._lock:
+                self._latest_hashes = build_snapshot_hashes(latest)
+                self._latest = pack_snapshot(latest)
+        print(f"Loaded {len(self._entries)} snapshots into the history")
+
+    def _add_entry(self, seq, snapshot_id, timestamp, kind, operations):
+        entry = {
+            "seq": seq, "snapshot_id": snapshot_id, "timestamp": _utc(timestamp), "kind": kind, "operations": operations,
+        }
+        self._entries.append(entry)
+        self._seq_by_id[snapshot_id] = seq
+        self._next_seq = seq + 1
+        return entry
+
+    def _last_base_seq(self):
+        for entry in reversed(self._entries):
+            if entry["kind"] == BASE:
+                return entry["seq"]
+        return -1
+
+    def _find(self, snapshot_id, timestamp):
+        """Return the position of a snapshot in the entry list."""
+        if not self._entries:
+            return None
+        first_seq = self._entries[0]["seq"]
+        if snapshot_id is not None:
+            seq = self._seq_by_id.get(snapshot_id)
+            return None if seq is None or seq < first_seq else seq - first_seq
+        if timestamp is None:
+            return len(self._entries) - 1
+        timestamp = _utc(timestamp)
+        found = None
+        for index, entry in enumerate(self._entries):
+            if entry["timestamp"] > timestamp:
+                break
+            found = index
+        return found
+
+    def _entry_info(self, seq):
+        """Return the snapshot ID and timestamp of an entry, or None if it is not in the history."""
+        if not self._entries:
+            return None
+        index = seq - self._entries[0]["seq"]
+        if index < 0 or index >= len(self._entries):
+            return None
+        entry = self._entries[index]
+        return {"snapshot_id": entry["snapshot_id"], "timestamp": entry["timestamp"]}
+
+    def _index_in_memory(self, changes):
+        """Add changes to the in-memory change indexes, up to max_indexed_changes."""
+        for change in changes:
+            if self._indexed_changes >= self.max_indexed_changes:
+                print(f"The change index holds {self.max_indexed_changes} changes, further changes are not indexed")
+                return
+            if "item" in change:
+                self._item_changes.setdefault(change["item"], []).append((
+                    change["seq"], change["host"], change["command"], change["key"], change["field"], change["change"]
+                ))
+            else:
+                self._record_changes.setdefault((change["host"], change["command"], change["key"]), []).append(
+                    (change["seq"], change["change"])
+                )
+            self._indexed_changes += 1
+
+    def _insert_changes(self, changes):
+        """Write changes to the changes collection in batches."""
+        changes = iter(changes)
+        while True:
+            batch = list(islice(changes, CHANGE_BATCH_SIZE))
+            if not batch:
+                break
+            self.changes_collection.insert_many(batch, ordered=False)
+
+    def _prune(self):
+        """Drop the oldest base and its deltas while the history exceeds max_entries."""
+        if self.max_entries is None or len(self._entries) <= self.max_entries:
+            return
+        next_base = None
+        for index, entry in enumerate(self._entries[1:], 1):
+            if entry["kind"] == BASE:
+                next_base = index
+                if len(self._entries) - index <= self.max_entries:
+                    break
+        if next_base is None:
+            return
+
+        dropped = self._entries[:next_base]
+        del self._entries[:next_base]
+        first_seq = self._entries[0]["seq"]
+        for entry in dropped:
+            self._seq_by_id.pop(entry["snapshot_id"], None)
+            self._ops.pop(entry["seq"], None)
+            self._bases.pop(entry["seq"], None)
+        self._indexed_changes = 0
+        for index in (self._record_changes, self._item_changes):
+            for key in list(index):
+                changes = [change for change in index[key] if change[0] >= first_seq]
+                if changes:
+                    index[key] = changes
+                    self._indexed_changes += len(changes)
+                else:
+                    del index[key]
+        if self.collection is not None:
+            self.collection.delete_many({"seq": {"$lt": first_seq}})
+        if self.changes_collection is not None:
+            self.changes_collection.delete_many({"seq": {"$lt": first_seq}})
+
+    def _persist(self, entry, ops):
+        """Write an entry to MongoDB, split into documents of HISTORY_CHUNK_OPS operations."""
+        ops = iter(ops)
+        part = 0
+        documents = []
+        while True:
+            chunk = [list(op) for op in islice(ops, HISTORY_CHUNK_OPS)]
+            if not chunk and part:
+                break
+            documents.append({
+                "seq": entry["seq"],
+                "part": part,
+                "snapshot_id": entry["snapshot_id"],
+                "timestamp": entry["timestamp"],
+                "kind": entry["kind"],
+                "operations": len(chunk),
+                "ops": chunk,
+            })
+            part += 1
+        self.collection.insert_many(documents, ordered=False)
+
+
+def _iter_index_changes(seq, ops, old):
+    """Yield the record and list item changes of a delta as change index documents."""
+    for op, host, command, key, value in ops:
+        old_output = old.get(host, {}).get(command)
+        old_records = old_output if isinstance(old_output, Mapping) else {}
+        if op == OP_SET:
+            old_record = old_records.get(key)
+            yield _record_change(seq, host, command, key, "added" if key not in old_records else "changed")
+            yield from _item_changes(seq, host, command, key, old_record, value)
+        elif op == OP_DELETE:
+            yield _record_change(seq, host, command, key, "removed")
+            yield from _item_changes(seq, host, command, key, old_records.get(key), None)
+        elif op in (OP_REPLACE, OP_REMOVE_COMMAND):
+            yield from _removed_records(seq, host, command, old_records)
+        elif op == OP_REMOVE_HOST:
+            for removed_command, output in old.get(host, {}).items():
+                if isinstance(output, Mapping):
+                    yield from _removed_records(seq, host, removed_command, output)
+
+
+def _removed_records(seq, host, command, records):
+    for key, record in records.items():
+        yield _record_change(seq, host, command, key, "removed")
+        yield from _item_changes(seq, host, command, key, record, None)
+
+
+def _record_change(seq, host, command, key, change):
+    return {"seq": seq, "host": host, "command": command, "key": key, "change": change}
+
+
+def _item_changes(seq, host, command, key, old_record, new_record):
+    """Yield the items added to or removed from the list fields of a record."""
+    old_record = old_record if isinstance(old_record, Mapping) else {}
+    new_record = new_record if isinstance(new_record, Mapping) else {}
+    for field in set(old_record) | set(new_record):
+        old_items = old_record.get(field)
+        new_items = new_record.get(field)
+        if not isinstance(old_items, list) and not isinstance(new_items, list):
+            continue
+        old_items = set(old_items) if isinstance(old_items, list) else set()
+        new_items = set(new_items) if isinstance(new_items, list) else set()
+        for item in new_items - old_items:
+            yield {"seq": seq, "host": host, "command": command, "key": key, "field": field, "item": item,
+                   "change": "added"}
+        for item in old_items - new_items:
+            yield {"seq": seq, "host": host, "command": command, "key": key, "field": field, "item": item,
+                   "change": "removed"}
+
+
+def _count_ops(snapshot):
+    """Return the number of operations of a base snapshot, see _section_ops."""
+    return sum(
+        1 + len(output) if isinstance(output, Mapping) else 1
+        for commands in snapshot.values() for output in commands.values()
+    )
+
+
+def _section_ops(host, command, output):
+    """Return the operations that add the output of a command to a snapshot."""
+    if isinstance(output, Mapping):
+        return [(OP_REPLACE, host, command, None, {})] + [
+            (OP_SET, host, command, key, record) for key, record in output.items()
+        ]
+    return [(OP_REPLACE, host, command, None, output)]
+
+
+def _utc(timestamp):
+    """Return a timezone-aware timestamp; MongoDB returns naive UTC datetimes."""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def _children(node):
+    return node.get("children", {}) if node else {}
+
+
+def _same(old_node, new_node):
+    return old_node is not None and new_node is not None and old_node["hash"] == new_node["hash"]
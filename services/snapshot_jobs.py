@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import threading
+import uuid
+
+
+class SnapshotJob:
+    """
+    A snapshot sweep running in the background, with per-host progress.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    def __init__(self):
+        self.job_id = uuid.uuid4().hex
+        self.status = self.QUEUED
+        self.created_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self.hosts = {}
+        self.result = None
+        self.timings = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def update_host(self, hostname, status):
+        """
+        Record the progress of a single host.
+
+        Args:
+            hostname (str): Name of the network element.
+            status (str): Current state of the host within the sweep.
+        """
+        with self._lock:
+            self.hosts[hostname] = status
+
+    def to_dict(self):
+        """
+        Return the job status and progress as a dictionary.
+
+        Returns:
+            dict: The job status, timestamps and per-host progress.
+        """
+        with self._lock:
+            hosts = dict(self.hosts)
+        progress = {}
+        for status in hosts.values():
+            progress[status] = progress.get(status, 0) + 1
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": progress,
+            "hosts": hosts,
+            "timings": self.timings,
+            "error": self.error,
+        }
+
+
+class SnapshotJobManager:
+    """
+    Runs snapshot sweeps as background jobs off the event loop.
+
+    Jobs are queued and executed one at a time, since every sweep replaces the
+    current snapshot of the NetworkManager. Only the most recent ``max_jobs``
+    jobs are remembered, and only the latest completed job keeps its result.
+    """
+
+    def __init__(self, run_func, max_jobs=50):
+        """
+        Initialize the SnapshotJobManager.
+
+        Args:
+            run_func (callable): Called as ``run_func(job)`` to take the snapshot;
+                returns a dictionary with a boolean ``status`` and an optional ``error``.
+            max_jobs (int): Number of finished jobs kept for polling.
+        """
+        self.run_func = run_func
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-job")
+
+    def submit(self):
+        """
+        Queue a new snapshot job.
+
+        Returns:
+            SnapshotJob: The queued job.
+        """
+        job = SnapshotJob()
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """
+        Return a job by its ID, or None if it is unknown.
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        """
+        Return all remembered jobs, oldest first.
+        """
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self):
+        """
+        Stop accepting jobs and wait for the running job to finish.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, job):
+        job.status = SnapshotJob.RUNNING
+        job.started_at = _now()
+        try:
+            execution_status = self.run_func(job)
+            if execution_status.get("status"):
+                job.status = SnapshotJob.COMPLETED
+                self._release_results(job)
+            else:
+                job.status = SnapshotJob.FAILED
+                job.error = execution_status.get("error")
+        except Exception as e:
+            job.status = SnapshotJob.FAILED
+            job.error = str(e)
+        job.finished_at = _now()
+
+    def _release_results(self, latest):
+        """Drop the results of jobs superseded by the latest completed job."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job is not latest:
+                    job.result = None
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_jobs."""
+        finished = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in (SnapshotJob.COMPLETED, SnapshotJob.FAILED)
+        ]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
@@ -0,0 +1,163 @@
+from collections.abc import Mapping
+import base64
+import binascii
+import json
+from itertools import islice
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor is malformed or belongs to another snapshot."""
+
+
+def parse_field(field):
+    """
+    Split a JSON-path-style field into its path segments.
+
+    Both ``$.a.b`` and ``a.b`` select key ``b`` of key ``a`` of every record.
+
+    Args:
+        field (str): The field path.
+
+    Returns:
+        tuple: The keys to follow.
+    """
+    if field.startswith("$."):
+        field = field[2:]
+    return tuple(segment for segment in field.split(".") if segment)
+
+
+def project(record, paths):
+    """
+    Keep only the selected fields of a record.
+
+    Args:
+        record: A parsed record, usually a dictionary.
+        paths (list): Field paths as returned by parse_field.
+
+    Returns:
+        The projected record; records that are not dictionaries are returned as they are.
+    """
+    if not isinstance(record, Mapping):
+        return record
+    projected = {}
+    for path in paths:
+        value = record
+        for key in path:
+            if not isinstance(value, Mapping) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+    return projected
+
+
+def encode_cursor(snapshot_id, offset):
+    """Return an opaque cursor pointing at a record of a snapshot."""
+    token = json.dumps([snapshot_id, offset]).encode()
+    return base64.urlsafe_b64encode(token).decode()
+
+
+def decode_cursor(cursor, snapshot_id):
+    """
+    Return the record offset of a cursor.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed or was issued for another snapshot.
+    """
+    try:
+        cursor_snapshot_id, offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidCursor("Malformed cursor")
+    if cursor_snapshot_id != snapshot_id:
+        raise InvalidCursor("Cursor belongs to another snapshot")
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidCursor("Malformed cursor")
+    return offset
+
+
+def query_snapshot(snapshot, snapshot_id=None, hosts=None, commands=None, fields=None, limit=None, cursor=None):
+    """
+    Select a slice of a snapshot.
+
+    Only the selected hosts and commands are visited. Keyed command outputs
+    are paginated per record; other outputs count as a single record.
+
+    Args:
+        snapshot (dict): Parsed data keyed by host and command.
+        snapshot_id (str, optional): ID of the snapshot, bound into the cursors.
+        hosts (list, optional): Only return these hosts.
+        commands (list, optional): Only return these commands.
+        fields (list, optional): Only return these fields of every record.
+        limit (int, optional): Maximum number of records to return.
+        cursor (str, optional): Cursor returned by the previous page.
+
+    Returns:
+        dict: The selected ``data`` and the ``next_cursor``, None on the last page.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed or was issued for another snapshot.
+    """
+    paths = [parse_field(field) for field in fields or ()]
+    paths = [path for path in paths if path]
+    offset = decode_cursor(cursor, snapshot_id) if cursor else 0
+    skip = offset
+    remaining = limit if limit is not None else -1
+
+    data = {}
+    for host, commands_output in _select(snapshot, hosts):
+        if remaining == 0:
+            break
+        if not isinstance(commands_output, Mapping):
+            if skip:
+                skip -= 1
+                continue
+            data[host] = commands_output
+            remaining -= 1
+            continue
+        for command, output in _select(commands_output, commands):
+            if remaining == 0:
+                break
+            if not isinstance(output, Mapping):
+                if skip:
+                    skip -= 1
+                    continue
+                data.setdefault(host, {})[command] = output
+                remaining -= 1
+                continue
+            if skip >= len(output):
+                skip -= len(output)
+                continue
+            items = islice(output.items(), skip, None if remaining < 0 else skip + remaining)
+            skip = 0
+            section = {key: project(record, paths) if paths else record for key, record in items}
+            data.setdefault(host, {})[command] = section
+            remaining -= len(section)
+
+    next_cursor = None
+    if limit is not None and remaining == 0:
+        returned = offset + limit
+        if returned < _count(snapshot, hosts, commands):
+            next_cursor = encode_cursor(snapshot_id, returned)
+    return {"data": data, "next_cursor": next_cursor}
+
+
+def _select(mapping, keys):
+    """Yield the items of a mapping, restricted to some keys, in the order the keys are given."""
+    if not keys:
+        return iter(mapping.items())
+    return ((key, mapping[key]) for key in dict.fromkeys(keys) if key in mapping)
+
+
+def _count(snapshot, hosts, commands):
+    """Return the number of records in the selected slice of a snapshot."""
+    total = 0
+    for _, commands_output in _select(snapshot, hosts):
+        if not isinstance(commands_output, Mapping):
+            total += 1
+            continue
+        for _, output in _select(commands_output, commands):
+            total += len(output) if isinstance(output, Mapping) else 1
+    return total
@@ -0,0 +1,314 @@
+from collections.abc import Mapping
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from pymongo import ASCENDING, DESCENDING
+
+# Records per section document, keeps large sections below the BSON size limit
+SECTION_CHUNK_RECORDS = 5000
+# Documents sent to MongoDB per bulk insert
+BULK_INSERT_SIZE = 1000
+
+
+class SnapshotStore:
+    """
+    Persists snapshots in MongoDB.
+
+    Every snapshot is stored as one metadata document in the ``snapshots``
+    collection plus one document per host and command in the
+    ``snapshot_sections`` collection, so single hosts or commands can be
+    looked up without loading the whole snapshot.
+
+    The content of a section is stored once per content hash in the
+    ``snapshot_section_data`` collection, so outputs that did not change
+    between sweeps are not written again; the section documents only refer
+    to it. Keyed command outputs are stored as lists of [key, record] pairs,
+    split over several documents when they are large. Snapshots saved
+    without a hash tree keep their content in the section documents.
+    """
+
+    def __init__(self, db, retention_days=30, max_snapshots=None):
+        """
+        Initialize the SnapshotStore.
+
+        Args:
+            db (Database): The MongoDB database to use.
+            retention_days (int, optional): Snapshots older than this are deleted.
+            max_snapshots (int, optional): Only this many of the newest snapshots are kept.
+        """
+        self.snapshots = db["snapshots"]
+        self.sections = db["snapshot_sections"]
+        self.section_data = db["snapshot_section_data"]
+        self.retention_days = retention_days
+        self.max_snapshots = max_snapshots
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """
+        Create the indexes used by the lookups and the retention policy.
+        """
+        self.snapshots.create_index([("snapshot_id", ASCENDING)], unique=True)
+        self.snapshots.create_index([("timestamp", DESCENDING)])
+        self.sections.create_index([("snapshot_id", ASCENDING), ("seq", ASCENDING)])
+        self.sections.create_index([("snapshot_id", ASCENDING), ("host", ASCENDING), ("command", ASCENDING)])
+        self.sections.create_index([("host", ASCENDING), ("command", ASCENDING), ("timestamp", DESCENDING)])
+        self.sections.create_index([("timestamp", DESCENDING)])
+        self.section_data.create_index([("hash", ASCENDING), ("part", ASCENDING)])
+        self.section_data.create_index([("last_seen", ASCENDING)])
+
+    def save_snapshot(self, snapshot_id, timestamp, snapshot, hashes=None, metadata=None):
+        """
+        Store a snapshot and apply the retention policy.
+
+        Section content that is already stored under the same hash is reused.
+
+        Args:
+            snapshot_id (str): Unique ID of the snapshot.
+            timestamp (datetime): Time the snapshot was taken.
+            snapshot (dict): Parsed data keyed by host and command.
+            hashes (dict, optional): Hash tree of the snapshot, see snapshot_hash.
+            metadata (dict, optional): Additional fields of the metadata document,
+                e.g. the timing summary of the sweep.
+
+        Returns:
+            int: The number of section documents written.
+        """
+        section_hashes = [
+            section_hash for _, _, _, section_hash in _iter_sections(snapshot, hashes) if section_hash is not None
+        ]
+        stored = self._reuse_section_data(section_hashes, timestamp)
+        reused = len(stored)
+        data_written = self._insert(self.section_data, _iter_data_documents(snapshot, hashes, timestamp, stored))
+        written = self._insert(self.sections, _iter_section_documents(snapshot_id, timestamp, snapshot, hashes))
+
+        # The metadata document is written last, so listed snapshots are complete
+        self.snapshots.insert_one({
+            **(metadata or {}),
+            "snapshot_id": snapshot_id,
+            "timestamp": timestamp,
+            "hash": hashes["hash"] if hashes else None,
+            "hosts": list(snapshot),
+            "sections": written,
+        })
+        print(f"Stored snapshot {snapshot_id} in {written} documents, "
+              f"{data_written} content documents written and {reused} reused")
+        self.apply_retention()
+        return written
+
+    def list_snapshots(self, limit=50):
+        """
+        Return the metadata of the newest snapshots, newest first.
+
+        Args:
+            limit (int): Maximum number of snapshots to return.
+
+        Returns:
+            list: Snapshot metadata dictionaries.
+        """
+        cursor = self.snapshots.find({}, {"_id": 0}).sort("timestamp", DESCENDING).limit(limit)
+        return list(cursor)
+
+    def latest_snapshot_ids(self, count=1):
+        """
+        Return the IDs of the newest snapshots, newest first.
+        """
+        cursor = self.snapshots.find({}, {"snapshot_id": 1}).sort("timestamp", DESCENDING).limit(count)
+        return [document["snapshot_id"] for document in cursor]
+
+    def get_metadata(self, snapshot_id):
+        """
+        Return the metadata of a snapshot, or None if it is unknown.
+        """
+        return self.snapshots.find_one({"snapshot_id": snapshot_id}, {"_id": 0})
+
+    def load_snapshot(self, snapshot_id, hosts=None, commands=None):
+        """
+        Load a snapshot, or a slice of it.
+
+        Args:
+            snapshot_id (str): ID of the snapshot.
+            hosts (list, optional): Only load these hosts.
+            commands (list, optional): Only load these commands.
+
+        Returns:
+            dict: Parsed data keyed by host and command.
+        """
+        query = {"snapshot_id": snapshot_id}
+        if hosts:
+            query["host"] = {"$in": list(hosts)}
+        if commands:
+            query["command"] = {"$in": list(commands)}
+
+        snapshot = {}
+        # Maps content hashes to the (host data, command) places of the sections stored under them
+        pending = {}
+        for document in self.sections.find(query, {"_id": 0}).sort("seq", ASCENDING):
+            host_data = snapshot.setdefault(document["host"], {})
+            if "records" in document:
+                _add_records(host_data, document["command"], document["records"])
+            elif "value" in document:
+                host_data[document["command"]] = document["value"]
+            else:
+                # Filled in from the section data below, keeps the order of the commands
+                host_data[document["command"]] = None
+                pending.setdefault(document["hash"], []).append((host_data, document["command"]))
+
+        section_hashes = list(pending)
+        for start in range(0, len(section_hashes), BULK_INSERT_SIZE):
+            cursor = self.section_data.find(
+                {"hash": {"$in": section_hashes[start:start + BULK_INSERT_SIZE]}}, {"_id": 0, "last_seen": 0}
+            ).sort([("hash", ASCENDING), ("part", ASCENDING)])
+            for document in cursor:
+                for host_data, command in pending[document["hash"]]:
+                    if "records" in document:
+                        _add_records(host_data, command, document["records"])
+                    else:
+                        host_data[command] = document["value"]
+        return snapshot
+
+    def load_section(self, snapshot_id, host, command):
+        """
+        Load the output of a single command on a single host.
+
+        Returns:
+            The parsed output, or None if the snapshot has no such section.
+        """
+        return self.load_snapshot(snapshot_id, [host], [command]).get(host, {}).get(command)
+
+    def apply_retention(self):
+        """
+        Delete the snapshots that fall outside the retention policy.
+
+        Returns:
+            int: The number of deleted snapshots.
+        """
+        expired = set()
+        if self.retention_days is not None:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+            expired.update(
+                document["snapshot_id"]
+                for document in self.snapshots.find({"timestamp": {"$lt": cutoff}}, {"snapshot_id": 1})
+            )
+            # Also catches sections of snapshots whose metadata was never written
+            self.sections.delete_many({"timestamp": {"$lt": cutoff}})
+        if self.max_snapshots is not None:
+            cursor = self.snapshots.find({}, {"snapshot_id": 1}).sort("timestamp", DESCENDING).skip(self.max_snapshots)
+            expired.update(document["snapshot_id"] for document in cursor)
+        if expired:
+            self.sections.delete_many({"snapshot_id": {"$in": list(expired)}})
+            self.snapshots.delete_many({"snapshot_id": {"$in": list(expired)}})
+            print(f"Deleted {len(expired)} expired snapshots")
+            # Section content last used by a snapshot older than the oldest kept one is unreferenced
+            oldest = self.snapshots.find_one({}, {"timestamp": 1}, sort=[("timestamp", ASCENDING)])
+            if oldest is None:
+                self.section_data.delete_many({})
+            else:
+                self.section_data.delete_many({"last_seen": {"$lt": oldest["timestamp"]}})
+        return len(expired)
+
+    def _reuse_section_data(self, section_hashes, timestamp):
+        """
+        Mark the stored content of sections as used by a snapshot.
+
+        Args:
+            section_hashes (list): Content hashes of the sections of the snapshot.
+            timestamp (datetime): Time the snapshot was taken.
+
+        Returns:
+            set: The hashes whose content is stored already.
+        """
+        section_hashes = list(dict.fromkeys(section_hashes))
+        stored = set()
+        for start in range(0, len(section_hashes), BULK_INSERT_SIZE):
+            found = [
+                document["hash"] for document in self.section_data.find(
+                    {"hash": {"$in": section_hashes[start:start + BULK_INSERT_SIZE]}, "part": 0}, {"hash": 1}
+                )
+            ]
+            if found:
+                self.section_data.update_many({"hash": {"$in": found}}, {"$max": {"last_seen": timestamp}})
+                stored.update(found)
+        return stored
+
+    @staticmethod
+    def _insert(collection, documents):
+        """Insert documents in batches of BULK_INSERT_SIZE and return how many were written."""
+        written = 0
+        documents = iter(documents)
+        while True:
+            batch = list(islice(documents, BULK_INSERT_SIZE))
+            if not batch:
+                return written
+            collection.insert_many(batch, ordered=False)
+            written += len(batch)
+
+
+def _iter_sections(snapshot, hashes):
+    """Yield the host, command, output and content hash of every section of a snapshot."""
+    host_nodes = hashes.get("children", {}) if hashes else {}
+    for host, commands in snapshot.items():
+        command_nodes = host_nodes.get(host, {}).get("children", {})
+        for command, output in commands.items():
+            yield host, command, output, command_nodes.get(command, {}).get("hash")
+
+
+def _iter_section_documents(snapshot_id, timestamp, snapshot, hashes):
+    """Yield the section documents of a snapshot, in snapshot order."""
+    seq = 0
+    for host, command, output, section_hash in _iter_sections(snapshot, hashes):
+        section = {
+            "snapshot_id": snapshot_id,
+            "timestamp": timestamp,
+            "host": host,
+            "command": command,
+            "hash": section_hash,
+            "seq": seq,
+        }
+        if section_hash is not None:
+            # The content is in the section data
+            yield section
+            seq += 1
+            continue
+        for part in _iter_content(output):
+            yield dict(section, seq=seq, **part)
+            seq += 1
+
+
+def _iter_data_documents(snapshot, hashes, timestamp, stored):
+    """
+    Yield the section data documents of the sections whose content is not stored yet.
+
+    Args:
+        snapshot (dict): Parsed data keyed by host and command.
+        hashes (dict): Hash tree of the snapshot.
+        timestamp (datetime): Time the snapshot was taken.
+        stored (set): Hashes whose content is stored; the hashes written are added.
+    """
+    for _, _, output, section_hash in _iter_sections(snapshot, hashes):
+        if section_hash is None or section_hash in stored:
+            continue
+        stored.add(section_hash)
+        for part, content in enumerate(_iter_content(output)):
+            yield dict(content, hash=section_hash, part=part, last_seen=timestamp)
+
+
+def _iter_content(output):
+    """Yield the content of a section, keyed outputs in chunks of SECTION_CHUNK_RECORDS records."""
+    if not isinstance(output, Mapping):
+        yield {"value": output}
+        return
+    items = iter(output.items())
+    records = [list(item) for item in islice(items, SECTION_CHUNK_RECORDS)]
+    while True:
+        yield {"records": records}
+        records = [list(item) for item in islice(items, SECTION_CHUNK_RECORDS)]
+        if not records:
+            break
+
+
+def _add_records(host_data, command, records):
+    output = host_data.get(command)
+    if output is None:
+        output = host_data[command] = {}
+    for key, record in records:
+        output[key] = record
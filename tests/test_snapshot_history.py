@@ -0,0 +1,189 @@
+import copy
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+
+from services.snapshot_hash import build_snapshot_hashes
+from services.snapshot_history import SnapshotHistory
+
+FIB = "inspect fib all"
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def fib_path(path, *prefixes):
+    return {"Path ID": path, "Prefixes": list(prefixes)}
+
+
+def make_snapshots():
+    """Return seven snapshots, each with a known change against its predecessor."""
+    first = {
+        host: {
+            FIB: {
+                "1": fib_path("1", f"10.{index}.1.0/24"),
+                "2": fib_path("2", f"10.{index}.2.0/24", f"10.{index}.3.0/24"),
+            },
+            "dump overview": {"general_info": {"Uptime": "1"}},
+            "show version": "version 1.0",
+        }
+        for index, host in enumerate(["router-1", "router-2"])
+    }
+    snapshots = [first]
+
+    def change(func):
+        snapshot = copy.deepcopy(snapshots[-1])
+        func(snapshot)
+        snapshots.append(snapshot)
+
+    # s1: a prefix is added to path 1 of router-1
+    change(lambda s: s["router-1"][FIB]["1"]["Prefixes"].append("10.9.0.0/24"))
+    # s2: path 2 of router-1 is removed
+    change(lambda s: s["router-1"][FIB].pop("2"))
+    # s3: router-2 is removed
+    change(lambda s: s.pop("router-2"))
+    # s4: path 3 is added to router-1
+    change(lambda s: s["router-1"][FIB].update({"3": fib_path("3", "10.9.0.0/24")}))
+    # s5: router-2 is back
+    change(lambda s: s.update({"router-2": copy.deepcopy(first["router-2"])}))
+    # s6: the prefix moves from path 1 to path 3 and the version of router-1 changes
+    def move_prefix(s):
+        s["router-1"][FIB]["1"]["Prefixes"].remove("10.9.0.0/24")
+        s["router-1"]["show version"] = "version 1.1"
+    change(move_prefix)
+    return snapshots
+
+
+SNAPSHOTS = make_snapshots()
+
+
+def timestamp(index):
+    return START + timedelta(hours=index)
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def make_history(request):
+    db = mongomock.MongoClient().db
+
+    def make(**kwargs):
+        if request.param == "memory":
+            return SnapshotHistory(**kwargs)
+        return SnapshotHistory(db["history"], changes_collection=db["history_changes"], **kwargs)
+
+    return make
+
+
+def fill(history, snapshots=SNAPSHOTS):
+    for index, snapshot in enumerate(snapshots):
+        history.append(f"s{index}", timestamp(index), snapshot, build_snapshot_hashes(snapshot))
+
+
+def summary(changes, *fields):
+    return [tuple(change[field] for field in fields) for change in changes]
+
+
+def test_entries(make_history):
+    history = make_history(base_interval=3)
+    fill(history)
+
+    entries = history.entries()
+    assert [entry["snapshot_id"] for entry in entries] == [f"s{index}" for index in range(7)]
+    assert [entry["kind"] for entry in entries] == ["base", "delta", "delta"] * 2 + ["base"]
+    assert entries[1]["timestamp"] == timestamp(1)
+
+
+def test_reconstruct_by_id(make_history):
+    history = make_history(base_interval=3)
+    fill(history)
+
+    for index, snapshot in enumerate(SNAPSHOTS):
+        assert history.reconstruct(f"s{index}") == snapshot
+    assert history.reconstruct("unknown") is None
+
+
+def test_reconstruct_by_timestamp(make_history):
+    history = make_history(base_interval=3)
+    fill(history)
+
+    for index, snapshot in enumerate(SNAPSHOTS):
+        assert history.reconstruct(timestamp=timestamp(index)) == snapshot
+        assert history.reconstruct(timestamp=timestamp(index) + timedelta(minutes=30)) == snapshot
+    assert history.reconstruct(timestamp=START - timedelta(minutes=1)) is None
+
+
+def test_reconstruct_does_not_alias_history(make_history):
+    history = make_history(base_interval=3)
+    fill(history)
+
+    history.reconstruct("s4")["router-1"][FIB].clear()
+    assert history.reconstruct("s4") == SNAPSHOTS[4]
+
+
+def test_prune_drops_whole_base_groups(make_history):
+    history = make_history(base_interval=3, max_entries=5)
+    fill(history)
+
+    assert [entry["snapshot_id"] for entry in history.entries()] == ["s3", "s4", "s5", "s6"]
+    assert history.reconstruct("s2") is None
+    for index in range(3, 7):
+        assert history.reconstruct(f"s{index}") == SNAPSHOTS[index]
+    # Changes of pruned snapshots are no longer returned
+    assert history.record_changes("router-1", FIB, "2") == []
+
+
+def test_record_changes(make_history):
+    history = make_history(base_interval=3)
+    fill(history)
+
+    assert summary(history.record_changes("router-1", FIB, "1"), "snapshot_id", "change") == [
+        ("s1", "changed"), ("s6", "changed"),
+    ]
+    assert summary(history.record_changes("router-1", FIB, "2"), "snapshot_id", "change") == [("s2", "removed")]
+    assert summary(history.record_changes("router-1", FIB, "3"), "snapshot_id", "change") == [("s4", "added")]
+    assert summary(history.record_changes("router-2", FIB, "2"), "snapshot_id", "change") == [
+        ("s3", "removed"), ("s5", "added"),
+    ]
+    assert history.record_changes("router-1", FIB, "4") == []
+    assert history.record_changes("router-1", FIB, "1")[0]["timestamp"] == timestamp(1)
+
+
+def test_item_changes(make_history):
+    history = make_history(base_interval=3)
+    fill(history)
+
+    fields = ("snapshot_id", "host", "key", "field", "change")
+    assert sorted(summary(history.item_changes("10.9.0.0/24"), *fields)) == [
+        ("s1", "router-1", "1", "Prefixes", "added"),
+        ("s4", "router-1", "3", "Prefixes", "added"),
+        ("s6", "router-1", "1", "Prefixes", "removed"),
+    ]
+    assert summary(history.item_changes("10.1.3.0/24"), *fields) == [
+        ("s3", "router-2", "2", "Prefixes", "removed"),
+        ("s5", "router-2", "2", "Prefixes", "added"),
+    ]
+    assert history.item_changes("10.1.3.0/24", host="router-1") == []
+    assert summary(history.item_changes("10.0.3.0/24", host="router-1"), "snapshot_id", "change") == [
+        ("s2", "removed"),
+    ]
+    # The first snapshot of a history has no changes
+    assert history.item_changes("10.0.1.0/24") == []
+
+
+def test_load_then_append():
+    db = mongomock.MongoClient().db
+    history = SnapshotHistory(db["history"], base_interval=3, changes_collection=db["history_changes"])
+    fill(history, SNAPSHOTS[:5])
+
+    loaded = SnapshotHistory(db["history"], base_interval=3, changes_collection=db["history_changes"])
+    loaded.load()
+    assert loaded.entries() == history.entries()
+    assert loaded.reconstruct("s4") == SNAPSHOTS[4]
+
+    # The loaded history continues from its latest snapshot
+    for index in (5, 6):
+        loaded.append(f"s{index}", timestamp(index), SNAPSHOTS[index], build_snapshot_hashes(SNAPSHOTS[index]))
+    assert [entry["kind"] for entry in loaded.entries()] == ["base", "delta", "delta"] * 2 + ["base"]
+    for index, snapshot in enumerate(SNAPSHOTS):
+        assert loaded.reconstruct(f"s{index}") == snapshot
+    assert summary(loaded.record_changes("router-2", FIB, "2"), "snapshot_id", "change") == [
+        ("s3", "removed"), ("s5", "added"),
+    ]
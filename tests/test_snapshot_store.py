@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+
+from services import snapshot_store
+from services.snapshot_hash import build_snapshot_hashes
+from services.snapshot_store import SnapshotStore
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def make_snapshot(records=10, uptime="1"):
+    return {
+        host: {
+            "inspect fib all": {
+                str(path): {"Path ID": str(path), "Prefixes": [f"10.{index}.{path}.0/24"]} for path in range(records)
+            },
+            "dump overview": {"general_info": {"Uptime": uptime}},
+            "show version": "version 1.0",
+        }
+        for index, host in enumerate(["router-1", "router-2"])
+    }
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def store(db):
+    return SnapshotStore(db, retention_days=None)
+
+
+@pytest.mark.parametrize("with_hashes", [True, False])
+def test_round_trip(store, with_hashes):
+    snapshot = make_snapshot()
+    hashes = build_snapshot_hashes(snapshot) if with_hashes else None
+    store.save_snapshot("s1", NOW, snapshot, hashes, metadata={"duration": 1.5})
+
+    loaded = store.load_snapshot("s1")
+    assert loaded == snapshot
+    assert list(loaded) == list(snapshot)
+    assert list(loaded["router-1"]) == list(snapshot["router-1"])
+    assert list(loaded["router-1"]["inspect fib all"]) == list(snapshot["router-1"]["inspect fib all"])
+    metadata = store.get_metadata("s1")
+    assert metadata["hosts"] == ["router-1", "router-2"]
+    assert metadata["duration"] == 1.5
+    assert metadata["hash"] == (hashes["hash"] if hashes else None)
+    assert store.load_snapshot("unknown") == {}
+
+
+@pytest.mark.parametrize("with_hashes", [True, False])
+def test_large_sections_are_chunked(store, monkeypatch, with_hashes):
+    monkeypatch.setattr(snapshot_store, "SECTION_CHUNK_RECORDS", 3)
+    snapshot = make_snapshot(records=10)
+    hashes = build_snapshot_hashes(snapshot) if with_hashes else None
+    store.save_snapshot("s1", NOW, snapshot, hashes)
+
+    # 10 records are stored in 4 chunks per host, the other two commands in one document each
+    collection = store.section_data if with_hashes else store.sections
+    fib_hash = hashes["children"]["router-1"]["children"]["inspect fib all"]["hash"] if with_hashes else None
+    query = {"hash": fib_hash} if with_hashes else {"host": "router-1", "command": "inspect fib all"}
+    chunks = list(collection.find(query))
+    assert [len(chunk["records"]) for chunk in chunks] == [3, 3, 3, 1]
+    assert store.load_snapshot("s1") == snapshot
+
+
+def test_load_slices(store):
+    snapshot = make_snapshot()
+    store.save_snapshot("s1", NOW, snapshot, build_snapshot_hashes(snapshot))
+
+    assert store.load_snapshot("s1", hosts=["router-2"]) == {"router-2": snapshot["router-2"]}
+    assert store.load_snapshot("s1", commands=["show version"]) == {
+        host: {"show version": "version 1.0"} for host in snapshot
+    }
+    assert store.load_snapshot("s1", hosts=["router-1"], commands=["inspect fib all", "dump overview"]) == {
+        "router-1": {
+            "inspect fib all": snapshot["router-1"]["inspect fib all"],
+            "dump overview": snapshot["router-1"]["dump overview"],
+        }
+    }
+    assert store.load_section("s1", "router-1", "dump overview") == snapshot["router-1"]["dump overview"]
+    assert store.load_section("s1", "router-3", "dump overview") is None
+    assert store.load_section("s1", "router-1", "unknown") is None
+
+
+def test_unchanged_sections_are_stored_once(store):
+    first = make_snapshot()
+    second = make_snapshot(uptime="2")
+    store.save_snapshot("s1", NOW - timedelta(hours=1), first, build_snapshot_hashes(first))
+    stored = store.section_data.count_documents({})
+    store.save_snapshot("s2", NOW, second, build_snapshot_hashes(second))
+
+    # Only the changed overview is written again, it is the same on both hosts
+    assert store.section_data.count_documents({}) == stored + 1
+    assert store.load_snapshot("s1") == first
+    assert store.load_snapshot("s2") == second
+    assert store.latest_snapshot_ids(2) == ["s2", "s1"]
+
+
+def test_retention_by_count(db):
+    store = SnapshotStore(db, retention_days=None, max_snapshots=2)
+    snapshots = [make_snapshot(uptime=str(index)) for index in range(4)]
+    for index, snapshot in enumerate(snapshots):
+        store.save_snapshot(f"s{index}", NOW + timedelta(hours=index), snapshot, build_snapshot_hashes(snapshot))
+
+    assert [metadata["snapshot_id"] for metadata in store.list_snapshots()] == ["s3", "s2"]
+    assert store.load_snapshot("s0") == {}
+    assert store.sections.count_documents({"snapshot_id": {"$in": ["s0", "s1"]}}) == 0
+    assert store.load_snapshot("s2") == snapshots[2]
+    assert store.load_snapshot("s3") == snapshots[3]
+    # Two FIB outputs, one version and the overviews of the kept snapshots, the older overviews are deleted
+    assert store.section_data.count_documents({}) == 5
+
+
+def test_retention_by_age(db):
+    store = SnapshotStore(db, retention_days=30)
+    old = make_snapshot(uptime="old")
+    new = make_snapshot(uptime="new")
+    store.save_snapshot("old", NOW - timedelta(days=31), old, build_snapshot_hashes(old))
+    store.save_snapshot("new", NOW, new, build_snapshot_hashes(new))
+
+    assert store.latest_snapshot_ids(5) == ["new"]
+    assert store.sections.count_documents({"snapshot_id": "old"}) == 0
+    assert store.load_snapshot("new") == new
+    assert store.apply_retention() == 0
+
+
+def test_retention_deletes_all_content(db):
+    store = SnapshotStore(db, retention_days=30)
+    snapshot = make_snapshot()
+    store.save_snapshot("old", NOW - timedelta(days=31), snapshot, build_snapshot_hashes(snapshot))
+
+    assert store.list_snapshots() == []
+    assert store.sections.count_documents({}) == 0
+    assert store.section_data.count_documents({}) == 0